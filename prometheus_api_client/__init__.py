@@ -8,16 +8,40 @@ def __getattr__(name):
     if name == "PrometheusConnect":
         from .prometheus_connect import PrometheusConnect
         return PrometheusConnect
+    elif name == "AsyncPrometheusConnect":
+        from .async_prometheus_connect import AsyncPrometheusConnect
+        return AsyncPrometheusConnect
     elif name == "Metric":
         from .metric import Metric
         return Metric
-    elif name == "MetricsList":
-        from .metrics_list import MetricsList
-        return MetricsList
+    elif name in ("MetricsList", "LazyMetricsList"):
+        from . import metrics_list
+        return getattr(metrics_list, name)
     elif name == "MetricSnapshotDataFrame":
         from .metric_snapshot_df import MetricSnapshotDataFrame
         return MetricSnapshotDataFrame
     elif name == "MetricRangeDataFrame":
         from .metric_range_df import MetricRangeDataFrame
         return MetricRangeDataFrame
+    elif name in ("ResponseCache", "MemoryCache", "DiskCache"):
+        from . import cache
+        return getattr(cache, name)
+    elif name == "RangeResultsCache":
+        from .results_cache import RangeResultsCache
+        return RangeResultsCache
+    elif name in ("RequestInfo", "RequestStats"):
+        from . import instrumentation
+        return getattr(instrumentation, name)
+    elif name in ("StreamingAggregator", "TDigest"):
+        from . import aggregation
+        return getattr(aggregation, name)
+    elif name == "AdaptiveChunkSize":
+        from .chunking import AdaptiveChunkSize
+        return AdaptiveChunkSize
+    elif name == "MetricTail":
+        from .tail import MetricTail
+        return MetricTail
+    elif name == "LabelIndex":
+        from .label_index import LabelIndex
+        return LabelIndex
     raise AttributeError(f"module {__name__} has no attribute {name}")
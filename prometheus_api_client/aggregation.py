@@ -0,0 +1,414 @@
+"""Streaming, mergeable aggregation of the sample values of query results."""
+import math
+from typing import List, Optional
+
+try:
+    import numpy
+except ImportError as e:
+    raise ImportError(
+        "NumPy is required for metric aggregation operations. "
+        "Please install it with: pip install prometheus-api-client[analytics] "
+        "or pip install prometheus-api-client[all]"
+    ) from e
+
+from .samples import decode_values
+
+#: the operations of `StreamingAggregator.result`, besides "percentile_<n>"
+OPERATIONS = ("sum", "max", "min", "count", "average", "variance", "deviation")
+
+
+class TDigest:
+    r"""
+    A t-digest, a mergeable sketch of a distribution answering quantile queries.
+
+    Values are kept exactly until there are more than ``exact_limit`` of them, quantiles are
+    then exact and match ``numpy.percentile``. Past that, the values are compressed into at
+    most about ``compression / 2`` centroids, which are smaller close to the tails, so extreme
+    quantiles such as the p99 stay accurate. Memory is bounded by ``exact_limit`` values and
+    the centroids, whatever the number of values added.
+
+    A centroid spans at most ``2 pi sqrt(q (1 - q)) / compression`` of the ranks around the
+    quantile ``q``, which bounds the rank error of the estimates: the estimated ``q`` quantile
+    lies between the exact quantiles at ``q`` plus or minus that. With the default compression
+    it is 1.6% of the values at the median, 0.3% at the p99 and 0.1% at the p99.9, and the
+    observed errors are usually ten times smaller. The error of the quantile value depends on
+    the spread of the values around it.
+
+    :param compression: (float) The accuracy of the sketch, higher is more accurate and uses
+        more centroids. Default is 200.
+    :param exact_limit: (int) Number of values buffered before they are compressed, None
+        never compresses them. Default is 10000.
+    """
+
+    def __init__(self, compression: float = 200, exact_limit: Optional[int] = 10000):
+        """Functions as a Constructor for the TDigest object."""
+        if compression <= 0:
+            raise ValueError("compression must be positive")
+        self.compression = compression
+        self.exact_limit = exact_limit
+        self.count = 0
+        self._means = numpy.empty(0)
+        self._weights = numpy.empty(0)
+        # the arrays of values not compressed yet, with their weights, or None for single values
+        self._buffer: List[tuple] = []
+        self._buffered = 0
+        self._exact = True
+        self._min = math.inf
+        self._max = -math.inf
+
+    def update(self, values) -> None:
+        """Add the values of an array, which must not hold NaNs."""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if len(values) == 0:
+            return
+        self._buffer.append((values, None))
+        self._buffered += len(values)
+        self.count += len(values)
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+        if self.exact_limit is not None and self._buffered > self.exact_limit:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> None:
+        """Add the values of another digest, for example one filled from another thread."""
+        if other.count == 0:
+            return
+        self._buffer.extend(other._buffer)
+        if len(other._means):
+            self._buffer.append((other._means, other._weights))
+        self._buffered += other._buffered + len(other._means)
+        self.count += other.count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        self._exact = self._exact and other._exact
+        if self.exact_limit is not None and self._buffered > self.exact_limit:
+            self._compress()
+
+    def quantile(self, q: float) -> float:
+        """
+        Return the estimated ``q`` quantile of the values.
+
+        :param q: (float) The quantile, between 0 and 1
+        :returns: (float) The quantile, NaN if no value was added
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0:
+            return math.nan
+        if self._exact:
+            if len(self._buffer) > 1:
+                self._buffer = [(numpy.concatenate([values for values, _ in self._buffer]), None)]
+            return float(numpy.quantile(self._buffer[0][0], q))
+        self._compress()
+        means, weights = self._means, self._weights
+        # interpolate between the centers of the centroids, by rank; the ranks are shifted so
+        # that centroids of single values give the same quantiles as numpy, and the minimum
+        # and maximum are the centers of the first and last value
+        centers = numpy.cumsum(weights) - weights / 2
+        rank = q * (self.count - 1) + 0.5
+        return float(
+            numpy.interp(
+                rank,
+                numpy.concatenate(([0.5], centers, [self.count - 0.5])),
+                numpy.concatenate(([self._min], means, [self._max])),
+            )
+        )
+
+    def _compress(self) -> None:
+        """Merge the buffered values and the centroids into new centroids."""
+        if not self._buffer:
+            return
+        mean_arrays = [self._means] + [values for values, _ in self._buffer]
+        weight_arrays = [self._weights] + [
+            numpy.ones(len(values)) if value_weights is None else value_weights
+            for values, value_weights in self._buffer
+        ]
+        means = numpy.concatenate(mean_arrays)
+        weights = numpy.concatenate(weight_arrays)
+        order = numpy.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+
+        # the k1 scale function maps the quantile of the left edge of every value to
+        # k = compression / (2 pi) * asin(2q - 1), a centroid covers at most one unit of k
+        cumulative = numpy.cumsum(weights)
+        left = (cumulative - weights) / cumulative[-1]
+        k = self.compression / (2 * math.pi) * numpy.arcsin(2 * left - 1)
+        clusters = numpy.floor(k - k[0])
+        starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(clusters)) + 1))
+        self._weights = numpy.add.reduceat(weights, starts)
+        self._means = numpy.add.reduceat(means * weights, starts) / self._weights
+        self._buffer = []
+        self._buffered = 0
+        self._exact = False
+
+
+class StreamingAggregator:
+    r"""
+    Aggregate the sample values of query results, one result at a time.
+
+    The count, sum, minimum and maximum are kept as running values, the mean and variance
+    with Welford's algorithm (combined per array), and the percentiles with a `TDigest`.
+    Memory stays constant whatever the number of samples, so the results of a chunked
+    range query can be aggregated as they arrive, and aggregators filled in parallel can
+    be merged.
+
+    If any sample is NaN, all the aggregations except the count are NaN, like with numpy.
+
+    :param percentiles: (bool) Keep the quantile sketch for the "percentile_<n>" operations.
+        Default is True.
+    :param compression: (float) The accuracy of the quantile sketch, see `TDigest`.
+    :param exact_limit: (int) Number of values for which the percentiles are exact,
+        see `TDigest`. None keeps all the values, and the percentiles exact.
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect()
+          aggregator = StreamingAggregator()
+          for chunk in prom.iter_query_range('node_load1', start_time, end_time, step='15'):
+              aggregator.update_result(chunk)
+          print(aggregator.result(['sum', 'max', 'percentile_99']))
+    """
+
+    def __init__(
+        self, percentiles: bool = True, compression: float = 200, exact_limit: Optional[int] = 10000
+    ):
+        """Functions as a Constructor for the StreamingAggregator object."""
+        self.count = 0
+        self.nan_count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.digest = TDigest(compression, exact_limit) if percentiles else None
+
+    def update(self, values) -> None:
+        """Add the values of an array of samples."""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        nans = numpy.isnan(values)
+        if nans.any():
+            self.nan_count += int(nans.sum())
+            values = values[~nans]
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self._combine(len(values), float(values.sum()), mean, float(((values - mean) ** 2).sum()))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self.digest is not None:
+            self.digest.update(values)
+
+    def update_result(self, data: list) -> None:
+        """Add the samples of a matrix or vector result, such as one chunk of a range query."""
+        values, _ = decode_values(data)
+        self.update(values)
+
+    def merge(self, other: "StreamingAggregator") -> None:
+        """Add the samples aggregated by another aggregator."""
+        self.nan_count += other.nan_count
+        if other.count == 0:
+            return
+        self._combine(other.count, other.sum, other.mean, other._m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.digest is not None and other.digest is not None:
+            self.digest.merge(other.digest)
+
+    def _combine(self, count: int, total: float, mean: float, m2: float) -> None:
+        """Combine the running mean and variance with those of ``count`` more values."""
+        new_count = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / new_count
+        self._m2 += m2 + delta * delta * self.count * count / new_count
+        self.count = new_count
+        self.sum += total
+
+    def result(self, operations: list) -> Optional[dict]:
+        """
+        Return the aggregations of the samples added so far.
+
+        :param operations: (list) Operations among sum, max, min, count, average, variance,
+            deviation and percentile_<n>, where n is between 0 and 100
+        :returns: (dict) The value of each operation, percentiles are keyed like
+            "percentile_99.0". None if no sample was added.
+        :raises: (TypeError) Raises if an operation is invalid
+        """
+        if self.count + self.nan_count == 0:
+            return None
+        aggregated_values: dict = {}
+        for operation in operations:
+            if operation == "count":
+                aggregated_values["count"] = self.count + self.nan_count
+            elif operation.startswith("percentile"):
+                if self.digest is None:
+                    raise TypeError("Percentiles are not kept by this aggregator: " + operation)
+                percentile = float(operation.split("_")[1])
+                aggregated_values["percentile_" + str(percentile)] = (
+                    math.nan if self.nan_count else self.digest.quantile(percentile / 100)
+                )
+            elif operation in OPERATIONS:
+                aggregated_values[operation] = (
+                    math.nan if self.nan_count else self._value(operation)
+                )
+            else:
+                raise TypeError("Invalid operation: " + operation)
+        return aggregated_values
+
+    def _value(self, operation: str) -> float:
+        if operation == "sum":
+            return self.sum
+        if operation == "max":
+            return self.max
+        if operation == "min":
+            return self.min
+        if operation == "average":
+            return self.mean
+        if operation == "variance":
+            return self._m2 / self.count
+        return math.sqrt(self._m2 / self.count)
+
+
+def aggregate_groups(values, groups, group_count: int, operations: list) -> dict:
+    """
+    Compute aggregation operations over groups of values in one vectorized pass.
+
+    The values are ordered by group once, and every operation is then reduced over the
+    segment of each group. Percentiles are exact and match ``numpy.percentile``. Groups
+    holding a NaN have NaN results, except for the count.
+
+    :param values: (numpy.ndarray) The sample values
+    :param groups: (numpy.ndarray) The group number of each value, from 0 to
+        ``group_count - 1``
+    :param group_count: (int) The number of groups
+    :param operations: (list) Operations among sum, max, min, count, average, variance,
+        deviation and percentile_<n>
+    :returns: (dict) An array with the value of every group for each operation, keyed like
+        the result of `StreamingAggregator.result`
+    :raises: (TypeError) Raises if an operation is invalid
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    groups = numpy.asarray(groups, dtype=numpy.int64)
+    # numpy sorts 16-bit integers with a radix sort, much faster than the default
+    sort_groups = groups.astype(numpy.uint16) if group_count <= 1 << 16 else groups
+    if any(operation.startswith("percentile") for operation in operations):
+        # sorted by value within each group, for the percentiles: sort by value, then by
+        # group with a stable sort, which is faster than numpy.lexsort
+        by_value = numpy.argsort(values)
+        order = by_value[numpy.argsort(sort_groups[by_value], kind="stable")]
+    else:
+        order = numpy.argsort(sort_groups, kind="stable")
+    values, groups = values[order], groups[order]
+
+    counts = numpy.bincount(groups, minlength=group_count)
+    present = numpy.flatnonzero(counts)
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))[present]
+    counts_present = counts[present]
+    has_nan = numpy.bincount(groups, weights=numpy.isnan(values), minlength=group_count) > 0
+
+    def per_group(reduced):
+        result = numpy.full(group_count, numpy.nan)
+        result[present] = reduced
+        result[has_nan] = numpy.nan
+        return result
+
+    sums = numpy.add.reduceat(values, starts) if len(values) else numpy.empty(0)
+    means = sums / counts_present
+    aggregated_values = {}
+    for operation in operations:
+        if operation == "count":
+            aggregated_values["count"] = counts
+        elif operation == "sum":
+            aggregated_values["sum"] = per_group(sums)
+        elif operation == "average":
+            aggregated_values["average"] = per_group(means)
+        elif operation in ("max", "min"):
+            reduce = numpy.maximum if operation == "max" else numpy.minimum
+            aggregated_values[operation] = per_group(reduce.reduceat(values, starts))
+        elif operation in ("variance", "deviation"):
+            squares = (values - numpy.repeat(means, counts_present)) ** 2
+            variances = numpy.add.reduceat(squares, starts) / counts_present
+            aggregated_values[operation] = per_group(
+                variances if operation == "variance" else numpy.sqrt(variances)
+            )
+        elif operation.startswith("percentile"):
+            percentile = float(operation.split("_")[1])
+            if not 0 <= percentile <= 100:
+                raise ValueError("Percentiles must be in the range [0, 100]")
+            # linear interpolation between the closest ranks, like numpy.percentile
+            rank = percentile / 100 * (counts_present - 1)
+            lower = numpy.floor(rank).astype(numpy.int64)
+            upper = numpy.minimum(lower + 1, counts_present - 1)
+            low, high = values[starts + lower], values[starts + upper]
+            aggregated_values["percentile_" + str(percentile)] = per_group(
+                low + (high - low) * (rank - lower)
+            )
+        else:
+            raise TypeError("Invalid operation: " + operation)
+    return aggregated_values
+
+
+def aggregate_by(results, by, operations: list):
+    """
+    Aggregate the samples of query results per group of series.
+
+    :param results: (iterable) Matrix or vector results, for example the sub-ranges of a
+        range query, a series can appear in several of them
+    :param by: (list|str) The names of the labels grouping the series, like the ``by``
+        clause of a PromQL aggregation, a missing label is NaN in the index, like in
+        `MetricRangeDataFrame`. "series" aggregates every series on its own.
+    :param operations: (list) Operations among sum, max, min, count, average, variance,
+        deviation and percentile_<n>
+    :returns: (DataFrame) A DataFrame with one row per group, indexed by the grouping labels,
+        and one column per operation, or None if the results hold no sample
+    :raises: (TypeError) Raises if an operation is invalid
+    """
+    try:
+        import pandas
+    except ImportError as e:
+        raise ImportError(
+            "Pandas is required to aggregate metric values by label. "
+            "Please install it with: pip install prometheus-api-client[dataframe] "
+            "or pip install prometheus-api-client[all]"
+        ) from e
+
+    per_series = isinstance(by, str) and by == "series"
+    if not per_series and not isinstance(by, (list, tuple)):
+        raise TypeError("by can only be a list of label names or 'series'")
+
+    group_numbers: dict = {}
+    value_arrays, group_arrays = [], []
+    for data in results:
+        values, offsets = decode_values(data)
+        series_groups = [
+            group_numbers.setdefault(
+                frozenset(series["metric"].items())
+                if per_series
+                else tuple(series["metric"].get(label) for label in by),
+                len(group_numbers),
+            )
+            for series in data
+        ]
+        value_arrays.append(values)
+        group_arrays.append(numpy.repeat(series_groups, numpy.diff(offsets)))
+
+    values = numpy.concatenate(value_arrays) if value_arrays else numpy.empty(0)
+    if len(values) == 0:
+        return None
+    # groups of series without samples are left out
+    groups = numpy.concatenate(group_arrays).astype(numpy.int64)
+    aggregated_values = aggregate_groups(values, groups, len(group_numbers), operations)
+    keys = list(group_numbers)
+    if per_series:
+        label_sets = [dict(key) for key in keys]
+        names = sorted(set().union(*label_sets))
+        keys = [tuple(labels.get(name) for name in names) for labels in label_sets]
+    else:
+        names = list(by)
+
+    df = pandas.DataFrame(aggregated_values, columns=list(aggregated_values))
+    if len(names) == 1:
+        df.index = pandas.Index([key[0] for key in keys], name=names[0])
+    elif names:
+        df.index = pandas.MultiIndex.from_tuples(keys, names=names)
+    return df[numpy.bincount(groups, minlength=len(keys)) > 0]
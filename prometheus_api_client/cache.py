@@ -0,0 +1,283 @@
+"""Response caches for the query endpoints of PrometheusConnect."""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+# default time to live (in seconds) of cached responses per API endpoint
+DEFAULT_TTL = {
+    "query": 30,
+    "query_range": 60,
+    "series": 300,
+    "labels": 300,
+    "label_values": 300,
+}
+
+
+def client_identity(headers: dict = None, auth=None) -> str:
+    """
+    Return a digest of the headers and auth sent by a client, for cache keys.
+
+    Clients sending different tenant headers (such as X-Scope-OrgID), tokens or auth get
+    different digests. The credentials themselves are not kept in the keys. An auth object
+    other than a tuple is told apart by its ``repr``, which is usually unique to the object.
+
+    :param headers: (dict) The headers sent with every request
+    :param auth: (tuple|object) The auth of the requests
+    :returns: (str) A hex digest, or an empty string without headers and auth
+    """
+    if not headers and auth is None:
+        return ""
+    normalized = json.dumps(
+        [sorted((str(k).lower(), str(v)) for k, v in (headers or {}).items()), repr(auth)],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(ABC):
+    r"""
+    Base Class for the response caches of `PrometheusConnect`.
+
+    Responses are keyed by the prometheus url, the API endpoint, the normalized request
+    parameters and a digest of the headers and auth of the client, see `client_identity`,
+    so clients of different tenants or credentials can share a cache without getting each
+    other's responses. Each endpoint has its own time to live, and endpoints without one are not
+    cached. Responses for a time range that ended more than ``immutable_after`` ago cannot
+    change anymore, so they never expire and are only evicted to respect the size bound.
+
+    Cached responses are shared between cache hits, they must not be modified in place.
+
+    Subclasses implement `_get`, `_set` and `clear`, the class cannot be instantiated
+    otherwise.
+
+    :param ttl: (dict) Time to live (in seconds) of the responses of each endpoint, merged
+        into ``DEFAULT_TTL``. Endpoints are "query", "query_range", "series", "labels" and
+        "label_values". A ttl of 0 disables caching for the endpoint.
+    :param immutable_after: (timedelta) Age after which the end of a query range (or the
+        evaluation time of an instant query) is treated as immutable. Default is 10 minutes.
+    """
+
+    def __init__(self, ttl: dict = None, immutable_after: timedelta = timedelta(minutes=10)):
+        """Functions as a Constructor for the ResponseCache object."""
+        if not isinstance(immutable_after, timedelta):
+            raise TypeError("immutable_after can only be of type datetime.timedelta")
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.immutable_after = immutable_after
+
+    def is_cacheable(self, endpoint: str) -> bool:
+        """Return True if responses of ``endpoint`` are cached."""
+        return bool(self.ttl.get(endpoint))
+
+    def make_key(self, url: str, path: str, params: Optional[dict], identity: str = "") -> str:
+        """
+        Build the cache key of a request from the host url, API path and normalized params.
+
+        :param identity: (str) Digest of the headers and auth of the client sending the
+            request, from `client_identity`
+        """
+        normalized = json.dumps(
+            sorted((str(k), str(v)) for k, v in (params or {}).items()), separators=(",", ":")
+        )
+        return "{0}|{1}|{2}|{3}".format(url, identity, path, normalized)
+
+    def ttl_for(self, endpoint: str, params: Optional[dict]):
+        """
+        Return the time to live (in seconds) of a response.
+
+        :returns: (float|None) The ttl of ``endpoint``, or None if the response covers a
+            time range that is fully in the past and never expires
+        """
+        params = params or {}
+        end = params.get("end", params.get("time"))
+        if end is not None:
+            try:
+                end = float(end)
+            except (TypeError, ValueError):
+                end = None
+        if end is not None and end <= time.time() - self.immutable_after.total_seconds():
+            return None
+        return self.ttl[endpoint]
+
+    def get(self, key: str):
+        """
+        Return the cached response for ``key``.
+
+        :returns: (tuple) ``(True, response)`` on a hit, ``(False, None)`` on a miss
+        """
+        return self._get(key)
+
+    def set(self, key: str, value, ttl=None) -> None:
+        """
+        Cache ``value`` under ``key``.
+
+        :param ttl: (float|None) Time to live in seconds, None never expires
+        """
+        expires = None if ttl is None else time.time() + ttl
+        self._set(key, value, expires)
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every cached response."""
+
+    @abstractmethod
+    def _get(self, key: str):
+        """Return ``(True, response)`` for a live entry of ``key``, ``(False, None)`` otherwise."""
+
+    @abstractmethod
+    def _set(self, key: str, value, expires) -> None:
+        """Store ``value`` under ``key`` until the unix time ``expires``, None never expires."""
+
+
+class MemoryCache(ResponseCache):
+    r"""
+    An in-memory LRU `ResponseCache`.
+
+    :param max_entries: (int) Maximum number of cached responses. The least recently used
+        response is evicted when the cache is full. Default is 1024.
+    :param ttl: (dict) Time to live (in seconds) of the responses of each endpoint
+    :param immutable_after: (timedelta) Age after which a time range is treated as immutable
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect(cache=MemoryCache(max_entries=256, ttl={"query": 10}))
+    """
+
+    def __init__(self, max_entries: int = 1024, **kwargs):
+        """Functions as a Constructor for the MemoryCache object."""
+        super().__init__(**kwargs)
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of cached responses, including expired ones."""
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def _set(self, key: str, value, expires) -> None:
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DiskCache(ResponseCache):
+    r"""
+    An on-disk `ResponseCache` storing one JSON file per response.
+
+    Files are written atomically, so a cache directory can be shared between processes.
+    When there are more than ``max_entries`` files, the least recently used ones are removed.
+
+    :param directory: (str) Directory holding the cached responses, created if missing
+    :param max_entries: (int) Maximum number of cached responses. Default is 4096.
+    :param ttl: (dict) Time to live (in seconds) of the responses of each endpoint
+    :param immutable_after: (timedelta) Age after which a time range is treated as immutable
+    """
+
+    def __init__(self, directory: str, max_entries: int = 4096, **kwargs):
+        """Functions as a Constructor for the DiskCache object."""
+        super().__init__(**kwargs)
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def _files(self):
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".json")
+        ]
+
+    def __len__(self):
+        """Return the number of cached responses, including expired ones."""
+        return len(self._files())
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+        with self._lock:
+            for path in self._files():
+                _remove(path)
+
+    def _get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return False, None
+        if entry["key"] != key:
+            return False, None
+        if entry["expires"] is not None and entry["expires"] <= time.time():
+            _remove(path)
+            return False, None
+        # the modification time records the last use, for the LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True, entry["value"]
+
+    def _set(self, key: str, value, expires) -> None:
+        payload = json.dumps({"key": key, "expires": expires, "value": value})
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as tmp_file:
+                tmp_file.write(payload)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+
+    def _evict(self) -> None:
+        files = self._files()
+        if len(files) <= self.max_entries:
+            return
+        mtimes = []
+        for path in files:
+            try:
+                mtimes.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        mtimes.sort()
+        for _, path in mtimes[: len(mtimes) - self.max_entries]:
+            _remove(path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
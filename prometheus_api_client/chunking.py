@@ -0,0 +1,189 @@
+"""Adaptive chunk sizing for downloading long ranges of raw metric data."""
+import re
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Optional
+
+import requests
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+from requests.packages.urllib3.util.retry import Retry
+
+from .exceptions import PrometheusApiClientException
+
+# a chunk holding more samples than this is shrunk, the default query.max-samples of
+# Prometheus is 50 times as much
+DEFAULT_TARGET_SAMPLES = 1000000
+# a chunk taking longer than this many seconds to download is shrunk
+DEFAULT_TARGET_DURATION = 10.0
+# HTTP status codes of the responses to queries that load too many samples or time out
+SHRINK_ON_STATUS = (422, 503, 504)
+
+# the requests of the current thread that are answered with SHRINK_ON_STATUS are not retried
+_shrinking = threading.local()
+
+
+class AdaptiveChunkSize:
+    r"""
+    A chunk size policy for `PrometheusConnect.get_metric_range_data` adapting to the data.
+
+    Instead of a fixed duration, every chunk is sized from the previous one: its duration is
+    scaled so that the next chunk holds about ``target_samples`` samples and downloads in
+    about ``target_duration`` seconds, growing by at most ``growth`` at a time. A chunk
+    failing because it loads too many samples or times out (HTTP status 422, 503 or 504,
+    or a read timeout) is retried with half its duration, down to ``min_chunk_size``, and
+    the following chunks do not grow past that duration anymore. With the default retry of
+    `PrometheusConnect`, such a chunk is shrunk on its first failed response instead of being
+    retried with backoff first.
+
+    The duration of every chunk request is reported as the ``chunk_seconds`` of its
+    `RequestInfo`, failed attempts included.
+
+    :param target_samples: (int) Number of samples aimed at in one chunk.
+        Default is ``DEFAULT_TARGET_SAMPLES``.
+    :param target_duration: (float) Number of seconds aimed at to download one chunk.
+        Default is ``DEFAULT_TARGET_DURATION``.
+    :param initial_chunk_size: (timedelta) Duration of the first chunk. Default is an hour.
+    :param min_chunk_size: (timedelta) Smallest duration of a chunk, a chunk of this duration
+        is not shrunk any further and its error is raised. Default is a minute.
+    :param max_chunk_size: (timedelta) Optional largest duration of a chunk.
+    :param growth: (float) Largest factor between the durations of two consecutive chunks.
+        Default is 2.
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect(hooks=[stats])
+          metric_data = prom.get_metric_range_data(
+              "up",
+              start_time=parse_datetime("30d"),
+              end_time=parse_datetime("now"),
+              chunk_size=AdaptiveChunkSize(target_samples=500000),
+          )
+          [info.chunk_seconds for info in stats.records]  # the chosen chunk durations
+    """
+
+    def __init__(
+        self,
+        target_samples: int = DEFAULT_TARGET_SAMPLES,
+        target_duration: float = DEFAULT_TARGET_DURATION,
+        initial_chunk_size: timedelta = timedelta(hours=1),
+        min_chunk_size: timedelta = timedelta(minutes=1),
+        max_chunk_size: timedelta = None,
+        growth: float = 2.0,
+    ):
+        """Functions as a Constructor for the AdaptiveChunkSize object."""
+        for name, size in (
+            ("initial_chunk_size", initial_chunk_size),
+            ("min_chunk_size", min_chunk_size),
+            ("max_chunk_size", max_chunk_size),
+        ):
+            if size is not None and not isinstance(size, timedelta):
+                raise TypeError("{} can only be of type datetime.timedelta".format(name))
+        if target_samples < 1:
+            raise ValueError("target_samples must be a positive integer")
+        if target_duration <= 0:
+            raise ValueError("target_duration must be positive")
+        if growth <= 1:
+            raise ValueError("growth must be greater than 1")
+
+        self.target_samples = target_samples
+        self.target_duration = target_duration
+        self.growth = growth
+        self.min_seconds = max(1, round(min_chunk_size.total_seconds()))
+        self.max_seconds = (
+            None if max_chunk_size is None else round(max_chunk_size.total_seconds())
+        )
+        if self.max_seconds is not None and self.max_seconds < self.min_seconds:
+            raise ValueError("max_chunk_size must not be smaller than min_chunk_size")
+        self.initial_seconds = self._clip(initial_chunk_size.total_seconds())
+
+    def __repr__(self):
+        """Make object representation to be shown in the console."""
+        return "AdaptiveChunkSize(target_samples={!r}, target_duration={!r})".format(
+            self.target_samples, self.target_duration
+        )
+
+    def next_seconds(self, seconds: int, samples: int, duration: float) -> int:
+        """
+        Return the duration of the chunk following a downloaded one.
+
+        :param seconds: (int) Duration of the downloaded chunk, in seconds
+        :param samples: (int) Number of samples in the downloaded chunk
+        :param duration: (float) Number of seconds the download took
+        :returns: (int) Duration of the next chunk, in seconds
+        """
+        candidates = [seconds * self.growth]
+        if samples:
+            candidates.append(seconds * self.target_samples / samples)
+        if duration:
+            candidates.append(seconds * self.target_duration / duration)
+        return self._clip(min(candidates))
+
+    def shrunk_seconds(self, seconds: int):
+        """
+        Return the duration to retry a failed chunk with.
+
+        :param seconds: (int) Duration of the failed chunk, in seconds
+        :returns: (int) Half of ``seconds``, or None if the chunk cannot be shrunk any further
+        """
+        if seconds <= self.min_seconds:
+            return None
+        return max(self.min_seconds, seconds // 2)
+
+    def _clip(self, seconds: float) -> int:
+        """Round ``seconds`` and clip it to the smallest and largest chunk durations."""
+        seconds = max(self.min_seconds, round(seconds))
+        if self.max_seconds is not None:
+            seconds = min(self.max_seconds, seconds)
+        return seconds
+
+
+def is_too_large_error(error: Exception) -> bool:
+    """Return whether a chunk request failed because its chunk is too large."""
+    if isinstance(error, PrometheusApiClientException):
+        return error.status_code in SHRINK_ON_STATUS
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return True
+    # the retry adapter gives up with a RetryError after too many error responses, and with a
+    # ConnectionError after too many read timeouts, both wrapping the urllib3 MaxRetryError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    if isinstance(error, requests.exceptions.RetryError):
+        return _retry_error_status(reason) in SHRINK_ON_STATUS
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return isinstance(reason, ReadTimeoutError)
+    return False
+
+
+def _retry_error_status(reason) -> Optional[int]:
+    """Return the status code of the responses that exhausted the retries, or None."""
+    # urllib3 only keeps it in the message of the ResponseError, "too many 503 error responses"
+    match = re.search(r"too many (\d+) error responses", str(reason))
+    return int(match.group(1)) if match else None
+
+
+class _ChunkRetry(Retry):
+    """A `Retry` that does not retry the responses of chunks to be shrunk, see `shrinking`."""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        """Return False for ``SHRINK_ON_STATUS`` responses within `shrinking`."""
+        if status_code in SHRINK_ON_STATUS and getattr(_shrinking, "active", False):
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+@contextmanager
+def shrinking():
+    """
+    Do not retry the ``SHRINK_ON_STATUS`` responses to the requests of this thread.
+
+    A chunk refused because it is too large is then shrunk on the first such response, rather
+    than after the retries with backoff. Only the `_ChunkRetry` of the default adapter of
+    `PrometheusConnect` does so, other retries still retry them.
+    """
+    previous = getattr(_shrinking, "active", False)
+    _shrinking.active = True
+    try:
+        yield
+    finally:
+        _shrinking.active = previous
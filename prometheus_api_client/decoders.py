@@ -0,0 +1,148 @@
+"""JSON decoders for the responses of the Prometheus HTTP API."""
+import json
+from typing import Annotated, Any, Dict, List, TypedDict, Union
+
+#: names of the built-in decoders, "auto" picks the fastest one installed
+DECODERS = ("json", "orjson", "msgspec", "auto")
+
+#: paths of the endpoints returning a ``{"resultType", "result"}`` query result
+QUERY_PATHS = ("/api/v1/query", "/api/v1/query_range")
+
+
+def get_data_decoder(decoder=None):
+    """
+    Return a function that decodes an API response body and returns its ``data`` field.
+
+    The function is called with the response body and, optionally, the path of the endpoint.
+    The msgspec decoder validates the results of the query endpoints against their schema.
+
+    :param decoder: (str|callable) One of "json" (the standard library, default), "orjson",
+        "msgspec" or "auto" (msgspec, then orjson, then json, whichever is installed first).
+        A callable is used like ``json.loads``: it is called with the response body as bytes
+        and must return the decoded JSON document.
+    :returns: (callable) A function of the response body and the endpoint path, returning
+        the ``data`` field of the body
+    :raises:
+        (ValueError) Raises if ``decoder`` is an unknown name
+        (ImportError) Raises if the library of ``decoder`` is not installed
+    """
+    if decoder is None or decoder == "json":
+        return _json_data
+    if callable(decoder):
+        return lambda content, path=None: decoder(content)["data"]
+    if decoder == "orjson":
+        return _orjson_data_decoder()
+    if decoder == "msgspec":
+        return _msgspec_data_decoder()
+    if decoder == "auto":
+        for factory in (_msgspec_data_decoder, _orjson_data_decoder):
+            try:
+                return factory()
+            except ImportError:
+                pass
+        return _json_data
+    raise ValueError(
+        "decoder can only be one of {} or a callable, not {!r}".format(", ".join(DECODERS), decoder)
+    )
+
+
+def _json_data(content: bytes, path: str = None):
+    return json.loads(content)["data"]
+
+
+def _orjson_data_decoder():
+    try:
+        import orjson
+    except ImportError as e:
+        raise ImportError(
+            "orjson is required for the orjson decoder. "
+            "Please install it with: pip install prometheus-api-client[orjson] "
+            "or pip install prometheus-api-client[all]"
+        ) from e
+
+    def orjson_data(content: bytes, path: str = None):
+        return orjson.loads(content)["data"]
+
+    return orjson_data
+
+
+def _msgspec_data_decoder():
+    try:
+        import msgspec
+    except ImportError as e:
+        raise ImportError(
+            "msgspec is required for the msgspec decoder. "
+            "Please install it with: pip install prometheus-api-client[msgspec] "
+            "or pip install prometheus-api-client[all]"
+        ) from e
+
+    # a ``[timestamp, "value"]`` sample, a list like with the other decoders
+    Sample = Annotated[List[Union[int, float, str]], msgspec.Meta(min_length=2, max_length=2)]
+
+    class RangeSeries(TypedDict, total=False):
+        """A series of a matrix result, "histograms" holds the samples of native histograms."""
+
+        metric: Dict[str, str]
+        values: List[Sample]
+        histograms: List[List[Any]]
+
+    class InstantSeries(TypedDict, total=False):
+        """A series of a vector result."""
+
+        metric: Dict[str, str]
+        value: Sample
+        histogram: List[Any]
+
+    class Matrix(msgspec.Struct, tag_field="resultType", tag="matrix"):
+        """A matrix result, of a range query."""
+
+        result: List[RangeSeries]
+        stats: Any = None
+
+    class Vector(msgspec.Struct, tag_field="resultType", tag="vector"):
+        """A vector result, of an instant query."""
+
+        result: List[InstantSeries]
+        stats: Any = None
+
+    class Scalar(msgspec.Struct, tag_field="resultType", tag="scalar"):
+        """A scalar result."""
+
+        result: Sample
+        stats: Any = None
+
+    class String(msgspec.Struct, tag_field="resultType", tag="string"):
+        """A string result."""
+
+        result: Sample
+        stats: Any = None
+
+    class Envelope(msgspec.Struct):
+        """The ``{"status", "data", ...}`` envelope of every API response."""
+
+        status: str
+        data: Any = None
+
+    class QueryEnvelope(msgspec.Struct):
+        """The envelope of the responses of the query endpoints."""
+
+        status: str
+        data: Union[Matrix, Vector, Scalar, String, None] = None
+
+    # decoding into a struct validates the envelope without building a dict for it, and
+    # skips the "warnings" and other fields that are not used
+    decoder = msgspec.json.Decoder(Envelope)
+    query_decoder = msgspec.json.Decoder(QueryEnvelope)
+
+    def msgspec_data(content: bytes, path: str = None):
+        if path not in QUERY_PATHS:
+            return decoder.decode(content).data
+        data = query_decoder.decode(content).data
+        if data is None:
+            return None
+        result = {"resultType": data.__struct_config__.tag, "result": data.result}
+        if data.stats is not None:
+            result["stats"] = data.stats
+        return result
+
+    return msgspec_data
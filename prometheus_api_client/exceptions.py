@@ -2,9 +2,16 @@
 
 
 class PrometheusApiClientException(Exception):
-    """API client exception, raises when response status code != 200."""
+    """
+    API client exception, raises when response status code != 200.
 
-    pass
+    :ivar status_code: (int) The HTTP status code of the response, if any
+    """
+
+    def __init__(self, *args, status_code: int = None):
+        """Functions as a Constructor for the PrometheusApiClientException object."""
+        super().__init__(*args)
+        self.status_code = status_code
 
 
 class MetricValueConversionError(Exception):
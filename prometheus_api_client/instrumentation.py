@@ -0,0 +1,170 @@
+"""Per-request instrumentation for PrometheusConnect."""
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class RequestInfo:
+    r"""
+    The measurements of one API call, passed to the request hooks of `PrometheusConnect`.
+
+    Times are in seconds. Attributes that could not be measured, such as the time to first
+    byte of a response served from the cache, are None.
+
+    :ivar endpoint: (str) Name of the API endpoint, such as "query" or "query_range"
+    :ivar method: (str) HTTP method of the request
+    :ivar path: (str) Path of the API endpoint, relative to the host url
+    :ivar query: (str) The PromQL query or selector, if any
+    :ivar params: (dict) Parameters sent along with the request
+    :ivar status_code: (int) HTTP status code of the response
+    :ivar retries: (int) Number of retries done by the retry adapter
+    :ivar cached: (bool) True if the response was served from the response cache
+    :ivar ttfb: (float) Time until the response headers were received
+    :ivar transfer_time: (float) Time until the whole response body was received
+    :ivar decode_time: (float) Time spent decoding the response body
+    :ivar duration: (float) Wall time of the whole call
+    :ivar response_bytes: (int) Size of the response body
+    :ivar series: (int) Number of series (or items) in the result
+    :ivar samples: (int) Number of samples in the result, for instant and range queries
+    :ivar chunk_seconds: (int) Duration of the range of a `get_metric_range_data` chunk
+    :ivar error: (Exception) The exception raised by the call, if it failed
+    """
+
+    def __init__(self, endpoint: str, method: str, path: str, params: dict = None, query=None):
+        """Functions as a Constructor for the RequestInfo object."""
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.params = params
+        self.query = query if query is not None else (params or {}).get("query")
+        self.status_code: Optional[int] = None
+        self.retries = 0
+        self.cached = False
+        self.ttfb: Optional[float] = None
+        self.transfer_time: Optional[float] = None
+        self.decode_time: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.response_bytes: Optional[int] = None
+        self.series: Optional[int] = None
+        self.samples: Optional[int] = None
+        self.chunk_seconds: Optional[int] = None
+        self.error: Optional[BaseException] = None
+
+    def as_dict(self) -> dict:
+        """Return the measurements as a dict."""
+        return {name: value for name, value in vars(self).items() if name != "params"}
+
+    def __repr__(self):
+        """Make object representation to be shown in the console."""
+        return "RequestInfo(endpoint={!r}, query={!r}, status_code={!r}, duration={!r})".format(
+            self.endpoint, self.query, self.status_code, self.duration
+        )
+
+    def record_response(self, response, transfer_time: float, stream: bool = False) -> None:
+        """
+        Record the status, size, retries and timings of a `requests.Response`.
+
+        The body of a streamed response is not read, its size and transfer time are left to
+        the caller.
+        """
+        self.status_code = response.status_code
+        self.ttfb = response.elapsed.total_seconds()
+        if not stream:
+            self.transfer_time = transfer_time
+            self.response_bytes = len(response.content)
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None:
+            self.retries = len(retries.history)
+
+    def record_result(self, data) -> None:
+        """Count the series and samples of the ``data`` field of a response."""
+        if isinstance(data, dict) and "result" in data:
+            result = data["result"]
+            if data.get("resultType") in ("scalar", "string"):
+                self.series, self.samples = 1, 1
+            elif isinstance(result, list):
+                self.series = len(result)
+                self.samples = sum(
+                    len(series["values"]) if "values" in series else 1 for series in result
+                )
+        elif isinstance(data, (list, dict)):
+            self.series = len(data)
+
+
+class RequestStats:
+    r"""
+    A request hook that collects the `RequestInfo` of every call.
+
+    Totals are kept per endpoint, along with the most recent requests.
+
+    :param max_records: (int) Number of recent requests kept. Default is 1000.
+
+    Example Usage:
+      .. code-block:: python
+
+          stats = RequestStats()
+          prom = PrometheusConnect(hooks=[stats])
+          ...
+          print(stats.summary())
+          for info in stats.slowest(5):
+              print(info.query, info.duration, info.decode_time)
+    """
+
+    def __init__(self, max_records: int = 1000):
+        """Functions as a Constructor for the RequestStats object."""
+        self.max_records = max_records
+        self._records: Deque[RequestInfo] = deque(maxlen=max_records)
+        self._totals: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, info: RequestInfo) -> None:
+        """Record one request."""
+        with self._lock:
+            self._records.append(info)
+            totals = self._totals.setdefault(
+                info.endpoint,
+                {
+                    "count": 0,
+                    "errors": 0,
+                    "cache_hits": 0,
+                    "retries": 0,
+                    "duration": 0.0,
+                    "decode_time": 0.0,
+                    "response_bytes": 0,
+                    "samples": 0,
+                },
+            )
+            totals["count"] += 1
+            totals["errors"] += info.error is not None
+            totals["cache_hits"] += info.cached
+            totals["retries"] += info.retries
+            totals["duration"] += info.duration or 0.0
+            totals["decode_time"] += info.decode_time or 0.0
+            totals["response_bytes"] += info.response_bytes or 0
+            totals["samples"] += info.samples or 0
+
+    @property
+    def records(self) -> list:
+        """Return the most recent requests, oldest first."""
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> dict:
+        """
+        Return the totals of each endpoint.
+
+        :returns: (dict) A dict mapping each endpoint to its count of calls, errors, cache
+            hits and retries, and to its total duration, decode time, response bytes and samples
+        """
+        with self._lock:
+            return {endpoint: dict(totals) for endpoint, totals in self._totals.items()}
+
+    def slowest(self, n: int = 10) -> list:
+        """Return the ``n`` slowest of the recent requests, slowest first."""
+        return sorted(self.records, key=lambda info: info.duration or 0.0, reverse=True)[:n]
+
+    def reset(self) -> None:
+        """Forget every recorded request."""
+        with self._lock:
+            self._records.clear()
+            self._totals.clear()
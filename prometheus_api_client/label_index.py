@@ -0,0 +1,237 @@
+"""An inverted index over the labels of fetched series, for PromQL label matchers."""
+import ast
+import re
+
+#: the label matcher operators of PromQL
+MATCHER_TYPES = ("=", "!=", "=~", "!~")
+
+_METRIC_NAME = re.compile(r"\s*([a-zA-Z_:][a-zA-Z0-9_:]*)?\s*")
+_MATCHER = re.compile(
+    r"\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*"
+    r"(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|`[^`]*`)\s*(,|$)"
+)
+
+
+def parse_selector(selector: str) -> list:
+    """
+    Parse a PromQL series selector into label matchers.
+
+    :param selector: (str) A selector such as ``up{job="node", instance=~"db-.*"}``, the metric
+        name and the braces are both optional
+    :returns: (list) The ``(name, op, value)`` matchers of the selector, the metric name is
+        returned as a ``("__name__", "=", name)`` matcher
+    :raises: (ValueError) Raises if the selector cannot be parsed
+    """
+    match = _METRIC_NAME.match(selector)
+    if match is None:
+        raise ValueError("Invalid series selector {!r}".format(selector))
+    matchers = [("__name__", "=", match.group(1))] if match.group(1) else []
+    position = match.end()
+    if position < len(selector):
+        if selector[position] != "{" or not selector.rstrip().endswith("}"):
+            raise ValueError("Invalid series selector {!r}".format(selector))
+        body = selector.rstrip()[position + 1:-1]
+        position = 0
+        while body[position:].strip():
+            match = _MATCHER.match(body, position)
+            if match is None:
+                raise ValueError("Invalid label matchers in series selector {!r}".format(selector))
+            name, op, value = match.group(1, 2, 3)
+            value = value[1:-1] if value.startswith("`") else ast.literal_eval(value)
+            matchers.append((name, op, value))
+            position = match.end()
+    return matchers
+
+
+class LabelIndex:
+    r"""
+    An inverted index from label names and values to the series holding them.
+
+    The index is built once over fetched series, and then answers label matchers with set
+    operations, instead of scanning the labels of every series. The matchers follow PromQL:
+    regular expressions are fully anchored, and a series without a label matches like one
+    with the label set to the empty string, so ``job=""`` selects the series without a job.
+
+    :param data: (list|MetricsList|LazyMetricsList|DataFrame) The series to index, either a list
+        of `Metric` objects, a raw result list (dicts with a "metric" key), a `LazyMetricsList`
+        or a `MetricRangeDataFrame`, where every distinct set of label columns is a series
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect()
+          metric_data = prom.get_current_metric_value('node_load1')
+
+          index = LabelIndex(metric_data)
+          db_series = index.select('{instance=~"db-.*"}')  # raw series of the db instances
+          index.select(("job", "=", "node"), ("instance", "!~", "db-.*"))
+    """
+
+    def __init__(self, data):
+        """Functions as a Constructor for the LabelIndex object."""
+        self._data = data
+        self._codes = None
+        if hasattr(data, "columns"):
+            label_sets = self._dataframe_label_sets(data)
+        elif hasattr(data, "iter_labels"):
+            label_sets = list(data.iter_labels())
+        else:
+            label_sets = [self._labels(series) for series in data]
+
+        self._label_sets = label_sets
+        self._all = frozenset(range(len(label_sets)))
+        self._postings = {}
+        for position, labels in enumerate(label_sets):
+            for name, value in labels.items():
+                self._postings.setdefault(name, {}).setdefault(value, set()).add(position)
+
+    @staticmethod
+    def _labels(series) -> dict:
+        """Return the labels of a `Metric` or of a raw series, including ``__name__``."""
+        if isinstance(series, dict):
+            return series["metric"]
+        labels = dict(series.label_config)
+        if series.metric_name is not None:
+            labels["__name__"] = series.metric_name
+        return labels
+
+    def _dataframe_label_sets(self, df) -> list:
+        """Return the distinct label sets of the rows of ``df``, recording the set of each row."""
+        import numpy
+
+        label_columns = [column for column in df.columns if column != "value"]
+        if not label_columns:
+            self._codes = numpy.zeros(len(df), dtype=numpy.int64)
+            return [{}] if len(df) else []
+        self._codes = (
+            df.groupby(label_columns, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        )
+        _, first_rows = numpy.unique(self._codes, return_index=True)
+        labels = df[label_columns].iloc[first_rows]
+        # a missing label is NaN, leave it out like PromQL does
+        return [
+            {
+                name: value
+                for name, value in zip(label_columns, row)
+                if value is not None and value == value
+            }
+            for row in labels.itertuples(index=False)
+        ]
+
+    def __len__(self):
+        """Return the number of series in the index."""
+        return len(self._label_sets)
+
+    @property
+    def label_sets(self) -> list:
+        """Return the labels of the indexed series, in the order of the data."""
+        return self._label_sets
+
+    def label_names(self) -> list:
+        """Return the sorted names of the labels of the indexed series."""
+        return sorted(self._postings)
+
+    def label_values(self, name: str) -> list:
+        """Return the sorted values of the label ``name``."""
+        return sorted(self._postings.get(name, ()))
+
+    def positions(self, *matchers) -> list:
+        """
+        Return the positions of the series matching every one of ``matchers``.
+
+        :param matchers: ``(name, op, value)`` label matchers, where ``op`` is one of "=", "!=",
+            "=~" and "!~", or PromQL series selectors such as ``'{job="node"}'``
+        :returns: (list) The sorted positions of the matching series in the indexed data
+        :raises: (ValueError) Raises if a matcher or selector is invalid
+        """
+        parsed = []
+        for matcher in matchers:
+            if isinstance(matcher, str):
+                parsed.extend(parse_selector(matcher))
+            else:
+                parsed.append(matcher)
+
+        # an equality is a single lookup, run those first, the smallest posting first
+        ordered = sorted(
+            ((name, op, value, _value_test(op, value)) for name, op, value in parsed),
+            key=lambda matcher: self._lookup_size(*matcher[:3]),
+        )
+        selected = self._all
+        for name, op, value, test in ordered:
+            if not selected:
+                break
+            values = self._postings.get(name, {})
+            if len(selected) < len(values):
+                # fewer series left than values of the label, test the series instead
+                label_sets = self._label_sets
+                selected = {
+                    position
+                    for position in selected
+                    if test(label_sets[position].get(name, ""))
+                }
+            else:
+                selected = selected.intersection(self._match(name, op, value, test))
+        return sorted(selected)
+
+    def select(self, *matchers):
+        """
+        Return the series matching every one of ``matchers``.
+
+        :param matchers: ``(name, op, value)`` label matchers, or PromQL series selectors,
+            see `positions`
+        :returns: (list|DataFrame) The matching items of the indexed data, or the rows of the
+            matching series for a DataFrame
+        :raises: (ValueError) Raises if a matcher or selector is invalid
+        """
+        positions = self.positions(*matchers)
+        if self._codes is not None:
+            import numpy
+
+            return self._data[numpy.isin(self._codes, positions)]
+        return [self._data[position] for position in positions]
+
+    def _lookup_size(self, name: str, op: str, value: str) -> tuple:
+        """Sort key running the equalities first, by the number of series they select."""
+        if op == "=" and value != "":
+            return 0, len(self._postings.get(name, {}).get(value, ()))
+        return 1, 0
+
+    def _match(self, name: str, op: str, value: str, test):
+        """Return the positions of the series matching one matcher, from the postings."""
+        values = self._postings.get(name, {})
+        if op == "=" and value != "":
+            return values.get(value, frozenset())
+        if op in _NEGATIONS:
+            # the complement of the positive matcher, testing each value once
+            return self._all - self._match(name, _NEGATIONS[op], value, lambda v: not test(v))
+        matched = set().union(
+            *(positions for label_value, positions in values.items() if test(label_value))
+        )
+        # the series without the label match like the empty string
+        if test(""):
+            matched |= self._all.difference(*values.values())
+        return matched
+
+
+_NEGATIONS = {"!=": "=", "!~": "=~"}
+
+
+def _value_test(op: str, value: str):
+    """Return a function checking whether a label value matches ``op`` and ``value``."""
+    if op == "=":
+        return lambda label_value: label_value == value
+    if op == "!=":
+        return lambda label_value: label_value != value
+    if op in ("=~", "!~"):
+        try:
+            regex = re.compile(value)
+        except re.error as e:
+            raise ValueError("Invalid regular expression {!r}: {}".format(value, e)) from e
+        if op == "=~":
+            return lambda label_value: regex.fullmatch(label_value) is not None
+        return lambda label_value: regex.fullmatch(label_value) is None
+    raise ValueError(
+        "Label matcher operator can only be one of {}, not {!r}".format(
+            ", ".join(MATCHER_TYPES), op
+        )
+    )
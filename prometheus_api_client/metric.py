@@ -1,5 +1,5 @@
 """A Class for metric object."""
-from copy import deepcopy
+from copy import copy, deepcopy
 import datetime
 
 try:
@@ -11,7 +11,9 @@ except ImportError as e:
         "or pip install prometheus-api-client[all]"
     ) from e
 
-from prometheus_api_client.exceptions import MetricValueConversionError
+import numpy
+
+from prometheus_api_client.samples import decode_samples
 
 class Metric:
     r"""
@@ -45,6 +47,18 @@ class Metric:
 
     """
 
+    __slots__ = (
+        "metric_name",
+        "label_config",
+        "oldest_data_datetime",
+        "timestamps",
+        "values",
+        "_metric_values",
+        "_checked",
+        "_buffer",
+        "_offset",
+    )
+
     def __init__(self, metric, oldest_data_datetime=None):
         """Functions as a Constructor for the Metric object."""
         if not isinstance(
@@ -59,40 +73,84 @@ class Metric:
             # if metric is a Metric object, just copy the object and update its parameters
             self.metric_name = metric.metric_name
             self.label_config = metric.label_config
-            self.metric_values = metric.metric_values
-            self.oldest_data_datetime = oldest_data_datetime
+            self.timestamps = metric.timestamps
+            self.values = metric.values
+            self._metric_values = metric._metric_values
+            self._checked = metric._checked
         else:
-            self.metric_name = metric["metric"].get("__name__", None)
-            self.label_config = deepcopy(metric["metric"])
-            if "__name__" in self.label_config:
-                del self.label_config["__name__"]
-            self.oldest_data_datetime = oldest_data_datetime
-
-            # if it is a single value metric change key name
-            if "value" in metric:
-                datestamp = metric["value"][0]
-                metric_value = metric["value"][1]
-                if isinstance(metric_value, str):
-                    try:
-                        metric_value = float(metric_value)
-                    except (TypeError, ValueError):
-                        raise MetricValueConversionError(
-                            "Converting string metric value to float failed."
-                        )
-                metric["values"] = [[datestamp, metric_value]]
-
-            self.metric_values = pandas.DataFrame(metric["values"], columns=["ds", "y"]).apply(
-                pandas.to_numeric, errors="raise"
-            )
-            self.metric_values["ds"] = pandas.to_datetime(self.metric_values["ds"], unit="s")
-
-        # Set the metric start time and the metric end time
-        self.start_time = self.metric_values.iloc[0, 0]
-        self.end_time = self.metric_values.iloc[-1, 0]
+            # single value (instant vector) metrics hold one sample
+            timestamps, values, _ = decode_samples([metric])
+            self._set_labels(metric["metric"])
+            self.timestamps = pandas.to_datetime(timestamps, unit="s").values
+            self.values = values
+            self._metric_values = None
+            self._checked = None
+        self._buffer = None
+        self._offset = 0
+        self.oldest_data_datetime = oldest_data_datetime
 
         # We store the plot information as Class variable
         Metric._plot = None
 
+    @classmethod
+    def _from_samples(cls, labels: dict, timestamps, values):
+        """
+        Create a metric from already decoded samples.
+
+        :param labels: (dict) The labels of the time-series, including its ``__name__``
+        :param timestamps: (numpy.ndarray) The datetime64[ns] timestamps of the samples
+        :param values: (numpy.ndarray) The float64 values of the samples
+        :return: (`Metric`) A new `Metric` object holding the arrays, without copying them
+        """
+        metric = cls.__new__(cls)
+        metric._set_labels(labels)
+        metric.oldest_data_datetime = None
+        metric.timestamps = timestamps
+        metric.values = values
+        metric._metric_values = None
+        metric._checked = None
+        metric._buffer = None
+        metric._offset = 0
+        return metric
+
+    def _set_labels(self, labels: dict):
+        """Set the metric name and the label config from the labels of a time-series."""
+        self.metric_name = labels.get("__name__", None)
+        self.label_config = deepcopy(labels)
+        if "__name__" in self.label_config:
+            del self.label_config["__name__"]
+
+    @property
+    def metric_values(self):
+        """
+        Return the samples as a DataFrame with the columns "ds" (timestamps) and "y" (values).
+
+        The DataFrame is built from the ``timestamps`` and ``values`` arrays on first access.
+        Changes made to it in place are not seen by the arrays, assign a DataFrame to
+        ``metric_values`` to replace the samples.
+        """
+        if self._metric_values is None:
+            self._metric_values = pandas.DataFrame({"ds": self.timestamps, "y": self.values})
+        return self._metric_values
+
+    @metric_values.setter
+    def metric_values(self, metric_values):
+        self.timestamps = metric_values["ds"].to_numpy()
+        self.values = metric_values["y"].to_numpy()
+        self._metric_values = metric_values
+        self._checked = None
+        self._buffer = None
+
+    @property
+    def start_time(self):
+        """Return the timestamp of the first sample, as a `pandas.Timestamp`."""
+        return pandas.Timestamp(self.timestamps[0])
+
+    @property
+    def end_time(self):
+        """Return the timestamp of the last sample, as a `pandas.Timestamp`."""
+        return pandas.Timestamp(self.timestamps[-1])
+
     def __eq__(self, other):
         """
         Overloading operator ``=``.
@@ -115,6 +173,15 @@ class Metric:
             (self.metric_name == other.metric_name) and (self.label_config == other.label_config)
         )
 
+    def __hash__(self):
+        """
+        Hash a metric by its time-series, i.e. its name and label config.
+
+        Metrics that are equal have the same hash, so metrics can be used as dict keys and in
+        sets. The label config must not be modified while the metric is used as a key.
+        """
+        return hash((self.metric_name, frozenset(self.label_config.items())))
+
     def __str__(self):
         """
         Make it print in a cleaner way when print function is used on a Metric object.
@@ -156,31 +223,12 @@ class Metric:
           from different metric time-series
         """
         if self == other:
-            new_metric = deepcopy(self)
-            new_metric.metric_values = pandas.concat([new_metric.metric_values,other.metric_values],ignore_index=True, axis=0)
-            new_metric.metric_values = new_metric.metric_values.dropna()
-            new_metric.metric_values = (
-                new_metric.metric_values.drop_duplicates("ds")
-                .sort_values(by=["ds"])
-                .reset_index(drop=True)
-            )
-            # if oldest_data_datetime is set, trim the dataframe and only keep the newer data
-            if new_metric.oldest_data_datetime:
-                if isinstance(new_metric.oldest_data_datetime, datetime.timedelta):
-                    # create a time range mask
-                    mask = new_metric.metric_values["ds"] >= (
-                        new_metric.metric_values.iloc[-1, 0] - abs(new_metric.oldest_data_datetime)
-                    )
-                else:
-                    # create a time range mask
-                    mask = new_metric.metric_values["ds"] >= new_metric.oldest_data_datetime
-                # truncate the df within the mask
-                new_metric.metric_values = new_metric.metric_values.loc[mask]
-
-            # Update the metric start time and the metric end time for the new Metric
-            new_metric.start_time = new_metric.metric_values.iloc[0, 0]
-            new_metric.end_time = new_metric.metric_values.iloc[-1, 0]
-
+            samples = self._appended_samples(other)
+            if samples is None:
+                return Metric._merge([self, other])
+            new_metric = copy(self)
+            new_metric.label_config = deepcopy(self.label_config)
+            new_metric._set_samples(*samples, checked=True)
             return new_metric
 
         if self.metric_name != other.metric_name:
@@ -189,6 +237,184 @@ class Metric:
             error_string = "Different metric labels"
         raise TypeError("Cannot Add different metric types. " + error_string)
 
+    def __iadd__(self, other):
+        r"""
+        Overloading operator ``+=``.
+
+        Add the data of ``other`` to this metric in place, unlike ``metric = metric + other``
+        which builds a new metric, so every reference to this metric sees the added samples.
+        When ``other`` only holds samples newer than the ones of this metric, like the new
+        samples of a rolling window, they are appended in amortized time proportional to the
+        number of new samples. Otherwise the samples are merged the same way as by ``+``.
+
+        Example Usage:
+          .. code-block:: python
+
+            metric = Metric(metric_data, oldest_data_datetime=datetime.timedelta(hours=1))
+            while True:
+                metric += Metric(new_metric_data)  # keeps the last hour of data
+
+        :raises: (TypeError) Raises an exception when two metrics being added are
+          from different metric time-series
+        """
+        if self != other:
+            # raises the TypeError of ``+``
+            return self + other
+        if not self._extend(other):
+            self._set_samples(*Metric._merged_samples([self, other]), checked=True)
+        return self
+
+    def _appended_samples(self, other):
+        """
+        Return the samples of this metric followed by the samples of ``other``.
+
+        :return: (tuple) The combined ``(timestamps, values)``, or None if the samples of
+          ``other`` do not all come after the last sample of this metric, or either metric holds
+          NaNs or unsorted timestamps, which need the full merge
+        """
+        if not self._precedes(other):
+            return None
+        return (
+            numpy.concatenate((self.timestamps, other.timestamps)),
+            numpy.concatenate((self.values, other.values)),
+        )
+
+    def _extend(self, other) -> bool:
+        """
+        Append the samples of ``other`` in place, if they all come after the samples of this one.
+
+        The samples are kept in buffers twice as large as needed, which new samples are
+        written to the end of, and trimmed by moving the offset of the samples in them. When a
+        buffer is full it is replaced with one twice as large as the samples, so each sample
+        is copied a constant number of times on average. ``timestamps`` and ``values`` are
+        views of the buffers, the samples in them are never overwritten.
+
+        :return: (bool) Whether the samples were appended
+        """
+        if not (
+            self._precedes(other)
+            and self.timestamps.dtype == other.timestamps.dtype
+            and self.values.dtype == other.values.dtype
+        ):
+            return False
+        count, new_count = len(self.timestamps), len(other.timestamps)
+        end = self._offset + count
+        buffer = self._buffer
+        # the buffer may be shared with copies of this metric, which may have appended to it
+        if (
+            buffer is None
+            or self.timestamps.base is not buffer[0]
+            or self.values.base is not buffer[1]
+            or buffer[2] != end
+            or end + new_count > len(buffer[0])
+        ):
+            capacity = 2 * (count + new_count)
+            buffer = [
+                numpy.empty(capacity, dtype=self.timestamps.dtype),
+                numpy.empty(capacity, dtype=self.values.dtype),
+                count,
+            ]
+            buffer[0][:count] = self.timestamps
+            buffer[1][:count] = self.values
+            self._buffer = buffer
+            self._offset = 0
+            end = count
+        buffer[0][end:end + new_count] = other.timestamps
+        buffer[1][end:end + new_count] = other.values
+        end += new_count
+        buffer[2] = end
+        self._offset += self._trim_start(buffer[0][self._offset:end])
+        self.timestamps = buffer[0][self._offset:end]
+        self.values = buffer[1][self._offset:end]
+        self._metric_values = None
+        self._checked = (self.timestamps, self.values)
+        return True
+
+    def _precedes(self, other) -> bool:
+        """Return whether both metrics hold checked samples, all of this one before ``other``."""
+        if len(self.timestamps) == 0 or len(other.timestamps) == 0:
+            return False
+        # NaT compares false, so missing timestamps fail the checks too
+        return bool(
+            other.timestamps[0] > self.timestamps[-1] and self._check() and other._check()
+        )
+
+    def _check(self) -> bool:
+        """
+        Return whether the timestamps are strictly increasing and no value is NaN.
+
+        The result is recorded for the ``timestamps`` and ``values`` arrays, so that it is only
+        computed once for them.
+        """
+        checked = self._checked
+        if checked is not None and checked[0] is self.timestamps and checked[1] is self.values:
+            return True
+        timestamps = self.timestamps
+        if numpy.isnan(self.values).any() or not (timestamps[1:] > timestamps[:-1]).all():
+            return False
+        self._checked = (self.timestamps, self.values)
+        return True
+
+    def _trim_start(self, timestamps) -> int:
+        """Return the index of the first of the sorted ``timestamps`` to keep."""
+        if not self.oldest_data_datetime or not len(timestamps):
+            return 0
+        if isinstance(self.oldest_data_datetime, datetime.timedelta):
+            oldest = timestamps[-1] - numpy.timedelta64(abs(self.oldest_data_datetime))
+        else:
+            oldest = pandas.Timestamp(self.oldest_data_datetime).to_datetime64()
+        # the timestamps are sorted, the samples to keep start at the first one >= oldest
+        return timestamps.searchsorted(oldest)
+
+    def _set_samples(self, timestamps, values, checked: bool = False):
+        """
+        Set the sorted samples, trimmed to ``oldest_data_datetime``.
+
+        :param checked: (bool) Whether the timestamps are known to be strictly increasing and
+          the values not to be NaN
+        """
+        start = self._trim_start(timestamps)
+        self.timestamps = timestamps[start:]
+        self.values = values[start:]
+        self._metric_values = None
+        self._checked = (self.timestamps, self.values) if checked else None
+        self._buffer = None
+        self._offset = 0
+
+    @staticmethod
+    def _merge(metrics: list):
+        """
+        Merge metrics of the same time-series in one go.
+
+        The result is the same as adding them up one by one with ``+``: where several metrics
+        hold a value for the same timestamp, the one of the earliest metric is kept, and the
+        ``oldest_data_datetime`` of the first metric is applied. The samples are concatenated
+        and sorted once, instead of once per addition.
+
+        :param metrics: (list) Metrics of the same time-series
+        :return: (`Metric`) A new `Metric` object with the combined metric data
+        """
+        new_metric = copy(metrics[0])
+        new_metric.label_config = deepcopy(metrics[0].label_config)
+        new_metric._set_samples(*Metric._merged_samples(metrics), checked=True)
+        return new_metric
+
+    @staticmethod
+    def _merged_samples(metrics: list):
+        """
+        Return the sorted samples of metrics of the same time-series, see `_merge`.
+
+        :return: (tuple) The ``(timestamps, values)``, without missing timestamps or values
+        """
+        timestamps = numpy.concatenate([metric.timestamps for metric in metrics])
+        values = numpy.concatenate([metric.values for metric in metrics])
+        # drop the samples with a missing timestamp or value
+        present = ~(numpy.isnat(timestamps) | numpy.isnan(values))
+        timestamps, values = timestamps[present], values[present]
+        # sorts the timestamps and keeps the first occurrence of each, so the earliest metric wins
+        timestamps, first = numpy.unique(timestamps, return_index=True)
+        return timestamps, values[first]
+
     _metric_plot = None
 
     def plot(self, *args, **kwargs):
@@ -1,6 +1,6 @@
 """A pandas.DataFrame subclass for Prometheus range vector responses."""
 try:
-    from pandas import DataFrame, to_datetime
+    from pandas import Categorical, DataFrame, Index, MultiIndex, to_datetime
     from pandas._typing import Axes, Dtype
 except ImportError as e:
     raise ImportError(
@@ -11,7 +11,9 @@ except ImportError as e:
 
 from typing import Optional, Sequence
 
-from prometheus_api_client.exceptions import MetricValueConversionError
+import numpy
+
+from prometheus_api_client.samples import decode_samples
 
 
 class MetricRangeDataFrame(DataFrame):
@@ -37,6 +39,11 @@ class MetricRangeDataFrame(DataFrame):
     :param ts_as_datetime: (bool) default True. Convert the timestamps returned by prometheus
                  from float64 (unix time) to pandas datetime objects. This results in a pd.DatetimeIndex
                  as the dtype of the index of the returned dataframe, instead of pd.Float64Index
+    :param labels_as_categorical: (bool) default False. Store the label columns as pandas
+                 Categoricals, which hold every distinct label value once instead of once per
+                 sample, and use several times less memory for large frames.
+    :param value_dtype: (dtype) default None. Data type of the value column, such as
+                 numpy.float32 to halve its memory. If None, values are float64.
 
     Example Usage:
       .. code-block:: python
@@ -66,6 +73,8 @@ class MetricRangeDataFrame(DataFrame):
         dtype: Optional[Dtype] = None,
         copy: bool = False,
         ts_as_datetime: bool = True,
+        labels_as_categorical: bool = False,
+        value_dtype: Optional[Dtype] = None,
     ):
         """Functions as a constructor for MetricRangeDataFrame class."""
         if data is not None:
@@ -74,30 +83,146 @@ class MetricRangeDataFrame(DataFrame):
             if not isinstance(data, Sequence):
                 data = [data]
 
-        row_data = []
         for v in data:
             if "value" in v:
                 raise TypeError(
                     "data must be a range vector. Expected range vector, got instant vector"
                 )
-            for t in v["values"]:
-                metric_value = t[1]
-                if isinstance(metric_value, str):
-                    try:
-                        metric_value = float(metric_value)
-                    except (TypeError, ValueError):
-                        raise MetricValueConversionError(
-                            "Converting string metric value to float failed."
-                        )
-                row_data.append({**v["metric"], "timestamp": t[0], "value": metric_value})
+        timestamps, values, offsets = decode_samples(data)
+        counts = numpy.diff(offsets)
+
+        # build the frame column by column: the columns are ordered like the keys of one
+        # {**metric, "timestamp", "value"} dict per sample would be, label values are repeated
+        # once per sample of their series, and labels missing from a series are NaN
+        column_names = {}
+        for v, count in zip(data, counts):
+            if count:
+                column_names.update(dict.fromkeys([*v["metric"], "timestamp", "value"]))
+        if ts_as_datetime:
+            # convert before building the frame, so no float64 timestamp column is created
+            timestamps = to_datetime(timestamps, unit="s")
+        elif numpy.array_equal(timestamps, numpy.floor(timestamps)):
+            # whole second timestamps are decoded from integers
+            timestamps = timestamps.astype(numpy.int64)
+        if value_dtype is not None:
+            values = values.astype(value_dtype)
+        column_data = {}
+        for name in column_names or ("timestamp", "value"):
+            if name == "timestamp":
+                column_data[name] = timestamps
+            elif name == "value":
+                column_data[name] = values
+            elif labels_as_categorical:
+                # one code per series, the label values themselves are never repeated
+                series_values = [v["metric"].get(name) for v in data]
+                categories = sorted(set(series_values) - {None})
+                category_codes = {category: code for code, category in enumerate(categories)}
+                codes = [category_codes.get(x, -1) for x in series_values]
+                column_data[name] = Categorical.from_codes(
+                    numpy.repeat(numpy.array(codes, dtype=numpy.int32), counts), categories
+                )
+            else:
+                column_data[name] = numpy.repeat(
+                    numpy.array([v["metric"].get(name, numpy.nan) for v in data], dtype=object),
+                    counts,
+                )
+        for name in columns if columns is not None else ():
+            if name not in column_data:
+                # requested columns absent from every series hold float NaNs
+                column_data[name] = numpy.full(len(values), numpy.nan)
 
         # init df normally now
         super(MetricRangeDataFrame, self).__init__(
-            data=row_data, index=index, columns=columns, dtype=dtype, copy=copy
+            data=column_data, index=index, columns=columns, dtype=dtype, copy=copy
+        )
+
+        self.set_index(["timestamp"], inplace=True)
+
+    @classmethod
+    def wide(
+        cls,
+        data,
+        column_labels: str = "multiindex",
+        ts_as_datetime: bool = True,
+        value_dtype: Optional[Dtype] = None,
+    ) -> DataFrame:
+        """Build a wide dataframe, with one row per timestamp and one column per series.
+
+        The matrix is filled directly from the decoded samples, without building the long
+        layout and pivoting it. Samples of the same series spread over several items of
+        ``data``, as returned by ``get_metric_range_data`` with a ``chunk_size``, end up in
+        the same column. Timestamps at which a series has no sample hold NaN.
+
+        :param data: (list|json) A single range series or a list of range series received
+            from Prometheus
+        :param column_labels: (str) default "multiindex". "multiindex" gives a
+            pandas.MultiIndex of the label values, with one level per label name. "string"
+            gives PromQL-like series names such as ``up{instance="host:9100",job="node"}``.
+        :param ts_as_datetime: (bool) default True. Convert the timestamps to a
+            pd.DatetimeIndex instead of float64 unix times.
+        :param value_dtype: (dtype) default None. Data type of the values. If None, float64.
+        :returns: (pandas.DataFrame) The wide dataframe, indexed by "timestamp"
+
+        Example Usage:
+          .. code-block:: python
+
+              metric_data = prom.get_metric_range_data(metric_name='up')
+              wide_df = MetricRangeDataFrame.wide(metric_data, column_labels="string")
+        """
+        if column_labels not in ("multiindex", "string"):
+            raise ValueError("column_labels must be one of 'multiindex' and 'string'")
+        if not isinstance(data, Sequence):
+            data = [data]
+        for v in data:
+            if "value" in v:
+                raise TypeError(
+                    "data must be a range vector. Expected range vector, got instant vector"
+                )
+        timestamps, values, offsets = decode_samples(data)
+
+        # one column per distinct label set, in the order the series first appear
+        columns_of_series: dict = {}
+        series_column = numpy.empty(len(data), dtype=numpy.int64)
+        for i, v in enumerate(data):
+            key = tuple(sorted(v["metric"].items()))
+            if key not in columns_of_series:
+                columns_of_series[key] = (len(columns_of_series), v["metric"])
+            series_column[i] = columns_of_series[key][0]
+        metrics = [metric for _, metric in columns_of_series.values()]
+
+        unique_timestamps, row = numpy.unique(timestamps, return_inverse=True)
+        column = numpy.repeat(series_column, numpy.diff(offsets))
+        matrix = numpy.full(
+            (len(unique_timestamps), len(metrics)),
+            numpy.nan,
+            dtype=value_dtype if value_dtype is not None else numpy.float64,
         )
+        matrix[row, column] = values
+
+        label_names = list(dict.fromkeys(name for metric in metrics for name in metric))
+        if column_labels == "multiindex" and label_names:
+            columns = MultiIndex.from_tuples(
+                [tuple(metric.get(name) for name in label_names) for metric in metrics],
+                names=label_names,
+            )
+        else:
+            columns = Index([_series_name(metric) for metric in metrics])
 
-        # convert to DateTime type instead of Float64
         if ts_as_datetime:
-            self["timestamp"] = to_datetime(self["timestamp"], unit="s")
+            index = to_datetime(unique_timestamps, unit="s")
+        elif numpy.array_equal(unique_timestamps, numpy.floor(unique_timestamps)):
+            index = Index(unique_timestamps.astype(numpy.int64))
+        else:
+            index = Index(unique_timestamps)
+        index = index.rename("timestamp")
+        return DataFrame(matrix, index=index, columns=columns, copy=False)
 
-        self.set_index(["timestamp"], inplace=True)
+
+def _series_name(metric: dict) -> str:
+    """Format the labels of a series like PromQL does, e.g. ``up{job="node"}``."""
+    labels = ",".join(
+        '{}="{}"'.format(name, value)
+        for name, value in sorted(metric.items())
+        if name != "__name__"
+    )
+    return "{}{{{}}}".format(metric.get("__name__", ""), labels)
@@ -11,7 +11,7 @@ except ImportError as e:
 
 from typing import Optional, Sequence
 
-from prometheus_api_client.exceptions import MetricValueConversionError
+from prometheus_api_client.samples import decode_pairs
 
 
 class MetricSnapshotDataFrame(DataFrame):
@@ -39,6 +39,10 @@ class MetricSnapshotDataFrame(DataFrame):
     :param ts_as_datetime: (bool) default True. Convert the timestamps returned by prometheus
                  from float64 (unix time) to pandas datetime objects. This results in the timestamp column
                  of the returned dataframe to be of dtype datetime64[ns] instead float64
+    :param labels_as_categorical: (bool) default False. Store the label columns as pandas
+                 Categoricals, which hold every distinct label value once instead of once per row.
+    :param value_dtype: (dtype) default None. Data type of the value column, such as
+                 numpy.float32 to halve its memory. If None, values are float64.
 
 
     Example Usage:
@@ -69,6 +73,8 @@ class MetricSnapshotDataFrame(DataFrame):
         copy: bool = False,
         ts_values_keep: str = "last",
         ts_as_datetime: bool = True,
+        labels_as_categorical: bool = False,
+        value_dtype: Optional[Dtype] = None,
     ):
         """Functions as a constructor for MetricSnapshotDataFrame class."""
         if data is not None:
@@ -83,10 +89,12 @@ class MetricSnapshotDataFrame(DataFrame):
             # index corresponding to which ts-value pair to extract
             n = -1 if ts_values_keep == "last" else 0
 
-            # unpack metric, extract and unpack ts-value pair
+            # extract the ts-value pairs, then decode their values at once
+            pairs = [i["values"][n] if "values" in i else i["value"] for i in data]
+            _, values = decode_pairs(pairs)
             data = [
-                {**i["metric"], **MetricSnapshotDataFrame._get_nth_ts_value_pair(i, n)}
-                for i in data
+                {**i["metric"], "timestamp": pair[0], "value": value}
+                for i, pair, value in zip(data, pairs, values.tolist())
             ]
 
         # init df normally now
@@ -98,13 +106,9 @@ class MetricSnapshotDataFrame(DataFrame):
         if ts_as_datetime:
             self["timestamp"] = to_datetime(self["timestamp"], unit="s")
 
-    @staticmethod
-    def _get_nth_ts_value_pair(i: dict, n: int):
-        val = i["values"][n] if "values" in i else i["value"]
-        value = val[1]
-        if isinstance(value, str):
-            try:
-                value = float(value)
-            except (TypeError, ValueError):
-                raise MetricValueConversionError("Converting string metric value to float failed.")
-        return {"timestamp": val[0], "value": value}
+        if labels_as_categorical:
+            for name in self.columns:
+                if name not in ("timestamp", "value"):
+                    self[name] = self[name].astype("category")
+        if value_dtype is not None:
+            self["value"] = self["value"].astype(value_dtype)
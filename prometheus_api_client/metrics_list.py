@@ -1,6 +1,17 @@
 """A list of Metric objects."""
+from collections.abc import Sequence
+
+try:
+    import pandas
+except ImportError as e:
+    raise ImportError(
+        "Pandas is required for MetricsList class. "
+        "Please install it with: pip install prometheus-api-client[dataframe] "
+        "or pip install prometheus-api-client[all]"
+    ) from e
 
 from .metric import Metric
+from .samples import decode_samples
 
 
 class MetricsList(list):
@@ -24,24 +35,233 @@ class MetricsList(list):
 
     def __init__(self, metric_data_list):
         """Class MetricsList constructor."""
-        if not isinstance(metric_data_list, list):
-            metric_data_list = [metric_data_list]
-
-        metric_object_list = []
-
-        def add_metric_to_object_list(metric):
-            metric_object = Metric(metric)
-            if metric_object in metric_object_list:
-                metric_object_list[metric_object_list.index(metric_object)] += metric_object
-            else:
-                metric_object_list.append(metric_object)
-
-        for i in metric_data_list:
-            # If it is a list of lists (for example: while reading from multiple json files)
-            if isinstance(i, list):
-                for metric in i:
-                    add_metric_to_object_list(metric)
-            else:
-                add_metric_to_object_list(i)
+        # group the fragments of every time-series (for example the chunks of a range query),
+        # then merge each group once instead of adding the fragments up one by one
+        fragments = {}
+        for metric_object in _build_metrics(_flatten(metric_data_list)):
+            fragments.setdefault(metric_object, []).append(metric_object)
+
+        metric_object_list = [
+            Metric._merge(group) if len(group) > 1 else group[0] for group in fragments.values()
+        ]
+        # position of every time-series in the list, to find metrics without scanning it
+        index = {metric: position for position, metric in enumerate(metric_object_list)}
 
         super(MetricsList, self).__init__(metric_object_list)
+        self._index = index
+
+    def _get_index(self) -> dict:
+        """Return the position of every time-series, rebuilding the index after the list changed."""
+        if self._index is None:
+            index: dict = {}
+            for position, metric in enumerate(self):
+                index.setdefault(metric, position)
+            self._index = index
+        return self._index
+
+    def __contains__(self, metric):
+        """Check whether the time-series of ``metric`` is in the list, in constant time."""
+        if not isinstance(metric, Metric):
+            return super(MetricsList, self).__contains__(metric)
+        return metric in self._get_index()
+
+    def index(self, metric, *args):
+        """Return the position of the time-series of ``metric``, in constant time."""
+        if args or not isinstance(metric, Metric):
+            return super(MetricsList, self).index(metric, *args)
+        try:
+            return self._get_index()[metric]
+        except KeyError:
+            raise ValueError("{!r} is not in list".format(metric)) from None
+
+
+def _flatten(metric_data_list) -> list:
+    """Return the series of a metric, a list of metrics or a list of lists of metrics."""
+    if not isinstance(metric_data_list, list):
+        metric_data_list = [metric_data_list]
+    series_list = []
+    for i in metric_data_list:
+        # If it is a list of lists (for example: while reading from multiple json files)
+        if isinstance(i, list):
+            series_list.extend(i)
+        else:
+            series_list.append(i)
+    return series_list
+
+
+def _build_metrics(series_list: list) -> list:
+    """Return a `Metric` for every series, without merging the fragments of a time-series."""
+    # decode the samples of all the series at once, each metric holds a slice of the arrays
+    timestamps, values, offsets = decode_samples(series_list)
+    timestamps = pandas.to_datetime(timestamps, unit="s").values
+    return [
+        Metric._from_samples(series["metric"], timestamps[start:end], values[start:end])
+        for series, start, end in zip(series_list, offsets[:-1], offsets[1:])
+    ]
+
+
+def _series_key(labels: dict) -> frozenset:
+    """Return the key of a time-series from its labels, including ``__name__``."""
+    return frozenset(labels.items())
+
+
+class LazyMetricsList(Sequence):
+    r"""
+    A sequence of Metric objects, built only when they are accessed.
+
+    The raw series are grouped by time-series when the list is created, but their samples are
+    only decoded, and the `Metric` object built, when an element is first accessed. Getting
+    the length, iterating over the labels and filtering by labels do not build any metric,
+    which keeps exploring results with many series cheap.
+
+    The fragments of a time-series (for example the chunks of a range query) are merged into
+    one `Metric`, like in `MetricsList`.
+
+    :param metric_data_list: (list|json) This is an individual metric or list of metrics received
+                             from prometheus as a result of a promql query.
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect()
+          metric_data = prom.custom_query_range('up', start_time, end_time, step='15s')
+
+          metrics = LazyMetricsList(metric_data)  # nothing is decoded yet
+          print(len(metrics))
+          for labels in metrics.iter_labels():
+              print(labels)
+          for metric in metrics.filter(label_config={'job': 'node'}):
+              print(metric.metric_values)  # each Metric is built here
+    """
+
+    def __init__(self, metric_data_list):
+        """Functions as a Constructor for the LazyMetricsList object."""
+        groups = {}
+        for series in _flatten(metric_data_list):
+            groups.setdefault(_series_key(series["metric"]), []).append(series)
+        self._keys = list(groups)
+        self._groups = list(groups.values())
+        self._metrics = [None] * len(self._groups)
+        self._positions = {key: position for position, key in enumerate(self._keys)}
+
+    @classmethod
+    def _from_groups(cls, keys: list, groups: list, metrics: list):
+        """Create a list from already grouped series, and the metrics built so far."""
+        lazy_list = cls.__new__(cls)
+        lazy_list._keys = keys
+        lazy_list._groups = groups
+        lazy_list._metrics = metrics
+        lazy_list._positions = {key: position for position, key in enumerate(keys)}
+        return lazy_list
+
+    def __len__(self):
+        """Return the number of time-series."""
+        return len(self._groups)
+
+    def __getitem__(self, position):
+        """
+        Return the `Metric` at ``position``, building it on first access.
+
+        A slice returns a `LazyMetricsList` of the selected time-series.
+        """
+        if isinstance(position, slice):
+            return LazyMetricsList._from_groups(
+                self._keys[position], self._groups[position], self._metrics[position]
+            )
+        metric = self._metrics[position]
+        if metric is None:
+            fragments = _build_metrics(self._groups[position])
+            metric = Metric._merge(fragments) if len(fragments) > 1 else fragments[0]
+            self._metrics[position] = metric
+        return metric
+
+    def __contains__(self, metric):
+        """Check whether the time-series of ``metric`` is in the list, without building it."""
+        if not isinstance(metric, Metric):
+            return False
+        return self._metric_key(metric) in self._positions
+
+    def index(self, metric, *args):
+        """Return the position of the time-series of ``metric``, without building it."""
+        if args or not isinstance(metric, Metric):
+            return super(LazyMetricsList, self).index(metric, *args)
+        try:
+            return self._positions[self._metric_key(metric)]
+        except KeyError:
+            raise ValueError("{!r} is not in list".format(metric)) from None
+
+    def __repr__(self):
+        """Make object representation to be shown in the console."""
+        built = sum(metric is not None for metric in self._metrics)
+        return "LazyMetricsList({} time-series, {} built)".format(len(self), built)
+
+    @staticmethod
+    def _metric_key(metric: Metric) -> frozenset:
+        labels = dict(metric.label_config)
+        if metric.metric_name is not None:
+            labels["__name__"] = metric.metric_name
+        return _series_key(labels)
+
+    def iter_labels(self):
+        """
+        Iterate over the labels of the time-series, without building any metric.
+
+        :returns: (generator) A dict of labels, including ``__name__``, for every time-series
+        """
+        for key in self._keys:
+            yield dict(key)
+
+    def filter(self, metric_name: str = None, label_config: dict = None):
+        """
+        Return the time-series with the given metric name and labels, without building them.
+
+        :param metric_name: (str) The metric name to match, any name if None
+        :param label_config: (dict) Labels and the values they must have
+        :returns: (LazyMetricsList) The matching time-series, metrics already built are shared
+        """
+        required = dict(label_config or {})
+        if metric_name is not None:
+            required["__name__"] = metric_name
+        required_items = required.items()
+        positions = [position for position, key in enumerate(self._keys) if required_items <= key]
+        return LazyMetricsList._from_groups(
+            [self._keys[position] for position in positions],
+            [self._groups[position] for position in positions],
+            [self._metrics[position] for position in positions],
+        )
+
+    def to_metrics_list(self):
+        """Build every metric and return them in a `MetricsList`."""
+        metrics_list = MetricsList([])
+        metrics_list.extend(self)
+        return metrics_list
+
+
+def _invalidates_index(name):
+    list_method = getattr(list, name)
+
+    def method(self, *args, **kwargs):
+        self._index = None
+        return list_method(self, *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = list_method.__doc__
+    return method
+
+
+# every method modifying the list drops the index, it is rebuilt on the next lookup
+for _name in (
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+    "append",
+    "extend",
+    "insert",
+    "pop",
+    "remove",
+    "clear",
+    "sort",
+    "reverse",
+):
+    setattr(MetricsList, _name, _invalidates_index(_name))
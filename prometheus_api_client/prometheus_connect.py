@@ -4,13 +4,24 @@ import bz2
 import os
 import json
 import logging
+import math
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import islice
 from datetime import datetime, timedelta
 import requests
-from requests.adapters import HTTPAdapter
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 from requests import Session
 
+from .cache import ResponseCache, client_identity
+from .chunking import AdaptiveChunkSize, _ChunkRetry, is_too_large_error, shrinking
+from .decoders import get_data_decoder
 from .exceptions import PrometheusApiClientException
+from .instrumentation import RequestInfo
 
 # set up logging
 
@@ -22,6 +33,12 @@ MAX_REQUEST_RETRIES = 3
 RETRY_BACKOFF_FACTOR = 1
 # retry only on these status
 RETRY_ON_STATUS = [408, 429, 500, 502, 503, 504]
+# prometheus refuses range queries that would return more points per series than this
+MAX_POINTS_PER_SERIES = 11000
+# get_metric_aggregation operations that can be computed by the prometheus server
+PUSHDOWN_OPERATIONS = ("sum", "max", "min", "count", "average", "variance", "deviation")
+# label the metric name is copied to before the *_over_time functions of pushdown drop it
+PUSHDOWN_NAME_LABEL = "__pushdown_name__"
 
 
 class PrometheusConnect:
@@ -42,6 +59,17 @@ class PrometheusConnect:
     :param timeout: (Optional) A timeout (in seconds) applied to all requests
     :param method: (Optional) (str) HTTP Method (GET or POST) to use for Query APIs that allow POST 
         (/query, /query_range and /labels). Use POST for large and complex queries. Default is GET.
+    :param cache: (Optional) A `ResponseCache`, such as `MemoryCache` or `DiskCache`, used to
+        answer repeated query, query_range, series, labels and label values requests
+        without a round trip to the host
+    :param results_cache: (Optional) A `RangeResultsCache` used by `custom_query_range` to
+        only fetch the parts of a range that were not fetched before
+    :param hooks: (Optional) A list of callables, such as a `RequestStats`, called with the
+        `RequestInfo` of every API call once it is done, whether it succeeded or not
+    :param decoder: (Optional) JSON decoder of the responses: "json" (the standard library,
+        default), "orjson", "msgspec", "auto" (the fastest one installed) or a callable used
+        like ``json.loads``. Large range query responses decode much faster with orjson
+        or msgspec.
     """
 
     def __init__(
@@ -54,7 +82,11 @@ class PrometheusConnect:
         proxy: dict = None,
         session: Session = None,
         timeout: int = None,
-        method: str = "GET"
+        method: str = "GET",
+        cache: ResponseCache = None,
+        results_cache=None,
+        hooks: list = None,
+        decoder=None,
     ):
         """Functions as a Constructor for the class PrometheusConnect."""
         if url is None:
@@ -74,16 +106,24 @@ class PrometheusConnect:
             raise ValueError("Method can only be GET or POST")
 
         self._method = method
+        self._cache = cache
+        self._results_cache = results_cache
+        self._hooks = list(hooks or [])
+        self._decode_data = get_data_decoder(decoder)
 
         if retry is None:
-            retry = Retry(
+            retry = _ChunkRetry(
                 total=MAX_REQUEST_RETRIES,
                 backoff_factor=RETRY_BACKOFF_FACTOR,
                 status_forcelist=RETRY_ON_STATUS,
             )
 
         self.auth = auth
+        self._retry = retry
+        self._pool_maxsize = DEFAULT_POOLSIZE
 
+        # a session given by the caller keeps the adapters it was configured with
+        self._owns_session = session is None
         if session is not None:
             self._session = session
         else:
@@ -94,6 +134,23 @@ class PrometheusConnect:
             self._session.proxies = proxy
         self._session.mount(self.url, HTTPAdapter(max_retries=retry))
 
+    def _ensure_pool_size(self, pool_maxsize: int) -> None:
+        """
+        Grow the connection pool of the mounted adapter so it can serve ``pool_maxsize`` threads.
+
+        The adapters of a session given by the caller are left alone, their pool is sized by
+        the caller. The replaced adapter is closed.
+        """
+        if pool_maxsize <= self._pool_maxsize or not self._owns_session:
+            return
+        self._pool_maxsize = pool_maxsize
+        old_adapter = self._session.get_adapter(self.url)
+        self._session.mount(
+            self.url,
+            HTTPAdapter(max_retries=self._retry, pool_maxsize=pool_maxsize),
+        )
+        old_adapter.close()
+
     def close(self) -> None:
         """Close the underlying HTTP session and release connection-pool resources."""
         self._session.close()
@@ -105,24 +162,114 @@ class PrometheusConnect:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
-    def check_prometheus_connection(self, params: dict = None) -> bool:
+    def _identity(self) -> str:
+        """Return the digest of the headers and auth of this client, for cache keys."""
+        headers = {**self._session.headers, **(self.headers or {})}
+        return client_identity(headers, self.auth if self.auth is not None else self._session.auth)
+
+    @contextmanager
+    def _instrument(self, endpoint: str, method: str, path: str, params: dict = None, query=None):
         """
-        Check Promethus connection.
+        Measure an API call and pass its `RequestInfo` to the hooks once it is done.
 
-        :param params: (dict) Optional dictionary containing parameters to be
-            sent along with the API request.
-        :returns: (bool) True if the endpoint can be reached, False if cannot be reached.
+        Yields the `RequestInfo` to be filled in by the caller. A hook raising an exception
+        is logged and does not fail the call.
         """
+        info = RequestInfo(endpoint, method, path, params=params, query=query)
+        start = time.perf_counter()
+        try:
+            yield info
+        except BaseException as exc:
+            info.error = exc
+            raise
+        finally:
+            info.duration = time.perf_counter() - start
+            for hook in self._hooks:
+                try:
+                    hook(info)
+                except Exception:
+                    _LOGGER.exception("Request hook %r failed", hook)
+
+    def _send(self, info: RequestInfo, params: dict = None, timeout: int = None, **kwargs):
+        """Send the request described by ``info`` and record the response into it."""
+        kwargs.setdefault("headers", self.headers)
+        start = time.perf_counter()
         response = self._session.request(
-            method="GET",
-            url="{0}/".format(self.url),
+            method=info.method,
+            url="{0}{1}".format(self.url, info.path),
             verify=self._session.verify,
-            headers=self.headers,
             params=params,
             auth=self.auth,
             cert=self._session.cert,
-            timeout=self._timeout,
+            timeout=self._timeout if timeout is None else timeout,
+            **kwargs,
+        )
+        info.record_response(
+            response, time.perf_counter() - start, stream=kwargs.get("stream", False)
         )
+        return response
+
+    def _request_data(
+        self,
+        endpoint: str,
+        method: str,
+        path: str,
+        params: dict = None,
+        timeout: int = None,
+        chunk_seconds: int = None,
+    ):
+        """
+        Send a request to an API endpoint and return the ``data`` field of the response.
+
+        Responses of cacheable endpoints are looked up in and stored into the cache.
+
+        :param endpoint: (str) Name of the API endpoint, such as "query" or "query_range"
+        :param method: (str) HTTP method of the request
+        :param path: (str) Path of the API endpoint, relative to the host url
+        :param params: (dict) Parameters sent along with the request
+        :param timeout: (Optional) A timeout (in seconds) applied to the request
+        :param chunk_seconds: (int) Duration of the range of a chunk, reported to the hooks
+        :raises:
+            (RequestException) Raises an exception in case of a connection error
+            (PrometheusApiClientException) Raises in case of non 200 response status code
+        """
+        with self._instrument(endpoint, method, path, params) as info:
+            info.chunk_seconds = chunk_seconds
+            cache = self._cache
+            cache_key = None
+            if cache is not None and cache.is_cacheable(endpoint):
+                cache_key = cache.make_key(self.url, path, params, self._identity())
+                hit, data = cache.get(cache_key)
+                if hit:
+                    info.cached = True
+                    info.record_result(data)
+                    return data
+
+            response = self._send(info, params=params, timeout=timeout)
+            if response.status_code != 200:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(response.status_code, response.content),
+                    status_code=response.status_code,
+                )
+            start = time.perf_counter()
+            data = self._decode_data(response.content, path)
+            info.decode_time = time.perf_counter() - start
+            info.record_result(data)
+
+            if cache is not None and cache_key is not None:
+                cache.set(cache_key, data, cache.ttl_for(endpoint, params))
+            return data
+
+    def check_prometheus_connection(self, params: dict = None) -> bool:
+        """
+        Check Promethus connection.
+
+        :param params: (dict) Optional dictionary containing parameters to be
+            sent along with the API request.
+        :returns: (bool) True if the endpoint can be reached, False if cannot be reached.
+        """
+        with self._instrument("connection", "GET", "/", params) as info:
+            response = self._send(info, params=params)
         return response.ok
 
     def all_metrics(self, params: dict = None):
@@ -157,22 +304,7 @@ class PrometheusConnect:
         params = params or {}
         params["start"] = start.timestamp()
         params["end"] = end.timestamp()
-        response = self._session.get(
-            "{0}/api/v1/series".format(self.url),
-            verify=self._session.verify,
-            headers=self.headers,
-            params=params,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
-        )
-
-        if response.status_code == 200:
-            labels = response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
-            )
+        labels = self._request_data("series", "GET", "/api/v1/series", params=params)
         return labels
 
 
@@ -188,23 +320,7 @@ class PrometheusConnect:
             (PrometheusApiClientException) Raises in case of non 200 response status code
         """
         params = params or {}
-        response = self._session.request(
-            method=self._method,
-            url="{0}/api/v1/labels".format(self.url),
-            verify=self._session.verify,
-            headers=self.headers,
-            params=params,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
-        )
-
-        if response.status_code == 200:
-            labels = response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
-            )
+        labels = self._request_data("labels", self._method, "/api/v1/labels", params=params)
         return labels
 
     def get_label_values(self, label_name: str, params: dict = None):
@@ -220,23 +336,9 @@ class PrometheusConnect:
             (PrometheusApiClientException) Raises in case of non 200 response status code
         """
         params = params or {}
-        response = self._session.request(
-            method="GET",
-            url="{0}/api/v1/label/{1}/values".format(self.url, label_name),
-            verify=self._session.verify,
-            headers=self.headers,
-            params=params,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
+        labels = self._request_data(
+            "label_values", "GET", "/api/v1/label/{0}/values".format(label_name), params=params
         )
-
-        if response.status_code == 200:
-            labels = response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
-            )
         return labels
 
     def get_current_metric_value(
@@ -266,30 +368,12 @@ class PrometheusConnect:
         """
         params = params or {}
         data = []
-        if label_config:
-            label_list = [str(key + "=" + "'" + label_config[key] + "'") for key in label_config]
-            query = metric_name + "{" + ",".join(label_list) + "}"
-        else:
-            query = metric_name
+        query = _metric_selector(metric_name, label_config)
 
         # using the query API to get raw data
-        response = self._session.request(
-            method=self._method,
-            url="{0}/api/v1/query".format(self.url),
-            params={**{"query": query}, **params},
-            verify=self._session.verify,
-            headers=self.headers,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
-        )
-
-        if response.status_code == 200:
-            data += response.json()["data"]["result"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
-            )
+        data += self._request_data(
+            "query", self._method, "/api/v1/query", params={**{"query": query}, **params}
+        )["result"]
         return data
 
     def get_metric_range_data(
@@ -298,9 +382,10 @@ class PrometheusConnect:
         label_config: dict = None,
         start_time: datetime = (datetime.now() - timedelta(minutes=10)),
         end_time: datetime = datetime.now(),
-        chunk_size: timedelta = None,
+        chunk_size=None,
         store_locally: bool = False,
         params: dict = None,
+        max_workers: int = None,
     ):
         r"""
         Get the current metric value for the specified metric and label configuration.
@@ -310,13 +395,21 @@ class PrometheusConnect:
             values.
         :param start_time:  (datetime) A datetime object that specifies the metric range start time.
         :param end_time: (datetime) A datetime object that specifies the metric range end time.
-        :param chunk_size: (timedelta) Duration of metric data downloaded in one request. For
-            example, setting it to timedelta(hours=3) will download 3 hours worth of data in each
-            request made to the prometheus host
+        :param chunk_size: (timedelta|AdaptiveChunkSize|str) Duration of metric data downloaded
+            in one request. For example, setting it to timedelta(hours=3) will download 3 hours
+            worth of data in each request made to the prometheus host. With an
+            `AdaptiveChunkSize`, or "auto" for the default one, every chunk is sized from the
+            number of samples and download time of the previous one, and a chunk that loads
+            too many samples or times out is retried with half its duration.
         :param store_locally: (bool) If set to True, will store data locally at,
             `"./metrics/hostname/metric_date/name_time.json.bz2"`
         :param params: (dict) Optional dictionary containing GET parameters to be
             sent along with the API request, such as "time"
+        :param max_workers: (int) Optional number of chunks to download concurrently. If set,
+            the chunk requests are issued from a pool of this many threads over the shared
+            session, and the connection pool is grown to match, unless the session was given
+            to the constructor. The returned data keeps the chunks in time order. Default is
+            None, which downloads the chunks one by one. Adaptive chunks are always downloaded one by one.
         :return: (list) A list of metric data for the specified metric in the given time
             range
         :raises:
@@ -324,74 +417,212 @@ class PrometheusConnect:
             (PrometheusApiClientException) Raises in case of non 200 response status code
 
         """
-        params = params or {}
         data = []
+        for result in self.iter_metric_range_data(
+            metric_name,
+            label_config=label_config,
+            start_time=start_time,
+            end_time=end_time,
+            chunk_size=chunk_size,
+            store_locally=store_locally,
+            params=params,
+            max_workers=max_workers,
+        ):
+            data += result
+        return data
 
-        _LOGGER.debug("start_time: %s", start_time)
-        _LOGGER.debug("end_time: %s", end_time)
-        _LOGGER.debug("chunk_size: %s", chunk_size)
+    def iter_metric_range_data(
+        self,
+        metric_name: str,
+        label_config: dict = None,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        chunk_size=None,
+        store_locally: bool = False,
+        params: dict = None,
+        max_workers: int = None,
+    ):
+        r"""
+        Iterate over the metric data for the specified metric, one chunk at a time.
 
-        if not (isinstance(start_time, datetime) and isinstance(end_time, datetime)):
-            raise TypeError("start_time and end_time can only be of type datetime.datetime")
+        This is the streaming counterpart of `get_metric_range_data`. Instead of collecting
+        all the chunks in one list, it yields the series of each chunk as soon as the chunk
+        is downloaded, so the whole range never has to be held in memory at once.
 
-        if not chunk_size:
-            chunk_size = end_time - start_time
-        if not isinstance(chunk_size, timedelta):
-            raise TypeError("chunk_size can only be of type datetime.timedelta")
+        :param metric_name: (str) The name of the metric.
+        :param label_config: (dict) A dictionary specifying metric labels and their
+            values.
+        :param start_time: (datetime) A datetime object that specifies the metric range start
+            time. Default is 10 minutes before ``end_time``.
+        :param end_time: (datetime) A datetime object that specifies the metric range end time.
+            Default is now.
+        :param chunk_size: (timedelta|AdaptiveChunkSize|str) Duration of metric data downloaded
+            in one request, or an `AdaptiveChunkSize` (or "auto") sizing every chunk from the
+            previous one, see `get_metric_range_data`
+        :param store_locally: (bool) If set to True, will store data locally at,
+            `"./metrics/hostname/metric_date/name_time.json.bz2"`
+        :param params: (dict) Optional dictionary containing GET parameters to be
+            sent along with the API request, such as "time"
+        :param max_workers: (int) Optional number of chunks downloaded ahead concurrently.
+            At most this many chunks are held in memory while waiting to be consumed.
+            It cannot be combined with an adaptive ``chunk_size``.
+        :return: (generator) Yields a list of metric data for each chunk, in time order
+        :raises:
+            (RequestException) Raises an exception in case of a connection error
+            (PrometheusApiClientException) Raises in case of non 200 response status code
 
-        start = round(start_time.timestamp())
-        end = round(end_time.timestamp())
+        Example Usage:
+          .. code-block:: python
 
-        if end_time < start_time:
-            raise ValueError("end_time must not be before start_time")
+              prom = PrometheusConnect()
 
-        if (end_time - start_time).total_seconds() < chunk_size.total_seconds():
-            raise ValueError("specified chunk_size is too big")
-        chunk_seconds = round(chunk_size.total_seconds())
+              for chunk in prom.iter_metric_range_data(
+                  "up", start_time=start_time, end_time=end_time, chunk_size=timedelta(hours=1)
+              ):
+                  MetricRangeDataFrame(chunk).to_csv(out, header=False)
+        """
+        params = params or {}
+        end_time = end_time if end_time is not None else datetime.now()
+        start_time = start_time if start_time is not None else end_time - timedelta(minutes=10)
 
-        if label_config:
-            label_list = [str(key + "=" + "'" + label_config[key] + "'") for key in label_config]
-            query = metric_name + "{" + ",".join(label_list) + "}"
-        else:
-            query = metric_name
+        _LOGGER.debug("start_time: %s", start_time)
+        _LOGGER.debug("end_time: %s", end_time)
+        _LOGGER.debug("chunk_size: %s", chunk_size)
+
+        if isinstance(chunk_size, str) and chunk_size == "auto":
+            chunk_size = AdaptiveChunkSize()
+        if isinstance(chunk_size, AdaptiveChunkSize):
+            if max_workers is not None:
+                raise ValueError("max_workers cannot be combined with an adaptive chunk_size")
+            # checks the range, the chunks themselves are sized while downloading
+            _plan_chunks(start_time, end_time)
+            query = _metric_selector(metric_name, label_config)
+            _LOGGER.debug("Prometheus Query: %s", query)
+            return self._iter_adaptive_chunks(
+                metric_name,
+                query,
+                round(start_time.timestamp()),
+                round(end_time.timestamp()),
+                chunk_size,
+                store_locally,
+                params,
+            )
+
+        chunks = _plan_chunks(start_time, end_time, chunk_size)
+        query = _metric_selector(metric_name, label_config)
         _LOGGER.debug("Prometheus Query: %s", query)
 
-        while start < end:
-            if start + chunk_seconds > end:
-                chunk_seconds = end - start
-
-            # using the query API to get raw data
-            response = self._session.request(
-                method=self._method,
-                url="{0}/api/v1/query".format(self.url),
-                params={
-                    **{
-                        "query": query + "[" + str(chunk_seconds) + "s" + "]",
-                        "time": start + chunk_seconds,
-                    },
-                    **params,
-                },
-                verify=self._session.verify,
-                headers=self.headers,
-                auth=self.auth,
-                cert=self._session.cert,
-                timeout=self._timeout,
+        def fetch_chunk(chunk):
+            chunk_end, chunk_duration = chunk
+            return self._get_metric_range_chunk(
+                metric_name, query, chunk_end, chunk_duration, store_locally, params
             )
-            if response.status_code == 200:
-                data += response.json()["data"]["result"]
-            else:
-                raise PrometheusApiClientException(
-                    "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
-                )
-            if store_locally:
-                # store it locally
-                self._store_metric_values_local(
-                    metric_name,
-                    json.dumps(response.json()["data"]["result"]),
-                    start + chunk_seconds,
-                )
 
+        return self._ordered_map(fetch_chunk, chunks, max_workers)
+
+    def _iter_adaptive_chunks(
+        self,
+        metric_name: str,
+        query: str,
+        start: int,
+        end: int,
+        chunk_size: AdaptiveChunkSize,
+        store_locally: bool,
+        params: dict,
+    ):
+        """Download ``[start, end]`` in chunks sized by ``chunk_size``, yielding them in order."""
+        chunk_seconds = chunk_size.initial_seconds
+        # the chunks never grow back past the size a failed chunk was retried with
+        ceiling = None
+        while start < end:
+            chunk_seconds = min(chunk_seconds, end - start)
+            shrunk_seconds = chunk_size.shrunk_seconds(chunk_seconds)
+            request_start = time.perf_counter()
+            try:
+                # a chunk that can be shrunk is not retried on the responses that shrink it
+                with shrinking() if shrunk_seconds is not None else nullcontext():
+                    data = self._get_metric_range_chunk(
+                        metric_name,
+                        query,
+                        start + chunk_seconds,
+                        chunk_seconds,
+                        store_locally,
+                        params,
+                    )
+            except Exception as e:
+                if shrunk_seconds is None or not is_too_large_error(e):
+                    raise
+                _LOGGER.debug(
+                    "Chunk of %ss failed (%s), retrying with %ss", chunk_seconds, e, shrunk_seconds
+                )
+                chunk_seconds = ceiling = shrunk_seconds
+                continue
+            duration = time.perf_counter() - request_start
+            samples = sum(len(series["values"]) for series in data)
             start += chunk_seconds
+            chunk_seconds = chunk_size.next_seconds(chunk_seconds, samples, duration)
+            if ceiling is not None:
+                chunk_seconds = min(chunk_seconds, ceiling)
+            _LOGGER.debug("Next chunk: %ss", chunk_seconds)
+            yield data
+
+    def _ordered_map(self, func, items: list, max_workers: int = None):
+        """
+        Lazily apply ``func`` to ``items``, yielding the results in the order of ``items``.
+
+        With ``max_workers`` set, up to that many calls run ahead concurrently in a thread
+        pool over the shared session, and the connection pool is grown to match unless the
+        session was given to the constructor.
+
+        :raises: (ValueError) Raises if ``max_workers`` is not a positive integer
+        """
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("max_workers must be a positive integer")
+
+        if max_workers is None or len(items) <= 1:
+            return map(func, items)
+
+        max_workers = min(max_workers, len(items))
+        self._ensure_pool_size(max_workers)
+        return _prefetch(func, items, max_workers)
+
+    def _get_metric_range_chunk(
+        self,
+        metric_name: str,
+        query: str,
+        chunk_end: int,
+        chunk_seconds: int,
+        store_locally: bool,
+        params: dict,
+    ):
+        r"""
+        Download a single chunk of raw metric data ending at ``chunk_end``.
+
+        :param metric_name: (str) The name of the metric, used when storing data locally
+        :param query: (str) The metric selector to download
+        :param chunk_end: (int) Unix timestamp of the end of the chunk
+        :param chunk_seconds: (int) Duration of the chunk in seconds
+        :param store_locally: (bool) If set to True, will store the chunk locally
+        :param params: (dict) Extra parameters sent along with the API request
+        :returns: (list) A list of metric data for the chunk
+        """
+        # using the query API to get raw data
+        data = self._request_data(
+            "query",
+            self._method,
+            "/api/v1/query",
+            params={
+                **{
+                    "query": query + "[" + str(chunk_seconds) + "s" + "]",
+                    "time": chunk_end,
+                },
+                **params,
+            },
+            chunk_seconds=chunk_seconds,
+        )["result"]
+        if store_locally:
+            # store it locally
+            self._store_metric_values_local(metric_name, json.dumps(data), chunk_end)
         return data
 
     def _store_metric_values_local(self, metric_name, values, end_timestamp, compressed=False):
@@ -470,27 +701,26 @@ class PrometheusConnect:
         query = str(query)
         timeout = self._timeout if timeout is None else timeout
         # using the query API to get raw data
-        response = self._session.request(
-            method=self._method,
-            url="{0}/api/v1/query".format(self.url),
+        data = self._request_data(
+            "query",
+            self._method,
+            "/api/v1/query",
             params={**{"query": query}, **params},
-            verify=self._session.verify,
-            headers=self.headers,
-            auth=self.auth,
-            cert=self._session.cert,
             timeout=timeout,
-        )
-        if response.status_code == 200:
-            data = response.json()["data"]["result"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
-            )
+        )["result"]
 
         return data
 
     def custom_query_range(
-        self, query: str, start_time: datetime, end_time: datetime, step: str, params: dict = None, timeout: int = None
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        timeout: int = None,
+        max_points: int = None,
+        max_workers: int = None,
     ):
         """
         Send a query_range to a Prometheus Host.
@@ -506,7 +736,18 @@ class PrometheusConnect:
         :param params: (dict) Optional dictionary containing GET parameters to be
             sent along with the API request, such as "timeout"
         :param timeout: (Optional) A timeout (in seconds) applied to the request
-        :returns: (dict) A dict of metric data received in response of the query sent
+        :param max_points: (int) Optional maximum number of points per series requested in
+            one query. If the range holds more steps than this, it is split into step-aligned
+            sub-ranges, which are queried separately and stitched back into the same result
+            a single query would return. Prometheus refuses queries returning more than
+            ``MAX_POINTS_PER_SERIES`` points per series. Default is None, which never splits.
+        :param max_workers: (int) Optional number of sub-ranges queried concurrently when
+            the range is split. Default is None, which queries them one by one.
+
+        If the client has a ``results_cache``, the start and end are aligned to the step and
+        only the sub-ranges missing from the cache are queried.
+
+        :returns: (list) A list of metric data received in response of the query sent
         :raises:
             (RequestException) Raises an exception in case of a connection error
             (PrometheusApiClientException) Raises in case of non 200 response status code
@@ -514,27 +755,364 @@ class PrometheusConnect:
         start = round(start_time.timestamp())
         end = round(end_time.timestamp())
         params = params or {}
-        data = None
         query = str(query)
         timeout = self._timeout if timeout is None else timeout
+
+        if max_points is not None and max_points < 1:
+            raise ValueError("max_points must be a positive integer")
+
+        if self._results_cache is not None:
+            step_seconds = _duration_seconds(step)
+
+            def fetch(gap_start, gap_end):
+                sub_ranges = [(gap_start, gap_end)]
+                if max_points is not None:
+                    sub_ranges = _split_range(gap_start, gap_end, step_seconds, max_points)
+                return _merge_matrix_results(
+                    self._iter_sub_ranges(query, sub_ranges, step, params, timeout, max_workers)
+                )
+
+            return self._results_cache.query_range(
+                fetch,
+                query,
+                start,
+                end,
+                step_seconds,
+                params,
+                url=self.url,
+                identity=self._identity(),
+            )
+
+        return self._query_range_split(
+            query, start, end, step, params, timeout, max_points, max_workers
+        )
+
+    def iter_query_range(
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        timeout: int = None,
+        max_points: int = MAX_POINTS_PER_SERIES,
+        max_workers: int = None,
+    ):
+        """
+        Iterate over the result of a query_range, one step-aligned sub-range at a time.
+
+        This is the streaming counterpart of `custom_query_range`. The range is split into
+        sub-ranges of at most ``max_points`` steps, and the series of each sub-range are
+        yielded as soon as they are received.
+
+        :param query: (str) This is a PromQL query, a few examples can be found at
+            `PromQL query examples <https://prometheus.io/docs/prometheus/latest/querying/examples/>`_
+        :param start_time: (datetime) A datetime object that specifies the query range start time.
+        :param end_time: (datetime) A datetime object that specifies the query range end time.
+        :param step: (str) Query resolution step width in duration format or float number of seconds
+        :param params: (dict) Optional dictionary containing GET parameters to be
+            sent along with the API request, such as "timeout"
+        :param timeout: (Optional) A timeout (in seconds) applied to each request
+        :param max_points: (int) Maximum number of points per series requested in one query.
+            Default is ``MAX_POINTS_PER_SERIES``.
+        :param max_workers: (int) Optional number of sub-ranges queried ahead concurrently.
+        :returns: (generator) Yields a list of metric data for each sub-range, in time order
+        :raises:
+            (RequestException) Raises an exception in case of a connection error
+            (PrometheusApiClientException) Raises in case of non 200 response status code
+        """
+        start = round(start_time.timestamp())
+        end = round(end_time.timestamp())
+        timeout = self._timeout if timeout is None else timeout
+
+        if max_points is None or max_points < 1:
+            raise ValueError("max_points must be a positive integer")
+
+        sub_ranges = _split_range(start, end, _duration_seconds(step), max_points)
+        return self._iter_sub_ranges(
+            str(query), sub_ranges, step, params or {}, timeout, max_workers
+        )
+
+    def _iter_sub_ranges(self, query, sub_ranges, step, params, timeout, max_workers):
+        """Query each ``(start, end)`` sub-range, yielding the results in time order."""
+
+        def query_sub_range(sub_range):
+            return self._query_range(query, sub_range[0], sub_range[1], step, params, timeout)
+
+        return self._ordered_map(query_sub_range, sub_ranges, max_workers)
+
+    def _query_range_split(
+        self, query: str, start, end, step, params: dict, timeout, max_points=None, max_workers=None
+    ):
+        """
+        Query the range between the unix timestamps ``start`` and ``end``.
+
+        The range is queried in sub-ranges of at most ``max_points`` steps if set, and the
+        results are stitched together.
+        """
+        sub_ranges = [(start, end)]
+        if max_points is not None:
+            sub_ranges = _split_range(start, end, _duration_seconds(step), max_points)
+
+        if len(sub_ranges) == 1:
+            return self._query_range(query, start, end, step, params, timeout)
+
+        _LOGGER.debug("Splitting query_range into %d sub-ranges", len(sub_ranges))
+        return _merge_matrix_results(
+            self._iter_sub_ranges(query, sub_ranges, step, params, timeout, max_workers)
+        )
+
+    def _query_range(self, query: str, start, end, step, params: dict, timeout):
+        """Send a single request to the query_range API and return its result."""
         # using the query_range API to get raw data
-        response = self._session.request(
-            method=self._method,
-            url="{0}/api/v1/query_range".format(self.url),
+        data = self._request_data(
+            "query_range",
+            self._method,
+            "/api/v1/query_range",
             params={**{"query": query, "start": start, "end": end, "step": step}, **params},
-            verify=self._session.verify,
-            headers=self.headers,
-            auth=self.auth,
-            cert=self._session.cert,
             timeout=timeout,
+        )["result"]
+        return data
+
+    def tail(
+        self,
+        query: str,
+        step: str,
+        start_time: datetime = None,
+        oldest_data_datetime=None,
+        interval: float = None,
+        max_polls: int = None,
+        params: dict = None,
+        timeout: int = None,
+    ):
+        """
+        Follow a range query, fetching only the samples not seen yet on every poll.
+
+        Instead of querying the whole window again on every poll, the returned `MetricTail`
+        only queries the evaluation timestamps after the last one it fetched, appends the new
+        samples to a rolling `Metric` buffer per series and returns them as the delta of the
+        poll. Iterating over it polls once per step and yields the deltas,
+        ``tail.run(callback)`` calls ``callback`` with them instead.
+
+        :param query: (str) This is a PromQL query, a few examples can be found at
+            `PromQL query examples <https://prometheus.io/docs/prometheus/latest/querying/examples/>`_
+        :param step: (str) Query resolution step width in duration format or float number of seconds
+        :param start_time: (datetime) Optional start of the first poll. Default is None, which
+            only fetches the latest evaluation timestamp on the first poll.
+        :param oldest_data_datetime: (datetime|timedelta) Optional limit of the samples kept in
+            the buffers, like the ``oldest_data_datetime`` of `Metric`
+        :param interval: (float) Optional number of seconds between two polls when iterating.
+            Default is None, which polls once per step.
+        :param max_polls: (int) Optional number of polls after which the iteration stops.
+            Default is None, which iterates forever.
+        :param params: (dict) Optional dictionary containing GET parameters to be
+            sent along with the API requests, such as "timeout"
+        :param timeout: (Optional) A timeout (in seconds) applied to each request
+        :returns: (MetricTail) The tail of the query, no request is sent until it is polled
+        """
+        from .tail import MetricTail
+
+        return MetricTail(
+            self,
+            query,
+            step,
+            start_time=start_time,
+            oldest_data_datetime=oldest_data_datetime,
+            interval=interval,
+            max_polls=max_polls,
+            params=params,
+            timeout=self._timeout if timeout is None else timeout,
         )
-        if response.status_code == 200:
-            data = response.json()["data"]["result"]
+
+    def custom_query_many(
+        self,
+        queries,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        step: str = None,
+        params: dict = None,
+        timeout: int = None,
+        max_workers: int = DEFAULT_POOLSIZE,
+    ):
+        """
+        Send many independent queries to a Prometheus Host concurrently.
+
+        The queries are sent as instant queries with `custom_query`, or as range queries with
+        `custom_query_range` if ``start_time``, ``end_time`` and ``step`` are given. At most
+        ``max_workers`` queries are in flight at the same time over the shared session.
+
+        A failing query does not abort the batch: the exception it raised is returned as its
+        result instead.
+
+        :param queries: (list|dict) A list of PromQL queries, or a dict mapping names to
+            PromQL queries
+        :param start_time: (datetime) Optional range start time for range queries
+        :param end_time: (datetime) Optional range end time for range queries
+        :param step: (str) Optional query resolution step width for range queries
+        :param params: (dict) Optional dictionary containing GET parameters to be
+            sent along with each API request
+        :param timeout: (Optional) A timeout (in seconds) applied to each request
+        :param max_workers: (int) Maximum number of queries in flight at the same time.
+            Default is the size of the connection pool.
+        :returns: (dict) A dict mapping each query (or its name, if ``queries`` is a dict) to
+            the list of metric data it returned, or to the exception it raised
+        :raises:
+            (TypeError) Raises if ``queries`` is neither a list nor a dict
+
+        Example Usage:
+          .. code-block:: python
+
+              prom = PrometheusConnect()
+
+              results = prom.custom_query_many(
+                  {"up": "up", "load": "node_load1"}, max_workers=16
+              )
+              for name, result in results.items():
+                  if isinstance(result, Exception):
+                      print(name, "failed:", result)
+        """
+        if isinstance(queries, dict):
+            items = list(queries.items())
+        elif isinstance(queries, (list, tuple)):
+            items = [(query, query) for query in queries]
         else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
+            raise TypeError("queries can only be of type list or dict")
+
+        is_range = start_time is not None or end_time is not None or step is not None
+        if is_range and (start_time is None or end_time is None or step is None):
+            raise ValueError("start_time, end_time and step are required for range queries")
+
+        def run(item):
+            query = item[1]
+            try:
+                if is_range:
+                    return self.custom_query_range(
+                        query, start_time, end_time, step, params=params, timeout=timeout
+                    )
+                return self.custom_query(query, params=params, timeout=timeout)
+            except Exception as exc:
+                # capture the error, so that one failing query does not abort the batch
+                _LOGGER.debug("Query %r failed: %s", query, exc)
+                return exc
+
+        results = self._ordered_map(run, items, max_workers)
+        return {key: result for (key, _), result in zip(items, results)}
+
+    def remote_read(
+        self,
+        metric_name: str = None,
+        label_config: dict = None,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        matchers: list = None,
+        streamed: bool = True,
+        as_dataframe: bool = False,
+        timeout: int = None,
+        verify_checksums: bool = None,
+    ):
+        """
+        Read raw samples with the remote read API.
+
+        The remote read endpoint (``/api/v1/read``) speaks snappy compressed protobuf instead of
+        JSON, and with ``streamed=True`` returns the samples as XOR compressed chunks, which are
+        decoded straight into numpy arrays. For bulk exports of raw data the response is
+        several times smaller than the JSON of `get_metric_range_data`, and decoding it takes
+        about as long as decoding the JSON, less for regularly scraped series. The remote read
+        endpoint must be enabled on the Prometheus host, which is the default.
+
+        :param metric_name: (str) Optional name of the metric to read
+        :param label_config: (dict) Optional dictionary of label names and values to match
+        :param start_time: (datetime) Start of the range. Default is 10 minutes before ``end_time``
+        :param end_time: (datetime) End of the range. Default is now
+        :param matchers: (list) Optional additional ``(name, op, value)`` label matchers, where
+            ``op`` is one of "=", "!=", "=~" and "!~"
+        :param streamed: (bool) Request the streamed XOR chunks response type. Servers that do
+            not support it answer with samples, which are decoded as well. Default is True.
+        :param as_dataframe: (bool) Return a DataFrame in the `MetricRangeDataFrame` layout
+            instead of a list of series
+        :param timeout: (Optional) A timeout (in seconds) applied to the request
+        :param verify_checksums: (bool) Whether to verify the checksums of the streamed frames.
+            Default is None, which verifies them if the ``crc32c`` package is installed.
+        :returns: (list) A list of ``{"metric": dict, "timestamps": ndarray, "values": ndarray}``
+            series with timestamps in seconds since the epoch, or a DataFrame indexed by
+            timestamp if ``as_dataframe`` is True
+        :raises:
+            (RequestException) Raises an exception in case of a connection error
+            (PrometheusApiClientException) Raises in case of non 200 response status code
+
+        Example Usage:
+          .. code-block:: python
+
+              prom = PrometheusConnect()
+
+              series = prom.remote_read(
+                  "node_cpu_seconds_total",
+                  label_config={"mode": "idle"},
+                  start_time=parse_datetime("1d"),
+                  end_time=parse_datetime("now"),
+              )
+              for s in series:
+                  print(s["metric"], s["timestamps"][:3], s["values"][:3])
+        """
+        from . import remote_read
+
+        end_time = end_time or datetime.now()
+        start_time = start_time or end_time - timedelta(minutes=10)
+        start_ms = int(start_time.timestamp() * 1000)
+        end_ms = int(end_time.timestamp() * 1000)
+
+        all_matchers = []
+        if metric_name:
+            all_matchers.append(("__name__", "=", metric_name))
+        all_matchers += [(name, "=", value) for name, value in (label_config or {}).items()]
+        all_matchers += list(matchers or [])
+        if not all_matchers:
+            raise ValueError("remote_read needs a metric_name, label_config or matchers")
+
+        selector = ",".join("{}{}{!r}".format(*matcher) for matcher in all_matchers)
+        with self._instrument("read", "POST", "/api/v1/read", query="{" + selector + "}") as info:
+            response = self._send(
+                info,
+                timeout=timeout,
+                data=remote_read.encode_read_request(all_matchers, start_ms, end_ms, streamed),
+                headers={**(self.headers or {}), **remote_read.REQUEST_HEADERS},
+                stream=True,
             )
-        return data
+            with response:
+                if response.status_code != 200:
+                    raise PrometheusApiClientException(
+                        "HTTP Status Code {} ({!r})".format(
+                            response.status_code, response.content
+                        ),
+                        status_code=response.status_code,
+                    )
+                # the body is read while it is decoded, so the decode time includes the transfer
+                start = time.perf_counter()
+                content_type = response.headers.get("Content-Type", "")
+                if content_type.startswith(remote_read.STREAMED_CONTENT_TYPE):
+                    info.response_bytes = 0
+
+                    def counted(chunks):
+                        for chunk in chunks:
+                            info.response_bytes += len(chunk)
+                            yield chunk
+
+                    series = remote_read.decode_streamed_response(
+                        counted(response.iter_content(chunk_size=64 * 1024)),
+                        start_ms,
+                        end_ms,
+                        verify_checksums,
+                    )
+                else:
+                    info.response_bytes = len(response.content)
+                    series = remote_read.decode_read_response(response.content)
+                info.decode_time = time.perf_counter() - start
+            info.series = len(series)
+            info.samples = sum(len(s["values"]) for s in series)
+
+        if as_dataframe:
+            return remote_read.to_dataframe(series)
+        return series
 
     def get_metric_aggregation(
         self,
@@ -544,6 +1122,12 @@ class PrometheusConnect:
         end_time: datetime = None,
         step: str = "15",
         params: dict = None,
+        max_points: int = None,
+        max_workers: int = None,
+        pushdown: bool = False,
+        by=None,
+        exact_limit: int = None,
+        compression: float = 200,
     ):
         """
         Get aggregations on metric values received from PromQL query.
@@ -555,6 +1139,8 @@ class PrometheusConnect:
 
         The received query is passed to the custom_query_range method which returns
         the result of the query and the values are extracted from the result.
+        The values are aggregated by a `StreamingAggregator`. The percentiles are exact, unless
+        ``exact_limit`` is set.
 
         :param query: (str) This is a PromQL query, a few examples can be found at
           `PromQL query examples <https://prometheus.io/docs/prometheus/latest/querying/examples/>`_
@@ -565,11 +1151,46 @@ class PrometheusConnect:
         :param step: (str) Query resolution step width in duration format or float number of seconds
         :param params: (dict) Optional dictionary containing GET parameters to be
           sent along with the API request, such as "timeout"
-          Available operations - sum, max, min, variance, nth percentile, deviation
+          Available operations - sum, max, min, count, variance, nth percentile, deviation
           and average.
-
-        :returns: (dict) A dict of aggregated values received in response to the operations
-          performed on the values for the query sent.
+        :param max_points: (int) Optional maximum number of points per series requested in
+          one query. If set, the range is queried in sub-ranges like with `iter_query_range`,
+          and the values of each sub-range are aggregated as soon as it is received, so the
+          memory used does not grow with the range, unless exact percentiles are computed.
+          Default is None, which sends one query.
+        :param max_workers: (int) Optional number of sub-ranges queried ahead concurrently,
+          or of server-side aggregations sent concurrently with ``pushdown``.
+        :param pushdown: (bool) Compute the aggregations on the Prometheus server, so that only
+          a few values are downloaded instead of every sample. The samples of the range are
+          selected with a ``(query)[range:step]`` subquery evaluated at ``end_time``, and
+          aggregated with ``sum_over_time``, ``max_over_time``, ``min_over_time``,
+          ``count_over_time`` and ``stdvar_over_time`` across the series. Percentiles cannot
+          be computed over all the series on the server, if any is requested the aggregation
+          falls back to the client. Default is False.
+
+          The count, min and max are the same as on the client, the sum, average, variance and
+          deviation differ by floating point rounding only (relative difference below 1e-9).
+          The server evaluates the subquery at multiples of the step, which are the timestamps
+          of the range query when ``start_time`` is a multiple of the step, otherwise they
+          are shifted by less than one step. The server skips NaN samples in max and min.
+          Not used with ``by``.
+        :param by: (list|str) Optional names of labels to aggregate the series by, like the
+          ``by`` clause of a PromQL aggregation, or "series" to aggregate every series on its
+          own. The operations are computed for every group in one vectorized pass, and a
+          DataFrame is returned, with one row per group indexed by the labels and one column
+          per operation. The values of all the sub-ranges are kept until they are reduced.
+          Default is None, which aggregates all the values together.
+        :param exact_limit: (int) Optional number of values past which the percentiles are
+          estimated with a t-digest instead of keeping every value. The rank of an estimated
+          percentile is then off by at most 1.6% of the values at the median and 0.3% at the
+          99th percentile with the default compression, see `TDigest` for the bound.
+          Default is None, which keeps the percentiles exact.
+          Not used with ``by``, which keeps every value.
+        :param compression: (float) The accuracy of the t-digest once ``exact_limit`` values
+          are exceeded, higher is more accurate and uses more memory. Default is 200.
+
+        :returns: (dict|DataFrame) A dict of aggregated values received in response to the
+          operations performed on the values for the query sent, or a DataFrame with ``by``.
 
         Example output:
           .. code-block:: python
@@ -579,64 +1200,110 @@ class PrometheusConnect:
                 'max': 6.009373
              }
         """
-        try:
-            import numpy
-        except ImportError as e:
-            raise ImportError(
-                "NumPy is required for metric aggregation operations. "
-                "Please install it with: pip install prometheus-api-client[analytics] "
-                "or pip install prometheus-api-client[all]"
-            ) from e
-        
+        from .aggregation import StreamingAggregator, aggregate_by
+
         if not isinstance(operations, list):
             raise TypeError("Operations can be only of type list")
         if len(operations) == 0:
             _LOGGER.debug("No operations found to perform")
             return None
-        aggregated_values = {}
-        query_values = []
-        if start_time is not None and end_time is not None:
-            data = self.custom_query_range(
-                query=query, params=params, start_time=start_time, end_time=end_time, step=step
+        if pushdown:
+            if by is None and all(operation in PUSHDOWN_OPERATIONS for operation in operations):
+                return self._pushdown_aggregation(
+                    query, operations, start_time, end_time, step, params, max_workers
+                )
+            _LOGGER.debug(
+                "Operations %s cannot be pushed down, aggregating on the client", operations
             )
-            for result in data:
-                values = result["values"]
-                for val in values:
-                    query_values.append(float(val[1]))
+        if start_time is not None and end_time is not None:
+            if max_points is None:
+                data = self.custom_query_range(
+                    query=query, params=params, start_time=start_time, end_time=end_time, step=step
+                )
+                results = [data]
+            else:
+                results = self.iter_query_range(
+                    query,
+                    start_time,
+                    end_time,
+                    step,
+                    params=params,
+                    max_points=max_points,
+                    max_workers=max_workers,
+                )
         else:
-            data = self.custom_query(query, params)
-            for result in data:
-                val = float(result["value"][1])
-                query_values.append(val)
+            results = [self.custom_query(query, params)]
+
+        if by is not None:
+            aggregated_values = aggregate_by(results, by, operations)
+            if aggregated_values is None:
+                _LOGGER.debug("No values found for given query.")
+            return aggregated_values
+
+        aggregator = StreamingAggregator(
+            percentiles=any(operation.startswith("percentile") for operation in operations),
+            compression=compression,
+            exact_limit=exact_limit,
+        )
+        for data in results:
+            aggregator.update_result(data)
 
-        if len(query_values) == 0:
+        aggregated_values = aggregator.result(operations)
+        if aggregated_values is None:
+            _LOGGER.debug("No values found for given query.")
+        return aggregated_values
+
+    def _pushdown_aggregation(
+        self, query, operations, start_time, end_time, step, params, max_workers
+    ):
+        """Compute the ``PUSHDOWN_OPERATIONS`` among ``operations`` on the Prometheus server."""
+        params = params or {}
+        window = None
+        if start_time is not None and end_time is not None:
+            start = round(start_time.timestamp())
+            end = round(end_time.timestamp())
+            step_ms = round(_duration_seconds(step) * 1000)
+            # the subquery range excludes its start, it reaches half a step before the start
+            # of the range so that a sample at the start is included
+            window = "{}ms:{}ms".format((end - start) * 1000 + step_ms // 2, step_ms)
+            params = {**params, "time": end}
+
+        queries = _pushdown_queries(str(query), operations, window)
+        results = dict(
+            zip(
+                queries,
+                self._ordered_map(
+                    lambda expression: self.custom_query(expression, params),
+                    list(queries.values()),
+                    max_workers,
+                ),
+            )
+        )
+        if not any(results.values()):
             _LOGGER.debug("No values found for given query.")
             return None
 
-        np_array = numpy.array(query_values)
+        def scalar(part):
+            return float(results[part][0]["value"][1])
+
+        aggregated_values = {}
         for operation in operations:
-            if operation == "sum":
-                aggregated_values["sum"] = numpy.sum(np_array)
-            elif operation == "max":
-                aggregated_values["max"] = numpy.max(np_array)
-            elif operation == "min":
-                aggregated_values["min"] = numpy.min(np_array)
+            if operation in ("sum", "max", "min", "count"):
+                aggregated_values[operation] = scalar(operation)
             elif operation == "average":
-                aggregated_values["average"] = numpy.average(np_array)
-            elif operation.startswith("percentile"):
-                percentile = float(operation.split("_")[1])
-                aggregated_values["percentile_" + str(percentile)] = numpy.percentile(
-                    query_values, percentile
-                )
-            elif operation == "deviation":
-                aggregated_values["deviation"] = numpy.std(np_array)
-            elif operation == "variance":
-                aggregated_values["variance"] = numpy.var(np_array)
+                aggregated_values[operation] = scalar("sum") / scalar("count")
             else:
-                raise TypeError("Invalid operation: " + operation)
+                if window is None:
+                    variance = scalar("stdvar")
+                else:
+                    variance = _pooled_variance(
+                        results["series_count"], results["series_avg"], results["series_stdvar"]
+                    )
+                aggregated_values[operation] = (
+                    variance if operation == "variance" else math.sqrt(variance)
+                )
         return aggregated_values
 
-
     def get_scrape_pools(self) -> list[str]:
         """
         Get a list of all scrape pools in activeTargets.
@@ -664,24 +1331,7 @@ class PrometheusConnect:
         if scrape_pool:
             params['scrapePool'] = scrape_pool
 
-        response = self._session.request(
-            method="GET",
-            url="{0}/api/v1/targets".format(self.url),
-            verify=self._session.verify,
-            headers=self.headers,
-            params=params,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
-        )
-
-        if response.status_code == 200:
-            return response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content)
-            )
+        return self._request_data("targets", "GET", "/api/v1/targets", params=params)
 
     def get_target_metadata(self, target: dict[str, str], metric: str = None):
         """
@@ -705,25 +1355,10 @@ class PrometheusConnect:
                 ",".join(f'{k}="{v}"' for k, v in target.items()) + "}"
             params['match_target'] = match_target
 
-        response = self._session.request(
-            method="GET",
-            url="{0}/api/v1/targets/metadata".format(self.url),
-            verify=self._session.verify,
-            headers=self.headers,
-            params=params,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
+        return self._request_data(
+            "targets_metadata", "GET", "/api/v1/targets/metadata", params=params
         )
 
-        if response.status_code == 200:
-            return response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content)
-            )
-
     def get_metric_metadata(self, metric: str, limit: int = None, limit_per_metric: int = None):
         """
         Get metadata about metrics.
@@ -748,31 +1383,220 @@ class PrometheusConnect:
         if limit_per_metric:
             params['limit_per_metric'] = limit_per_metric
 
-        response = self._session.request(
-            method="GET",
-            url="{0}/api/v1/metadata".format(self.url),
-            verify=self._session.verify,
-            headers=self.headers,
-            params=params,
-            auth=self.auth,
-            cert=self._session.cert,
-            timeout=self._timeout,
-        )
+        data = self._request_data("metadata", "GET", "/api/v1/metadata", params=params)
+        formatted_data = []
+        for k, v in data.items():
+            for v_ in v:
+                formatted_data.append({
+                    "metric_name": k,
+                    "type": v_.get('type', 'unknown'),
+                    "help": v_.get('help', ''),
+                    "unit": v_.get('unit', '')
+                })
+        return formatted_data
+
+
+def _metric_selector(metric_name: str, label_config: dict = None) -> str:
+    """Build a PromQL series selector from a metric name and a label configuration."""
+    if label_config:
+        label_list = [str(key + "=" + "'" + label_config[key] + "'") for key in label_config]
+        return metric_name + "{" + ",".join(label_list) + "}"
+    return metric_name
+
 
-        if response.status_code == 200:
-            data = response.json()["data"]
-            formatted_data = []
-            for k, v in data.items():
-                for v_ in v:
-                    formatted_data.append({
-                        "metric_name": k,
-                        "type": v_.get('type', 'unknown'),
-                        "help": v_.get('help', ''),
-                        "unit": v_.get('unit', '')
-                    })
-            return formatted_data
+def _plan_chunks(start_time: datetime, end_time: datetime, chunk_size: timedelta = None) -> list:
+    """
+    Split ``[start_time, end_time]`` into the chunks downloaded by ``get_metric_range_data``.
+
+    :returns: (list) A list of ``(chunk_end, chunk_seconds)`` tuples in time order, where
+        ``chunk_end`` is a unix timestamp
+    :raises:
+        (TypeError) Raises if the arguments are not datetime/timedelta objects
+        (ValueError) Raises if the range is inverted or shorter than ``chunk_size``
+    """
+    if not (isinstance(start_time, datetime) and isinstance(end_time, datetime)):
+        raise TypeError("start_time and end_time can only be of type datetime.datetime")
+
+    if not chunk_size:
+        chunk_size = end_time - start_time
+    if not isinstance(chunk_size, timedelta):
+        raise TypeError("chunk_size can only be of type datetime.timedelta")
+
+    start = round(start_time.timestamp())
+    end = round(end_time.timestamp())
+
+    if end_time < start_time:
+        raise ValueError("end_time must not be before start_time")
+
+    if (end_time - start_time).total_seconds() < chunk_size.total_seconds():
+        raise ValueError("specified chunk_size is too big")
+    chunk_seconds = round(chunk_size.total_seconds())
+
+    chunks = []
+    while start < end:
+        if start + chunk_seconds > end:
+            chunk_seconds = end - start
+        chunks.append((start + chunk_seconds, chunk_seconds))
+        start += chunk_seconds
+    return chunks
+
+
+_DURATION_RE = re.compile(r"(\d+)(ms|s|m|h|d|w|y)")
+_DURATION_UNITS = {
+    "ms": 0.001,
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 60 * 60 * 24,
+    "w": 60 * 60 * 24 * 7,
+    "y": 60 * 60 * 24 * 365,
+}
+
+
+def _prefetch(func, items: list, max_workers: int):
+    """
+    Apply ``func`` to ``items`` from a thread pool, yielding the results in order.
+
+    At most ``max_workers`` results are computed ahead of the consumer, which bounds the
+    memory held by results that have not been consumed yet.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        remaining = iter(items)
+        pending = deque(executor.submit(func, item) for item in islice(remaining, max_workers))
+        while pending:
+            result = pending.popleft().result()
+            for item in islice(remaining, 1):
+                pending.append(executor.submit(func, item))
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _duration_seconds(duration) -> float:
+    """
+    Convert a PromQL duration (e.g. ``"1h30m"``) or a number of seconds into seconds.
+
+    :raises: (ValueError) Raises if the duration cannot be parsed or is not positive
+    """
+    if isinstance(duration, timedelta):
+        seconds = duration.total_seconds()
+    else:
+        try:
+            seconds = float(duration)
+        except (TypeError, ValueError):
+            duration = str(duration)
+            parts = _DURATION_RE.findall(duration)
+            if not parts or "".join(n + u for n, u in parts) != duration:
+                raise ValueError("invalid duration: {!r}".format(duration))
+            seconds = sum(int(n) * _DURATION_UNITS[u] for n, u in parts)
+    if seconds <= 0:
+        raise ValueError("duration must be positive: {!r}".format(duration))
+    return seconds
+
+
+def _split_range(start, end, step_seconds: float, max_points: int) -> list:
+    """
+    Split the evaluation steps of a range query into sub-ranges of at most ``max_points`` steps.
+
+    Every sub-range starts on one of the evaluation timestamps of ``[start, end]``, so the
+    sub-range queries evaluate exactly the timestamps the full range query would.
+
+    :returns: (list) A list of ``(start, end)`` tuples in time order
+    """
+    if end < start:
+        return [(start, end)]
+    num_points = int((end - start) // step_seconds) + 1
+    sub_ranges = []
+    for first in range(0, num_points, max_points):
+        last = min(first + max_points, num_points) - 1
+        sub_ranges.append((start + first * step_seconds, start + last * step_seconds))
+    # keep the original bounds on the outermost sub-ranges, so an unsplit range is sent as is
+    sub_ranges[0] = (start, sub_ranges[0][1])
+    sub_ranges[-1] = (sub_ranges[-1][0], end)
+    return sub_ranges
+
+
+def _series_key(metric: dict) -> tuple:
+    """Return a hashable key identifying a series by its label set."""
+    return tuple(sorted(metric.items()))
+
+
+def _pushdown_queries(query: str, operations: list, window: str = None) -> dict:
+    """
+    Rewrite aggregation operations into PromQL expressions computing their parts.
+
+    :param query: (str) The PromQL query whose values are aggregated
+    :param operations: (list) Operations among ``PUSHDOWN_OPERATIONS``
+    :param window: (str) The ``range:step`` of a subquery selecting the samples of a range
+        query, or None to aggregate the instant vector of ``query``
+    :returns: (dict) A dict mapping the name of each part to its expression
+    """
+    if window is None:
+        selection = "({})".format(query)
+    else:
+        # series of different metrics with otherwise equal labels would collide once the
+        # *_over_time functions drop their name, so it is kept in another label
+        selection = '(label_replace({}, "{}", "$1", "__name__", "(.*)"))[{}]'.format(
+            query, PUSHDOWN_NAME_LABEL, window
+        )
+    parts = {}
+    for operation in operations:
+        if operation == "average":
+            needed = ["sum", "count"]
+        elif operation in ("variance", "deviation"):
+            if window is None:
+                needed = ["stdvar"]
+            else:
+                needed = ["series_count", "series_avg", "series_stdvar"]
         else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content)
-            )
+            needed = [operation]
+        for part in needed:
+            if part in parts:
+                continue
+            if part.startswith("series_"):
+                # one value per series, combined on the client
+                parts[part] = "{}_over_time({})".format(part[len("series_"):], selection)
+            elif window is None:
+                parts[part] = "{}{}".format(part, selection)
+            else:
+                # the counts of the series add up, the other aggregations keep their name
+                outer = "sum" if part == "count" else part
+                parts[part] = "{}({}_over_time({}))".format(outer, part, selection)
+    return parts
+
+
+def _pooled_variance(counts: list, averages: list, variances: list) -> float:
+    """Return the variance of the samples of several series, from the statistics of each."""
+    by_series: dict = {}
+    for name, result in (("count", counts), ("avg", averages), ("stdvar", variances)):
+        for series in result:
+            stats = by_series.setdefault(_series_key(series["metric"]), {})
+            stats[name] = float(series["value"][1])
+    total = sum(stats["count"] for stats in by_series.values())
+    mean = sum(stats["count"] * stats["avg"] for stats in by_series.values()) / total
+    return (
+        sum(
+            stats["count"] * (stats["stdvar"] + (stats["avg"] - mean) ** 2)
+            for stats in by_series.values()
+        )
+        / total
+    )
+
+
+def _merge_matrix_results(results) -> list:
+    """
+    Stitch the results of several range queries over consecutive time ranges together.
+
+    The ``values`` of series with the same label set are concatenated in the order of
+    ``results``, and series are returned in the order they first appear.
+    """
+    merged: dict = {}
+    for result in results:
+        for series in result:
+            key = _series_key(series["metric"])
+            if key in merged:
+                merged[key]["values"].extend(series["values"])
+            else:
+                merged[key] = {"metric": series["metric"], "values": list(series["values"])}
+    return list(merged.values())
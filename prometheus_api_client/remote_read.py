@@ -0,0 +1,462 @@
+"""A client for the Prometheus remote read API (snappy compressed protobuf)."""
+import struct
+from typing import Callable, Optional
+
+try:
+    import numpy
+except ImportError as e:
+    raise ImportError(
+        "NumPy is required for remote read. "
+        "Please install it with: pip install prometheus-api-client[remote-read] "
+        "or pip install prometheus-api-client[all]"
+    ) from e
+
+try:
+    from cramjam import snappy as _snappy
+
+    _snappy_compress = _snappy.compress_raw
+    _snappy_decompress = _snappy.decompress_raw
+except ImportError:
+    try:
+        import snappy as _python_snappy
+
+        _snappy_compress = _python_snappy.compress
+        _snappy_decompress = _python_snappy.uncompress
+    except ImportError as e:
+        raise ImportError(
+            "cramjam or python-snappy is required for remote read. "
+            "Please install it with: pip install prometheus-api-client[remote-read] "
+            "or pip install prometheus-api-client[all]"
+        ) from e
+
+try:
+    import crc32c
+
+    _crc32c: Optional[Callable[[bytes], int]] = crc32c.crc32c
+except ImportError:
+    _crc32c = None
+
+from .exceptions import PrometheusApiClientException
+
+# prometheus.ReadRequest.ResponseType
+SAMPLES = 0
+STREAMED_XOR_CHUNKS = 1
+
+# prometheus.LabelMatcher.Type
+MATCHER_TYPES = {"=": 0, "!=": 1, "=~": 2, "!~": 3}
+
+# prometheus.Chunk.Encoding
+_CHUNK_XOR = 1
+
+STREAMED_CONTENT_TYPE = "application/x-streamed-protobuf"
+
+REQUEST_HEADERS = {
+    "Content-Encoding": "snappy",
+    "Content-Type": "application/x-protobuf",
+    "X-Prometheus-Remote-Read-Version": "0.1.0",
+}
+
+# protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LEN = 2
+_FIXED32 = 5
+
+
+def encode_read_request(matchers: list, start_ms: int, end_ms: int, streamed: bool = True) -> bytes:
+    """
+    Encode and snappy compress a ``prometheus.ReadRequest`` holding a single query.
+
+    :param matchers: (list) A list of ``(name, op, value)`` label matchers, where ``op`` is
+        one of "=", "!=", "=~" and "!~"
+    :param start_ms: (int) Start of the query range, in milliseconds since the epoch
+    :param end_ms: (int) End of the query range, in milliseconds since the epoch
+    :param streamed: (bool) Accept the streamed XOR chunks response type
+    :returns: (bytes) The request body
+    """
+    query = _field_varint(1, start_ms) + _field_varint(2, end_ms)
+    for name, op, value in matchers:
+        if op not in MATCHER_TYPES:
+            raise ValueError("invalid label matcher operator: {!r}".format(op))
+        matcher = (
+            _field_varint(1, MATCHER_TYPES[op])
+            + _field_bytes(2, name.encode("utf-8"))
+            + _field_bytes(3, value.encode("utf-8"))
+        )
+        query += _field_bytes(3, matcher)
+    response_types = [STREAMED_XOR_CHUNKS, SAMPLES] if streamed else [SAMPLES]
+    request = _field_bytes(1, query) + _field_bytes(2, b"".join(_varint(t) for t in response_types))
+    return bytes(_snappy_compress(request))
+
+
+def decode_read_response(body: bytes) -> list:
+    """
+    Decode a snappy compressed ``prometheus.ReadResponse`` into series of numpy arrays.
+
+    :returns: (list) A list of ``{"metric": dict, "timestamps": ndarray, "values": ndarray}``
+        series, with float64 timestamps in seconds since the epoch
+    """
+    series = _SeriesMerger()
+    for field, _, query_result in _parse(bytes(_snappy_decompress(body))):
+        if field != 1:
+            continue
+        for field, _, time_series in _parse(query_result):
+            if field != 1:
+                continue
+            labels: dict = {}
+            timestamps = []
+            values = []
+            for field, _, item in _parse(time_series):
+                if field == 1:
+                    _add_label(labels, item)
+                elif field == 2:
+                    value, timestamp = 0.0, 0
+                    for sample_field, _, sample_item in _parse(item):
+                        if sample_field == 1:
+                            value = sample_item
+                        elif sample_field == 2:
+                            timestamp = _signed(sample_item)
+                    timestamps.append(timestamp)
+                    values.append(value)
+            series.add(
+                labels, numpy.array(timestamps, dtype=numpy.int64), numpy.array(values, "f8")
+            )
+    return series.result()
+
+
+def decode_streamed_response(
+    chunks, start_ms: int = None, end_ms: int = None, verify_checksums: bool = None
+) -> list:
+    """
+    Decode a streamed response of ``prometheus.ChunkedReadResponse`` frames.
+
+    Every frame is a uvarint length, a big endian CRC32C checksum and the message. The XOR
+    chunks of each series are decoded and the samples outside of ``[start_ms, end_ms]`` are
+    dropped, since chunks are returned whole.
+
+    :param chunks: (iterable) The response body, as an iterable of bytes
+    :param start_ms: (int) Optional start of the query range, in milliseconds
+    :param end_ms: (int) Optional end of the query range, in milliseconds
+    :param verify_checksums: (bool) Whether to verify the checksum of every frame. Default is
+        None, which verifies them if the ``crc32c`` package is installed. Without it, the
+        checksums are computed in pure Python, which takes longer than decoding the frames.
+    :returns: (list) A list of ``{"metric": dict, "timestamps": ndarray, "values": ndarray}``
+        series, with float64 timestamps in seconds since the epoch
+    :raises: (PrometheusApiClientException) Raises on a corrupt frame or an unsupported chunk
+    """
+    series = _SeriesMerger()
+    if verify_checksums is None:
+        verify_checksums = _crc32c is not None
+    for frame in _iter_frames(chunks, verify_checksums):
+        for field, _, chunked_series in _parse(frame):
+            if field != 1:
+                continue
+            labels: dict = {}
+            timestamp_chunks = []
+            value_chunks = []
+            for field, _, item in _parse(chunked_series):
+                if field == 1:
+                    _add_label(labels, item)
+                elif field == 2:
+                    encoding, data = 0, b""
+                    for chunk_field, _, chunk_item in _parse(item):
+                        if chunk_field == 3:
+                            encoding = chunk_item
+                        elif chunk_field == 4:
+                            data = chunk_item
+                    if encoding != _CHUNK_XOR:
+                        raise PrometheusApiClientException(
+                            "Unsupported remote read chunk encoding {}".format(encoding)
+                        )
+                    chunk_timestamps, chunk_values = decode_xor_chunk(data)
+                    timestamp_chunks.append(chunk_timestamps)
+                    value_chunks.append(chunk_values)
+            if not timestamp_chunks:
+                continue
+            timestamps = numpy.concatenate(timestamp_chunks)
+            values = numpy.concatenate(value_chunks)
+            mask = numpy.ones(len(timestamps), dtype=bool)
+            if start_ms is not None:
+                mask &= timestamps >= start_ms
+            if end_ms is not None:
+                mask &= timestamps <= end_ms
+            series.add(labels, timestamps[mask], values[mask])
+    return series.result()
+
+
+def decode_xor_chunk(data: bytes):
+    """
+    Decode a Prometheus XOR (Gorilla) encoded chunk.
+
+    :param data: (bytes) The chunk data: a big endian uint16 sample count followed by the
+        bit stream of delta-of-delta timestamps and XOR compressed values
+    :returns: (tuple) ``(timestamps, values)`` numpy arrays, int64 milliseconds and float64
+    """
+    num_samples = int.from_bytes(data[:2], "big")
+    if num_samples == 0:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.float64)
+
+    # the first timestamp, the first value and the first delta are byte aligned
+    try:
+        timestamp, offset = _read_varint(data, 2)
+        value = int.from_bytes(data[offset : offset + 8], "big")
+        offset += 8
+        if num_samples > 1:
+            delta, offset = _read_varint(data, offset)
+    except IndexError:
+        raise PrometheusApiClientException("Unexpected end of remote read chunk") from None
+    timestamp = _signed_varint(timestamp)
+    timestamps = [timestamp]
+    values = [value]
+    append_timestamp = timestamps.append
+    append_value = values.append
+
+    # The rest of the bit stream is read through ``bits``, holding the next ``available``
+    # bits in its low bits. It is refilled 16 bytes at a time so that every sample, at most
+    # 145 bits, is read without checks. The zero padding keeps the refills within the
+    # buffer, reading past the data is detected once all samples are decoded.
+    buffer = bytes(data) + bytes(16)
+    from_bytes = int.from_bytes
+    bits = available = 0
+    leading = trailing = 0
+    for i in range(1, num_samples):
+        if available < 160:
+            bits = ((bits & ((1 << available) - 1)) << 128) | from_bytes(
+                buffer[offset : offset + 16], "big"
+            )
+            offset += 16
+            available += 128
+        if i > 1:
+            # the delta of delta is "0" when it is zero, or "10", "110", "1110" and "1111"
+            # followed by a 14, 17, 20 and 64 bit number
+            available -= 1
+            if (bits >> available) & 1:
+                if not (bits >> (available - 1)) & 1:
+                    available -= 1
+                    size = 14
+                elif not (bits >> (available - 2)) & 1:
+                    available -= 2
+                    size = 17
+                else:
+                    available -= 3
+                    size = 64 if (bits >> available) & 1 else 20
+                available -= size
+                dod = (bits >> available) & ((1 << size) - 1)
+                # negative numbers come back as high unsigned numbers
+                if size == 64:
+                    dod = _signed64(dod)
+                elif dod > (1 << (size - 1)):
+                    dod -= 1 << size
+                delta += dod
+        timestamp += delta
+        append_timestamp(timestamp)
+
+        # the value is "0" when it did not change, "10" followed by the XOR with the previous
+        # value within the last window, or "11" followed by a new window (5 bits of leading
+        # zeros, 6 bits of significant bits) and the XOR within it
+        available -= 1
+        if (bits >> available) & 1:
+            available -= 1
+            if (bits >> available) & 1:
+                available -= 11
+                window = bits >> available
+                leading = (window >> 6) & 0x1F
+                trailing = 64 - leading - ((window & 0x3F) or 64)
+            count = 64 - leading - trailing
+            available -= count
+            value ^= ((bits >> available) & ((1 << count) - 1)) << trailing
+        append_value(value)
+    if (offset - len(data)) * 8 > available:
+        raise PrometheusApiClientException("Unexpected end of remote read chunk")
+    return (
+        numpy.array(timestamps, dtype=numpy.int64),
+        numpy.array(values, dtype=numpy.uint64).view(numpy.float64),
+    )
+
+
+def to_dataframe(series: list):
+    """
+    Lay decoded series out like a `MetricRangeDataFrame`.
+
+    :param series: (list) Series as returned by `decode_read_response` or
+        `decode_streamed_response`
+    :returns: (pandas.DataFrame) A frame indexed by "timestamp" with one column per label and
+        a "value" column
+    """
+    try:
+        import pandas
+    except ImportError as e:
+        raise ImportError(
+            "Pandas is required to read remote read results as a DataFrame. "
+            "Please install it with: pip install prometheus-api-client[dataframe] "
+            "or pip install prometheus-api-client[all]"
+        ) from e
+
+    lengths = [len(s["values"]) for s in series]
+    label_names = []
+    for s in series:
+        label_names += [name for name in s["metric"] if name not in label_names]
+    columns = {
+        name: numpy.repeat(
+            numpy.array([s["metric"].get(name) for s in series], dtype=object), lengths
+        )
+        for name in label_names
+    }
+    columns["timestamp"] = pandas.to_datetime(
+        numpy.concatenate([s["timestamps"] for s in series] or [numpy.empty(0)]), unit="s"
+    )
+    columns["value"] = numpy.concatenate([s["values"] for s in series] or [numpy.empty(0)])
+    return pandas.DataFrame(columns).set_index("timestamp")
+
+
+class _SeriesMerger:
+    """Concatenate the samples of series sharing a label set, in the order they appear."""
+
+    def __init__(self):
+        self._series = {}
+
+    def add(self, labels: dict, timestamps, values) -> None:
+        key = tuple(sorted(labels.items()))
+        if key in self._series:
+            self._series[key][1].append(timestamps)
+            self._series[key][2].append(values)
+        else:
+            self._series[key] = (labels, [timestamps], [values])
+
+    def result(self) -> list:
+        return [
+            {
+                "metric": labels,
+                "timestamps": numpy.concatenate(timestamps) / 1000.0,
+                "values": numpy.concatenate(values),
+            }
+            for labels, timestamps, values in self._series.values()
+        ]
+
+
+def _iter_frames(chunks, verify_checksums: bool = True):
+    """Split a streamed remote read body into the messages of its frames."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            try:
+                size, offset = _read_varint(buffer, 0)
+            except IndexError:
+                break
+            if len(buffer) < offset + 4 + size:
+                break
+            checksum = struct.unpack(">I", buffer[offset : offset + 4])[0]
+            frame = bytes(buffer[offset + 4 : offset + 4 + size])
+            if verify_checksums and _crc32c_checksum(frame) != checksum:
+                raise PrometheusApiClientException("Remote read frame checksum mismatch")
+            del buffer[: offset + 4 + size]
+            yield frame
+    if buffer:
+        raise PrometheusApiClientException("Truncated remote read frame")
+
+
+def _parse(data: bytes):
+    """Yield the ``(field number, wire type, value)`` of every field of a protobuf message."""
+    offset = 0
+    end = len(data)
+    while offset < end:
+        key, offset = _read_varint(data, offset)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == _VARINT:
+            value, offset = _read_varint(data, offset)
+        elif wire_type == _FIXED64:
+            value = struct.unpack_from("<d", data, offset)[0]
+            offset += 8
+        elif wire_type == _LEN:
+            size, offset = _read_varint(data, offset)
+            value = data[offset : offset + size]
+            offset += size
+        elif wire_type == _FIXED32:
+            value = struct.unpack_from("<f", data, offset)[0]
+            offset += 4
+        else:
+            raise PrometheusApiClientException(
+                "Unsupported protobuf wire type {}".format(wire_type)
+            )
+        yield field, wire_type, value
+
+
+def _add_label(labels: dict, data: bytes) -> None:
+    name = value = ""
+    for field, _, item in _parse(data):
+        if field == 1:
+            name = item.decode("utf-8")
+        elif field == 2:
+            value = item.decode("utf-8")
+    labels[name] = value
+
+
+def _read_varint(data, offset: int):
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+def _varint(value: int) -> bytes:
+    # negative int64 values are encoded as their 64 bit two's complement
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field_varint(field: int, value: int) -> bytes:
+    return _varint(field << 3 | _VARINT) + _varint(value)
+
+
+def _field_bytes(field: int, value: bytes) -> bytes:
+    return _varint(field << 3 | _LEN) + _varint(len(value)) + value
+
+
+def _signed(value: int) -> int:
+    """Interpret a decoded varint as an int64."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+_signed64 = _signed
+
+
+def _signed_varint(value: int) -> int:
+    """Undo the zigzag encoding of a signed varint."""
+    return (value >> 1) ^ -(value & 1)
+
+
+def _make_crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _make_crc32c_table()
+
+
+def _crc32c_checksum(data: bytes) -> int:
+    """Compute the CRC32 (Castagnoli) checksum used by the remote read frames."""
+    if _crc32c is not None:
+        return _crc32c(data)
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
@@ -0,0 +1,225 @@
+"""An extent based results cache for range queries."""
+import json
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from .prometheus_connect import _merge_matrix_results
+
+# samples newer than this many seconds may still change, they are never cached
+MAX_FRESHNESS = 60
+
+
+class RangeResultsCache:
+    r"""
+    A client side results cache for range queries that only fetches the missing gaps.
+
+    For every query, step and set of parameters, the cache keeps the extents (time ranges)
+    it has already fetched, separately for every prometheus host and client headers and
+    auth, so clients of different hosts or tenants can share it. When a range is requested
+    again, its start and end are aligned to the step, the sub-ranges not covered by any
+    extent are fetched, spliced into the cached extents and the result is assembled from
+    the cache. A sliding window that moves
+    forward by a minute therefore only fetches the last minute. This is the idea of the
+    results cache of the Thanos/Cortex query frontend.
+
+    The cache can be shared between threads. The gaps fetched by concurrent calls for the
+    same query are spliced into the extents cached when each call completes, so none of
+    them is lost, although two calls missing the same gap both fetch it.
+
+    Because of the step alignment, the evaluation timestamps are multiples of the step,
+    which can differ from the timestamps of an uncached query with an unaligned start.
+
+    :param max_queries: (int) Maximum number of queries whose extents are kept. The least
+        recently used query is evicted when the cache is full. Default is 256.
+    :param max_freshness: (float) Samples newer than this many seconds are never cached,
+        as late scrapes may still change them. Default is ``MAX_FRESHNESS``.
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect(results_cache=RangeResultsCache())
+
+          # only the first call fetches the whole day, the next ones fetch the new minutes
+          while True:
+              data = prom.custom_query_range(
+                  "rate(node_cpu_seconds_total[5m])",
+                  start_time=datetime.now() - timedelta(days=1),
+                  end_time=datetime.now(),
+                  step="60",
+              )
+              time.sleep(60)
+    """
+
+    def __init__(self, max_queries: int = 256, max_freshness: float = MAX_FRESHNESS):
+        """Functions as a Constructor for the RangeResultsCache object."""
+        if max_queries < 1:
+            raise ValueError("max_queries must be a positive integer")
+        self.max_queries = max_queries
+        self.max_freshness = max_freshness
+        self._extents: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of cached queries."""
+        return len(self._extents)
+
+    def clear(self) -> None:
+        """Remove every cached extent."""
+        with self._lock:
+            self._extents.clear()
+
+    def extents(
+        self,
+        query: str,
+        step_seconds: float,
+        params: dict = None,
+        url: str = "",
+        identity: str = "",
+    ) -> list:
+        """Return the ``(start, end)`` extents cached for a query, in time order."""
+        key = _cache_key(query, step_seconds, params or {}, url, identity)
+        with self._lock:
+            return [(start, end) for start, end, _ in self._extents.get(key, [])]
+
+    def query_range(
+        self,
+        fetch,
+        query: str,
+        start: float,
+        end: float,
+        step_seconds: float,
+        params: dict = None,
+        url: str = "",
+        identity: str = "",
+    ) -> list:
+        """
+        Return the result of a range query, fetching only what is not cached yet.
+
+        :param fetch: (callable) Called as ``fetch(start, end)`` with step-aligned bounds for
+            every missing sub-range, returns the result of the range query over it
+        :param query: (str) The PromQL query
+        :param start: (float) Unix timestamp of the range start
+        :param end: (float) Unix timestamp of the range end
+        :param step_seconds: (float) Query resolution step in seconds
+        :param params: (dict) Other parameters of the query, part of the cache key
+        :param url: (str) The url of the prometheus host, part of the cache key
+        :param identity: (str) Digest of the headers and auth of the client, part of the
+            cache key, see `cache.client_identity`
+        :returns: (list) The result of the range query over the step-aligned range
+        """
+        key = _cache_key(query, step_seconds, params or {}, url, identity)
+        start = _align(start, step_seconds)
+        end = _align(end, step_seconds)
+        if end < start:
+            return []
+        cutoff = _align(time.time() - self.max_freshness, step_seconds)
+
+        with self._lock:
+            extents = list(self._extents.get(key, []))
+
+        fetched, fresh = [], []
+        for gap_start, gap_end in _gaps(extents, start, end, step_seconds):
+            result = fetch(gap_start, gap_end)
+            if gap_start <= cutoff:
+                fetched.append(
+                    (gap_start, min(gap_end, cutoff), _slice(result, gap_start, cutoff))
+                )
+            if gap_end > cutoff:
+                fresh.append(_slice(result, max(gap_start, cutoff + step_seconds), gap_end))
+
+        with self._lock:
+            # other calls may have cached more extents of this query meanwhile
+            extents = list(self._extents.get(key, []))
+            for extent in fetched:
+                extents = _splice(extents, extent, step_seconds)
+            self._extents[key] = extents
+            self._extents.move_to_end(key)
+            while len(self._extents) > self.max_queries:
+                self._extents.popitem(last=False)
+
+        pieces = [
+            _slice(result, max(start, ext_start), min(end, ext_end))
+            for ext_start, ext_end, result in extents
+            if ext_end >= start and ext_start <= end
+        ]
+        return _merge_matrix_results(pieces + fresh)
+
+
+def _cache_key(query: str, step_seconds: float, params: dict, url: str, identity: str) -> str:
+    normalized = sorted((str(k), str(v)) for k, v in params.items())
+    return json.dumps(
+        [url, identity, str(query), step_seconds, normalized], separators=(",", ":")
+    )
+
+
+def _align(timestamp: float, step_seconds: float) -> float:
+    """Round ``timestamp`` down to a multiple of the step."""
+    aligned = math.floor(timestamp / step_seconds) * step_seconds
+    return int(aligned) if float(aligned).is_integer() else aligned
+
+
+def _gaps(extents: list, start: float, end: float, step_seconds: float) -> list:
+    """Return the step-aligned ``(start, end)`` sub-ranges of ``[start, end]`` not in ``extents``."""
+    gaps = []
+    current = start
+    for ext_start, ext_end, _ in extents:
+        if ext_end < current:
+            continue
+        if ext_start > end:
+            break
+        if ext_start > current:
+            gaps.append((current, ext_start - step_seconds))
+        current = max(current, ext_end + step_seconds)
+    if current <= end:
+        gaps.append((current, end))
+    return gaps
+
+
+def _slice(result: list, start: float, end: float) -> list:
+    """Return the series of ``result`` restricted to the samples in ``[start, end]``."""
+    sliced = []
+    for series in result:
+        timestamps = [value[0] for value in series["values"]]
+        lo = bisect_left(timestamps, start)
+        hi = bisect_right(timestamps, end)
+        if lo < hi:
+            sliced.append({"metric": series["metric"], "values": series["values"][lo:hi]})
+    return sliced
+
+
+def _splice(extents: list, new_extent: tuple, step_seconds: float) -> list:
+    """
+    Insert ``new_extent`` into the sorted ``extents``, merging overlapping and adjacent ones.
+
+    Where extents overlap, the samples of ``new_extent`` are kept.
+    """
+    new_start, new_end, new_result = new_extent
+    before, merged, after = [], [], []
+    for extent in extents:
+        ext_start, ext_end, _ = extent
+        if ext_end + step_seconds < new_start:
+            before.append(extent)
+        elif ext_start - step_seconds > new_end:
+            after.append(extent)
+        else:
+            merged.append(extent)
+    if not merged:
+        return before + [new_extent] + after
+
+    pieces = [
+        _slice(result, ext_start, new_start - step_seconds)
+        for ext_start, _, result in merged
+        if ext_start < new_start
+    ]
+    pieces.append(new_result)
+    pieces += [
+        _slice(result, new_end + step_seconds, ext_end)
+        for _, ext_end, result in merged
+        if ext_end > new_end
+    ]
+    start = min(new_start, merged[0][0])
+    end = max(new_end, merged[-1][1])
+    return before + [(start, end, _merge_matrix_results(pieces))] + after
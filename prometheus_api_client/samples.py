@@ -0,0 +1,91 @@
+"""Vectorized decoding of the samples of Prometheus query results into numpy arrays."""
+from itertools import chain
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError as e:
+    raise ImportError(
+        "NumPy is required to decode metric samples. "
+        "Please install it with: pip install prometheus-api-client[numpy] "
+        "or pip install prometheus-api-client[all]"
+    ) from e
+
+from .exceptions import MetricValueConversionError
+
+
+def series_samples(series: dict) -> list:
+    """Return the ``[timestamp, value]`` pairs of a range (``values``) or instant (``value``) series."""
+    return series["values"] if "values" in series else [series["value"]]
+
+
+def decode_pairs(pairs: list):
+    """
+    Decode a list of ``[timestamp, value]`` pairs into float64 arrays.
+
+    :param pairs: (list) The pairs, with values given as strings or numbers
+    :returns: (tuple) ``(timestamps, values)`` float64 arrays
+    :raises: (MetricValueConversionError) Raises if a value cannot be converted to a float
+    """
+    return _decode(pairs, pairs, len(pairs))
+
+
+def decode_samples(data: list):
+    """
+    Decode the samples of a matrix or vector result in one pass.
+
+    The samples of every series are laid out back to back in two contiguous float64 arrays,
+    the samples of the i-th series are ``timestamps[offsets[i]:offsets[i + 1]]``.
+
+    :param data: (list) The series of a matrix or vector result, dicts with the keys
+        "metric" and "values" or "value"
+    :returns: (tuple) ``(timestamps, values, offsets)`` where ``offsets`` is an int64 array
+        holding one more item than there are series
+    :raises: (MetricValueConversionError) Raises if a value cannot be converted to a float
+    """
+    sample_lists, offsets = _sample_lists(data)
+    timestamps, values = _decode(
+        chain.from_iterable(sample_lists), chain.from_iterable(sample_lists), int(offsets[-1])
+    )
+    return timestamps, values, offsets
+
+
+def decode_values(data: list):
+    """
+    Decode the sample values of a matrix or vector result in one pass, without the timestamps.
+
+    :param data: (list) The series of a matrix or vector result
+    :returns: (tuple) ``(values, offsets)``, laid out like in `decode_samples`
+    :raises: (MetricValueConversionError) Raises if a value cannot be converted to a float
+    """
+    sample_lists, offsets = _sample_lists(data)
+    return _decode_values(chain.from_iterable(sample_lists), int(offsets[-1])), offsets
+
+
+def _sample_lists(data: list):
+    """Return the sample lists of the series of ``data``, and their offsets."""
+    sample_lists = [series_samples(series) for series in data]
+    offsets = numpy.zeros(len(sample_lists) + 1, dtype=numpy.int64)
+    numpy.cumsum(
+        numpy.fromiter(map(len, sample_lists), dtype=numpy.int64, count=len(sample_lists)),
+        out=offsets[1:],
+    )
+    return sample_lists, offsets
+
+
+def _decode(timestamp_pairs, value_pairs, count: int):
+    """Decode the timestamps of ``timestamp_pairs`` and the values of ``value_pairs``."""
+    timestamps = numpy.fromiter(
+        map(itemgetter(0), timestamp_pairs), dtype=numpy.float64, count=count
+    )
+    return timestamps, _decode_values(value_pairs, count)
+
+
+def _decode_values(value_pairs, count: int):
+    """Decode the values of ``value_pairs``."""
+    try:
+        return numpy.fromiter(
+            map(float, map(itemgetter(1), value_pairs)), dtype=numpy.float64, count=count
+        )
+    except (TypeError, ValueError):
+        raise MetricValueConversionError("Converting string metric value to float failed.")
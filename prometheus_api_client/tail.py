@@ -0,0 +1,291 @@
+"""Incremental polling of a range query, fetching only the samples not seen yet."""
+import asyncio
+import datetime
+import math
+import time
+from typing import Dict, Optional
+
+try:
+    import pandas
+except ImportError as e:
+    raise ImportError(
+        "Pandas is required for MetricTail class. "
+        "Please install it with: pip install prometheus-api-client[dataframe] "
+        "or pip install prometheus-api-client[all]"
+    ) from e
+
+from .metric import Metric
+from .samples import decode_samples
+
+
+class MetricTail:
+    r"""
+    Follow a range query, fetching only the samples newer than the last ones seen.
+
+    Every poll queries the evaluation timestamps between the last one already fetched and
+    now, instead of the whole window again. The evaluation timestamps are aligned to
+    multiples of the step. The new samples of each series are appended to a rolling `Metric`
+    buffer trimmed by ``oldest_data_datetime``, and returned as the delta of the poll. A
+    series that has no sample within ``oldest_data_datetime`` anymore is dropped.
+
+    A tail is created by `PrometheusConnect.tail` or `AsyncPrometheusConnect.tail`. With
+    the former, it is polled with `poll` or iterated over, with the latter with `apoll` or
+    ``async for``. Each iteration waits until the next poll is due and yields the delta.
+
+    :param prom: (PrometheusConnect|AsyncPrometheusConnect) The client sending the queries
+    :param query: (str) The PromQL query to follow
+    :param step: (str|float|timedelta) Query resolution step width in duration format or
+        float number of seconds
+    :param start_time: (datetime) Optional start of the first poll. Default is None, which
+        only fetches the latest evaluation timestamp on the first poll.
+    :param oldest_data_datetime: (datetime|timedelta) Optional limit of the samples kept in
+        the buffers, like the ``oldest_data_datetime`` of `Metric`
+    :param interval: (float) Optional number of seconds between two polls when iterating.
+        Default is None, which polls once per step.
+    :param max_polls: (int) Optional number of polls after which the iteration stops.
+        Default is None, which iterates forever.
+    :param params: (dict) Optional dictionary containing GET parameters to be
+        sent along with the API requests, such as "timeout"
+    :param timeout: (Optional) A timeout (in seconds) applied to each request
+
+    Example Usage:
+      .. code-block:: python
+
+          prom = PrometheusConnect()
+          tail = prom.tail(
+              "rate(node_cpu_seconds_total[5m])",
+              step="15",
+              oldest_data_datetime=datetime.timedelta(hours=1),
+          )
+          for delta in tail:
+              # delta holds a Metric with the new samples of every series that got some
+              ...
+          tail.metrics  # the last hour of every series
+
+          # or, with an AsyncPrometheusConnect
+          async for delta in async_prom.tail("up", step="15"):
+              ...
+    """
+
+    def __init__(
+        self,
+        prom,
+        query: str,
+        step,
+        start_time: datetime.datetime = None,
+        oldest_data_datetime=None,
+        interval: float = None,
+        max_polls: int = None,
+        params: dict = None,
+        timeout: int = None,
+    ):
+        """Functions as a Constructor for the MetricTail object."""
+        from .prometheus_connect import _duration_seconds
+
+        if not isinstance(
+            oldest_data_datetime, (datetime.datetime, datetime.timedelta, type(None))
+        ):
+            raise TypeError(
+                "oldest_data_datetime can only be datetime.datetime/ datetime.timedelta or None"
+            )
+        if max_polls is not None and max_polls < 0:
+            raise ValueError("max_polls must be a non-negative integer")
+
+        self.query = str(query)
+        self.step = step
+        self.step_seconds = _duration_seconds(step)
+        self.oldest_data_datetime = oldest_data_datetime
+        self.interval = self.step_seconds if interval is None else interval
+        self.max_polls = max_polls
+        self.polls = 0
+        self._prom = prom
+        self._params = params
+        self._timeout = timeout
+        self._start = None if start_time is None else self._align_up(start_time.timestamp())
+        # the last evaluation timestamp fetched
+        self.last_timestamp: Optional[float] = None
+        self._buffers: Dict[frozenset, Metric] = {}
+        self._last_seen: Dict[frozenset, float] = {}
+
+    def __len__(self):
+        """Return the number of series followed."""
+        return len(self._buffers)
+
+    @property
+    def metrics(self) -> list:
+        """Return the rolling `Metric` buffer of every series followed."""
+        return list(self._buffers.values())
+
+    def next_range(self, now: float = None):
+        """
+        Return the range of evaluation timestamps that the next poll fetches.
+
+        :param now: (float) Optional current unix time. Default is None, which uses the clock.
+        :returns: (tuple) The ``(start, end)`` unix timestamps, or None if no new evaluation
+            timestamp is due yet
+        """
+        now = time.time() if now is None else now
+        end = math.floor(now / self.step_seconds) * self.step_seconds
+        if self.last_timestamp is not None:
+            start = self.last_timestamp + self.step_seconds
+        elif self._start is not None:
+            start = self._start
+        else:
+            start = end
+        if start > end:
+            return None
+        return start, end
+
+    def update(self, data: list, end: float) -> list:
+        """
+        Append the result of a poll to the buffers and return its delta.
+
+        The samples at or before the last one seen for their series are ignored.
+
+        :param data: (list) The matrix result of the range query of the poll
+        :param end: (float) The last evaluation timestamp of the poll
+        :returns: (list) A `Metric` holding the new samples of each series that got some
+        """
+        self.polls += 1
+        self.last_timestamp = end
+        timestamps, values, offsets = decode_samples(data)
+        datetimes = pandas.to_datetime(timestamps, unit="s").values
+        delta = []
+        for position, series in enumerate(data):
+            key = frozenset(series["metric"].items())
+            first, last = offsets[position], offsets[position + 1]
+            last_seen = self._last_seen.get(key)
+            if last_seen is not None:
+                first += timestamps[first:last].searchsorted(last_seen, side="right")
+            if first == last:
+                continue
+            self._last_seen[key] = timestamps[last - 1]
+
+            new_samples = Metric._from_samples(
+                series["metric"], datetimes[first:last], values[first:last]
+            )
+            delta.append(new_samples)
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = Metric._from_samples(
+                    series["metric"], datetimes[first:first], values[first:first]
+                )
+                buffer.oldest_data_datetime = self.oldest_data_datetime
+                self._buffers[key] = buffer
+            # the new samples come after the buffered ones, they are appended in place
+            buffer += new_samples
+        self._evict(end)
+        return delta
+
+    def _evict(self, end: float) -> None:
+        """Drop the series without a sample newer than ``oldest_data_datetime``."""
+        if self.oldest_data_datetime is None:
+            return
+        if isinstance(self.oldest_data_datetime, datetime.timedelta):
+            oldest = end - abs(self.oldest_data_datetime).total_seconds()
+        else:
+            oldest = self.oldest_data_datetime.timestamp()
+        for key in [key for key, last_seen in self._last_seen.items() if last_seen < oldest]:
+            del self._last_seen[key]
+            del self._buffers[key]
+
+    def _align_up(self, timestamp: float) -> float:
+        """Return the first evaluation timestamp at or after ``timestamp``."""
+        return math.ceil(timestamp / self.step_seconds) * self.step_seconds
+
+    def _query_args(self, start: float, end: float) -> dict:
+        """
+        Return the arguments of the range query of a poll.
+
+        The unix timestamps are sent as they are, rounded to the milliseconds of Prometheus,
+        so that sub-second steps stay aligned.
+        """
+        from .prometheus_connect import MAX_POINTS_PER_SERIES
+
+        return dict(
+            query=self.query,
+            start=round(start, 3),
+            end=round(end, 3),
+            step=self.step,
+            params=self._params or {},
+            timeout=self._timeout,
+            max_points=MAX_POINTS_PER_SERIES,
+        )
+
+    def _done(self) -> bool:
+        """Return whether the iteration reached ``max_polls``."""
+        return self.max_polls is not None and self.polls >= self.max_polls
+
+    def _wait(self) -> float:
+        """Return the number of seconds until the next poll is due."""
+        if self.last_timestamp is None:
+            return 0
+        due = max(self.last_timestamp + self.interval, self.last_timestamp + self.step_seconds)
+        return max(0.0, due - time.time())
+
+    def poll(self, now: float = None) -> list:
+        """
+        Fetch the samples not seen yet, with a `PrometheusConnect`.
+
+        :param now: (float) Optional current unix time. Default is None, which uses the clock.
+        :returns: (list) The delta of the poll, see `update`. It is empty when no new
+            evaluation timestamp is due yet, and no query is sent then.
+        :raises:
+            (RequestException) Raises an exception in case of a connection error
+            (PrometheusApiClientException) Raises in case of non 200 response status code
+        """
+        query_range = self.next_range(now)
+        if query_range is None:
+            return []
+        data = self._prom._query_range_split(**self._query_args(*query_range))
+        return self.update(data, query_range[1])
+
+    async def apoll(self, now: float = None) -> list:
+        """
+        Fetch the samples not seen yet, with an `AsyncPrometheusConnect`.
+
+        :param now: (float) Optional current unix time. Default is None, which uses the clock.
+        :returns: (list) The delta of the poll, see `poll`
+        :raises:
+            (httpx.HTTPError) Raises an exception in case of a connection error
+            (PrometheusApiClientException) Raises in case of non 200 response status code
+        """
+        query_range = self.next_range(now)
+        if query_range is None:
+            return []
+        data = await self._prom._query_range_split(**self._query_args(*query_range))
+        return self.update(data, query_range[1])
+
+    def __iter__(self):
+        """Poll with a `PrometheusConnect` once the next poll is due, yielding each delta."""
+        while not self._done():
+            time.sleep(self._wait())
+            yield self.poll()
+
+    async def __aiter__(self):
+        """Poll with an `AsyncPrometheusConnect` once the next poll is due, yielding each delta."""
+        while not self._done():
+            await asyncio.sleep(self._wait())
+            yield await self.apoll()
+
+    def run(self, callback) -> None:
+        """
+        Poll with a `PrometheusConnect` until ``max_polls``.
+
+        ``callback`` is called with each non-empty delta.
+        """
+        for delta in self:
+            if delta:
+                callback(delta)
+
+    async def arun(self, callback) -> None:
+        """
+        Poll with an `AsyncPrometheusConnect` until ``max_polls``.
+
+        ``callback`` is called with each non-empty delta, it may be a coroutine function.
+        """
+        async for delta in self:
+            if delta:
+                result = callback(delta)
+                if asyncio.iscoroutine(result):
+                    await result
@@ -41,7 +41,20 @@ setuptools.setup(
         "numpy": ["numpy"],
         "plot": ["matplotlib"],
         "analytics": ["numpy"],
-        "all": ["pandas>=1.4.0", "numpy", "matplotlib"],
+        "async": ["httpx>=0.26"],
+        "remote-read": ["numpy", "cramjam", "crc32c"],
+        "orjson": ["orjson"],
+        "msgspec": ["msgspec"],
+        "all": [
+            "pandas>=1.4.0",
+            "numpy",
+            "matplotlib",
+            "httpx>=0.26",
+            "cramjam",
+            "crc32c",
+            "orjson",
+            "msgspec",
+        ],
     },
     packages=setuptools.find_packages(),
     package_data={"prometheus-api-client": ["py.typed"]},
@@ -0,0 +1,149 @@
+"""Unit tests for the streaming aggregation."""
+import math
+import unittest
+
+import numpy
+
+from prometheus_api_client import StreamingAggregator, TDigest
+from prometheus_api_client.aggregation import aggregate_by, aggregate_groups
+
+
+class TestTDigest(unittest.TestCase):  # noqa D101
+    def test_exact(self):  # noqa D102
+        values = numpy.random.default_rng(0).normal(size=1000)
+        digest = TDigest(exact_limit=1000)
+        for chunk in numpy.array_split(values, 7):
+            digest.update(chunk)
+        for q in (0, 0.01, 0.5, 0.99, 1):
+            self.assertEqual(numpy.quantile(values, q), digest.quantile(q))
+        self.assertTrue(math.isnan(TDigest().quantile(0.5)))
+        with self.assertRaises(ValueError):
+            digest.quantile(1.5)
+
+    def test_accuracy(self):  # noqa D102
+        values = numpy.random.default_rng(1).lognormal(0, 2, size=200000)
+        digests = [TDigest(exact_limit=1000) for _ in range(4)]
+        for position, chunk in enumerate(numpy.array_split(values, 40)):
+            digests[position % 4].update(chunk)
+        digest = digests[0]
+        for other in digests[1:]:
+            digest.merge(other)
+        self.assertEqual(len(values), digest.count)
+        self.assertLessEqual(len(digest._means), digest.compression / 2 + 1)
+        for q in (0.001, 0.5, 0.99, 0.999):
+            # the rank of the estimated quantile is close to the requested one
+            rank = (values < digest.quantile(q)).mean()
+            self.assertAlmostEqual(q, rank, delta=0.001)
+        self.assertEqual(values.min(), digest.quantile(0))
+        self.assertEqual(values.max(), digest.quantile(1))
+
+
+class TestStreamingAggregator(unittest.TestCase):  # noqa D101
+    operations = ["sum", "max", "min", "count", "average", "variance", "deviation", "percentile_90"]
+
+    def test_result(self):  # noqa D102
+        values = numpy.random.default_rng(2).normal(10, 3, size=5000)
+        aggregators = [StreamingAggregator(), StreamingAggregator()]
+        for position, chunk in enumerate(numpy.array_split(values, 9)):
+            aggregators[position % 2].update(chunk)
+        aggregators[0].merge(aggregators[1])
+        result = aggregators[0].result(self.operations)
+
+        self.assertAlmostEqual(values.sum(), result["sum"], places=6)
+        self.assertEqual(values.max(), result["max"])
+        self.assertEqual(values.min(), result["min"])
+        self.assertEqual(len(values), result["count"])
+        self.assertAlmostEqual(values.mean(), result["average"])
+        self.assertAlmostEqual(values.var(), result["variance"])
+        self.assertAlmostEqual(values.std(), result["deviation"])
+        self.assertEqual(numpy.percentile(values, 90), result["percentile_90.0"])
+
+    def test_update_result(self):  # noqa D102
+        aggregator = StreamingAggregator(percentiles=False)
+        self.assertIsNone(aggregator.result(["sum"]))
+        aggregator.update_result([{"metric": {}, "values": [[1, "1"], [2, "3"]]}])
+        aggregator.update_result([{"metric": {}, "value": [3, "5"]}])
+        self.assertEqual({"sum": 9.0, "average": 3.0}, aggregator.result(["sum", "average"]))
+        with self.assertRaises(TypeError):
+            aggregator.result(["percentile_50"])
+        with self.assertRaises(TypeError):
+            aggregator.result(["median"])
+
+    def test_nan(self):  # noqa D102
+        aggregator = StreamingAggregator()
+        aggregator.update([1.0, math.nan, 2.0])
+        result = aggregator.result(self.operations)
+        self.assertEqual(3, result.pop("count"))
+        self.assertTrue(all(math.isnan(value) for value in result.values()))
+
+
+class TestGroupAggregation(unittest.TestCase):  # noqa D101
+    operations = TestStreamingAggregator.operations + ["percentile_0", "percentile_100"]
+
+    def test_aggregate_groups(self):  # noqa D102
+        rng = numpy.random.default_rng(3)
+        values = rng.normal(size=3000)
+        groups = rng.integers(0, 5, size=3000)
+        groups[groups == 3] = 4  # group 3 is empty
+        values[groups == 2] = numpy.round(values[groups == 2])  # ties
+        values[10] = math.nan
+        result = aggregate_groups(values, groups, 5, self.operations)
+
+        nan_group = groups[10]
+        for group in (0, 1, 2, 4):
+            group_values = values[groups == group]
+            self.assertEqual(len(group_values), result["count"][group])
+            if group == nan_group:
+                self.assertTrue(math.isnan(result["sum"][group]))
+                continue
+            self.assertAlmostEqual(group_values.sum(), result["sum"][group])
+            self.assertEqual(group_values.max(), result["max"][group])
+            self.assertEqual(group_values.min(), result["min"][group])
+            self.assertAlmostEqual(group_values.mean(), result["average"][group])
+            self.assertAlmostEqual(group_values.var(), result["variance"][group])
+            self.assertAlmostEqual(group_values.std(), result["deviation"][group])
+            for percentile in (0, 90, 100):
+                self.assertAlmostEqual(
+                    numpy.percentile(group_values, percentile),
+                    result["percentile_{}".format(float(percentile))][group],
+                )
+        self.assertEqual(0, result["count"][3])
+        self.assertTrue(math.isnan(result["max"][3]))
+
+    def test_aggregate_by(self):  # noqa D102
+        def labels(df):
+            return df.index.to_frame(index=False).fillna("").values.tolist()
+
+        chunks = [
+            [
+                {"metric": {"job": "a", "instance": "1"}, "values": [[1, "1"], [2, "2"]]},
+                {"metric": {"job": "a", "instance": "2"}, "values": [[1, "10"]]},
+                {"metric": {"job": "b", "instance": "1"}, "values": []},
+            ],
+            [
+                {"metric": {"job": "a", "instance": "1"}, "values": [[3, "6"]]},
+                {"metric": {"instance": "3"}, "values": [[3, "4"]]},
+            ],
+        ]
+        df = aggregate_by(chunks, ["job"], ["sum", "max", "percentile_50"])
+        self.assertEqual([["a"], [""]], labels(df))
+        self.assertEqual("job", df.index.name)
+        self.assertEqual([19.0, 4.0], df["sum"].tolist())
+        self.assertEqual([10.0, 4.0], df["max"].tolist())
+        self.assertEqual([4.0, 4.0], df["percentile_50.0"].tolist())
+
+        df = aggregate_by(chunks, "series", ["count", "average"])
+        self.assertEqual(["instance", "job"], df.index.names)
+        self.assertEqual([["1", "a"], ["2", "a"], ["3", ""]], labels(df))
+        self.assertEqual([3, 1, 1], df["count"].tolist())
+        self.assertEqual([3.0, 10.0, 4.0], df["average"].tolist())
+
+        df = aggregate_by(chunks, ["job", "instance"], ["min"])
+        self.assertEqual([["a", "1"], ["a", "2"], ["", "3"]], labels(df))
+        self.assertIsNone(aggregate_by([[]], ["job"], ["sum"]))
+        with self.assertRaises(TypeError):
+            aggregate_by(chunks, "job", ["sum"])
+
+
+if __name__ == "__main__":
+    unittest.main()
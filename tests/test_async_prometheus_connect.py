@@ -0,0 +1,270 @@
+"""Test module for class AsyncPrometheusConnect."""
+import asyncio
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from prometheus_api_client import AsyncPrometheusConnect, PrometheusApiClientException
+
+
+def _vector(query, value="1"):
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"metric": {"__name__": query}, "value": [1700000000, value]}],
+        },
+    }
+
+
+class TestAsyncPrometheusConnect(unittest.IsolatedAsyncioTestCase):
+    """Network is replaced by an httpx.MockTransport in this testcase."""
+
+    def _connect(self, handler, **kwargs):
+        self.requests = []
+
+        def recording_handler(request):
+            self.requests.append(request)
+            return handler(request)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(recording_handler))
+        return AsyncPrometheusConnect(url="http://doesnt_matter.xyz", client=client, **kwargs)
+
+    async def test_custom_query(self):  # noqa D102
+        async with self._connect(lambda r: httpx.Response(200, json=_vector("up"))) as pc:
+            result = await pc.custom_query("up", params={"time": 1700000000})
+        self.assertEqual(result[0]["metric"]["__name__"], "up")
+        self.assertEqual(self.requests[0].url.path, "/api/v1/query")
+        self.assertEqual(self.requests[0].url.params["query"], "up")
+        self.assertEqual(self.requests[0].url.params["time"], "1700000000")
+
+    async def test_post_method_sends_form_body(self):  # noqa D102
+        async with self._connect(
+            lambda r: httpx.Response(200, json=_vector("up")), method="POST"
+        ) as pc:
+            await pc.custom_query("up")
+        self.assertEqual(self.requests[0].method, "POST")
+        self.assertEqual(self.requests[0].content, b"query=up")
+
+    async def test_custom_query_range(self):  # noqa D102
+        payload = {"status": "success", "data": {"resultType": "matrix", "result": []}}
+        end_time = datetime(2024, 1, 1)
+        async with self._connect(lambda r: httpx.Response(200, json=payload)) as pc:
+            result = await pc.custom_query_range(
+                "up", start_time=end_time - timedelta(hours=1), end_time=end_time, step="15"
+            )
+        self.assertEqual(result, [])
+        params = self.requests[0].url.params
+        self.assertEqual(self.requests[0].url.path, "/api/v1/query_range")
+        self.assertEqual(params["step"], "15")
+        self.assertEqual(int(params["end"]) - int(params["start"]), 3600)
+
+    async def test_tail(self):  # noqa D102
+        def handler(request):
+            params = request.url.params
+            start, end = float(params["start"]), float(params["end"])
+            values = [[start + 15 * i, "1"] for i in range(int((end - start) // 15) + 1)]
+            result = [{"metric": {"__name__": "up"}, "values": values}]
+            payload = {"status": "success", "data": {"resultType": "matrix", "result": result}}
+            return httpx.Response(200, json=payload)
+
+        now = datetime(2024, 1, 1).timestamp()
+        async with self._connect(handler) as pc:
+            tail = pc.tail("up", step="15", oldest_data_datetime=timedelta(seconds=30))
+            self.assertEqual(1, len((await tail.apoll(now=now))[0].values))
+            self.assertEqual([], await tail.apoll(now=now + 10))
+            delta = await tail.apoll(now=now + 60)
+            self.assertEqual(4, len(delta[0].values))
+            self.assertEqual(3, len(tail.metrics[0].values))
+            self.assertEqual(2, len(self.requests))
+            self.assertEqual(now + 15, float(self.requests[1].url.params["start"]))
+
+            deltas = [delta async for delta in pc.tail("up", step="15", max_polls=1)]
+            self.assertEqual(1, len(deltas))
+            received = []
+
+            async def callback(delta):
+                received.append(delta)
+
+            await pc.tail("up", step="15", max_polls=1).arun(callback)
+            self.assertEqual(1, len(received))
+
+    async def test_tail_sub_second_step(self):  # noqa D102
+        def handler(request):
+            params = request.url.params
+            start, end = float(params["start"]), float(params["end"])
+            values = [[start + 0.5 * i, "1"] for i in range(int((end - start) // 0.5) + 1)]
+            result = [{"metric": {"__name__": "up"}, "values": values}]
+            payload = {"status": "success", "data": {"resultType": "matrix", "result": result}}
+            return httpx.Response(200, json=payload)
+
+        now = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp() + 0.2
+        async with self._connect(handler) as pc:
+            tail = pc.tail(
+                "up", step="0.5", start_time=datetime.fromtimestamp(now - 2, tz=timezone.utc)
+            )
+            with mock.patch("prometheus_api_client.prometheus_connect.MAX_POINTS_PER_SERIES", 2):
+                delta = await tail.apoll(now=now)
+        # the unix timestamps aligned to the step are queried, split by max_points like poll
+        self.assertEqual(
+            [(now - 1.7, now - 1.2), (now - 0.7, now - 0.2)],
+            [(float(r.url.params["start"]), float(r.url.params["end"])) for r in self.requests],
+        )
+        self.assertEqual(4, len(delta[0].values))
+
+    async def test_custom_query_range_max_points(self):  # noqa D102
+        def handler(request):
+            params = request.url.params
+            start, end = float(params["start"]), float(params["end"])
+            values = [[start + 15 * i, "1"] for i in range(int((end - start) // 15) + 1)]
+            result = [{"metric": {"__name__": "up"}, "values": values}]
+            payload = {"status": "success", "data": {"resultType": "matrix", "result": result}}
+            return httpx.Response(200, json=payload)
+
+        end_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        async with self._connect(handler) as pc:
+            result = await pc.custom_query_range(
+                "up", end_time - timedelta(minutes=1), end_time, "15", max_points=2
+            )
+            with self.assertRaises(ValueError):
+                await pc.custom_query_range(
+                    "up", end_time - timedelta(minutes=1), end_time, "15", max_points=0
+                )
+        self.assertEqual(3, len(self.requests))
+        start = end_time.timestamp() - 60
+        self.assertEqual([start + 15 * i for i in range(5)], [v[0] for v in result[0]["values"]])
+
+    async def test_concurrent_queries_are_bounded(self):  # noqa D102
+        in_flight = 0
+        max_in_flight = 0
+
+        class SlowTransport(httpx.AsyncBaseTransport):
+            async def handle_async_request(self, request):
+                nonlocal in_flight, max_in_flight
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+                return httpx.Response(200, json=_vector(request.url.params["query"]))
+
+        pc = AsyncPrometheusConnect(
+            url="http://doesnt_matter.xyz",
+            client=httpx.AsyncClient(transport=SlowTransport()),
+            max_concurrency=3,
+        )
+        async with pc:
+            queries = ["q{}".format(i) for i in range(10)]
+            results = await asyncio.gather(*(pc.custom_query(q) for q in queries))
+        self.assertEqual([r[0]["metric"]["__name__"] for r in results], queries)
+        self.assertEqual(max_in_flight, 3)
+
+    async def test_get_metric_range_data_keeps_chunk_order(self):  # noqa D102
+        def handler(request):
+            chunk_end = int(request.url.params["time"])
+            payload = {
+                "status": "success",
+                "data": {
+                    "resultType": "matrix",
+                    "result": [{"metric": {"__name__": "up"}, "values": [[chunk_end, "1"]]}],
+                },
+            }
+            return httpx.Response(200, json=payload)
+
+        end_time = datetime(2024, 1, 1)
+        start_time = end_time - timedelta(hours=6)
+        async with self._connect(handler) as pc:
+            data = await pc.get_metric_range_data(
+                "up",
+                label_config={"job": "node"},
+                start_time=start_time,
+                end_time=end_time,
+                chunk_size=timedelta(hours=1),
+            )
+        self.assertEqual(
+            [series["values"][0][0] for series in data],
+            [round((start_time + timedelta(hours=i + 1)).timestamp()) for i in range(6)],
+        )
+        self.assertEqual(self.requests[0].url.params["query"], "up{job='node'}[3600s]")
+
+    async def test_retry_on_status(self):  # noqa D102
+        responses = [httpx.Response(503), httpx.Response(200, json=_vector("up"))]
+        async with self._connect(lambda r: responses.pop(0)) as pc:
+            with mock.patch("asyncio.sleep", new_callable=mock.AsyncMock) as sleep:
+                result = await pc.custom_query("up")
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(result[0]["metric"]["__name__"], "up")
+
+    async def test_retry_backoff_releases_slot(self):  # noqa D102
+        statuses = {"a": [503, 200], "b": [200]}
+
+        def handler(request):
+            query = request.url.params["query"]
+            return httpx.Response(statuses[query].pop(0), json=_vector(query))
+
+        async with self._connect(handler, max_concurrency=1) as pc:
+            with mock.patch(
+                "prometheus_api_client.async_prometheus_connect.RETRY_BACKOFF_FACTOR", 0.05
+            ):
+                await asyncio.gather(pc.custom_query("a"), pc.custom_query("b"))
+        # "b" is sent while "a" waits for its retry
+        self.assertEqual(["a", "b", "a"], [r.url.params["query"] for r in self.requests])
+
+    def test_used_from_several_loops(self):  # noqa D102
+        # built outside of any running loop, then used from two of them
+        pc = AsyncPrometheusConnect(
+            url="http://doesnt_matter.xyz",
+            client=httpx.AsyncClient(
+                transport=httpx.MockTransport(lambda r: httpx.Response(200, json=_vector("up")))
+            ),
+            max_concurrency=1,
+        )
+
+        async def query():
+            return await asyncio.gather(pc.custom_query("up"), pc.custom_query("up"))
+
+        for _ in range(2):
+            self.assertEqual(2, len(asyncio.run(query())))
+
+    async def test_broken_responses(self):  # noqa D102
+        async with self._connect(lambda r: httpx.Response(403, content=b"BOOM!"), retries=0) as pc:
+            for coroutine in (
+                pc.all_metrics(),
+                pc.get_label_names(),
+                pc.get_label_values("job"),
+                pc.get_series(start=datetime.now() - timedelta(hours=1), end=datetime.now()),
+                pc.get_current_metric_value("up"),
+                pc.get_metric_range_data("up"),
+                pc.custom_query("up"),
+                pc.get_targets(),
+                pc.get_metric_metadata("up"),
+            ):
+                with self.assertRaises(PrometheusApiClientException) as exc:
+                    await coroutine
+                self.assertEqual("HTTP Status Code 403 (b'BOOM!')", str(exc.exception))
+
+    async def test_get_metric_metadata(self):  # noqa D102
+        payload = {
+            "status": "success",
+            "data": {"up": [{"type": "gauge", "help": "Target is up.", "unit": ""}]},
+        }
+        async with self._connect(lambda r: httpx.Response(200, json=payload)) as pc:
+            metadata = await pc.get_metric_metadata("up", limit=1)
+        self.assertEqual(
+            metadata, [{"metric_name": "up", "type": "gauge", "help": "Target is up.", "unit": ""}]
+        )
+        self.assertEqual(self.requests[0].url.params["limit"], "1")
+
+    def test_invalid_arguments(self):  # noqa D102
+        with self.assertRaises(TypeError):
+            AsyncPrometheusConnect(url=None)
+        with self.assertRaises(ValueError):
+            AsyncPrometheusConnect(method="PUT")
+        with self.assertRaises(ValueError):
+            AsyncPrometheusConnect(max_concurrency=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
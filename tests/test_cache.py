@@ -0,0 +1,118 @@
+"""Unit tests for the response caches."""
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from prometheus_api_client import DiskCache, MemoryCache
+from prometheus_api_client.cache import ResponseCache, client_identity
+
+
+class TestMemoryCache(unittest.TestCase):
+    """unit tests for MemoryCache Class."""
+
+    def setUp(self):  # noqa D102
+        self.cache = MemoryCache(max_entries=2)
+
+    def test_get_and_set(self):  # noqa D102
+        self.assertEqual(self.cache.get("a"), (False, None))
+        self.cache.set("a", [1, 2], ttl=10)
+        self.assertEqual(self.cache.get("a"), (True, [1, 2]))
+
+    def test_lru_eviction(self):  # noqa D102
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get("b"), (False, None))
+        self.assertEqual(self.cache.get("a"), (True, 1))
+        self.assertEqual(self.cache.get("c"), (True, 3))
+
+    def test_expiry(self):  # noqa D102
+        self.cache.set("a", 1, ttl=10)
+        with mock.patch("time.time", return_value=time.time() + 11):
+            self.assertEqual(self.cache.get("a"), (False, None))
+
+    def test_make_key_normalizes_params(self):  # noqa D102
+        self.assertEqual(
+            self.cache.make_key("http://host", "/api/v1/query", {"query": "up", "time": 10}),
+            self.cache.make_key("http://host", "/api/v1/query", {"time": "10", "query": "up"}),
+        )
+        self.assertNotEqual(
+            self.cache.make_key("http://host", "/api/v1/query", {"query": "up"}),
+            self.cache.make_key("http://other", "/api/v1/query", {"query": "up"}),
+        )
+        self.assertNotEqual(
+            self.cache.make_key("http://host", "/api/v1/query", {}, client_identity({"a": "1"})),
+            self.cache.make_key("http://host", "/api/v1/query", {}, client_identity({"a": "2"})),
+        )
+        self.assertEqual("", client_identity())
+        self.assertNotEqual(client_identity(auth=("u", "p")), client_identity(auth=("u", "q")))
+
+    def test_ttl_for(self):  # noqa D102
+        cache = MemoryCache(ttl={"query": 5, "labels": 0}, immutable_after=timedelta(minutes=1))
+        now = time.time()
+        self.assertEqual(cache.ttl_for("query", {"query": "up"}), 5)
+        self.assertEqual(cache.ttl_for("query", {"query": "up", "time": now}), 5)
+        self.assertIsNone(cache.ttl_for("query", {"query": "up", "time": now - 120}))
+        self.assertIsNone(cache.ttl_for("query_range", {"start": now - 240, "end": now - 120}))
+        self.assertTrue(cache.is_cacheable("query_range"))
+        self.assertFalse(cache.is_cacheable("labels"))
+        self.assertFalse(cache.is_cacheable("targets"))
+
+    def test_invalid_arguments(self):  # noqa D102
+        with self.assertRaises(ValueError):
+            MemoryCache(max_entries=0)
+        with self.assertRaises(TypeError):
+            MemoryCache(immutable_after=60)
+
+    def test_incomplete_subclass(self):  # noqa D102
+        class NoSetCache(ResponseCache):
+            def clear(self):
+                pass
+
+            def _get(self, key):
+                return False, None
+
+        with self.assertRaises(TypeError):
+            NoSetCache()
+
+
+class TestDiskCache(unittest.TestCase):
+    """unit tests for DiskCache Class."""
+
+    def setUp(self):  # noqa D102
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(self.directory.name, max_entries=2)
+
+    def tearDown(self):  # noqa D102
+        self.directory.cleanup()
+
+    def test_get_and_set(self):  # noqa D102
+        self.assertEqual(self.cache.get("a"), (False, None))
+        self.cache.set("a", {"result": [1, 2]}, ttl=10)
+        self.assertEqual(self.cache.get("a"), (True, {"result": [1, 2]}))
+        # a new cache object over the same directory sees the entry
+        self.assertEqual(DiskCache(self.directory.name).get("a"), (True, {"result": [1, 2]}))
+
+    def test_expiry(self):  # noqa D102
+        self.cache.set("a", 1, ttl=10)
+        with mock.patch("time.time", return_value=time.time() + 11):
+            self.assertEqual(self.cache.get("a"), (False, None))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_eviction(self):  # noqa D102
+        for key in ("a", "b", "c"):
+            self.cache.set(key, key)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_clear(self):  # noqa D102
+        self.cache.set("a", 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.get("a"), (False, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Unit tests for the label index."""
+import unittest
+
+from prometheus_api_client import LabelIndex, LazyMetricsList, MetricRangeDataFrame, MetricsList
+from prometheus_api_client.label_index import parse_selector
+
+
+def _series(**labels):
+    return {"metric": labels, "values": [[1, "1"], [2, "2"]]}
+
+
+class TestLabelIndex(unittest.TestCase):  # noqa D101
+    def setUp(self):  # noqa D102
+        self.data = [
+            _series(__name__="up", job="node", instance="db-1"),
+            _series(__name__="up", job="node", instance="web-1"),
+            _series(__name__="up", job="api", instance="db-2"),
+            _series(__name__="up", instance="db-3"),
+            _series(__name__="node_load1", job="node", instance="db-1"),
+        ]
+        self.index = LabelIndex(self.data)
+
+    def assertSelects(self, positions, *matchers):  # noqa D102
+        self.assertEqual(positions, self.index.positions(*matchers))
+
+    def test_matchers(self):  # noqa D102
+        self.assertSelects([0, 1, 4], ("job", "=", "node"))
+        self.assertSelects([2, 3], ("job", "!=", "node"))
+        self.assertSelects([0, 2, 3, 4], ("instance", "=~", "db-.*"))
+        # regular expressions are fully anchored
+        self.assertSelects([], ("instance", "=~", "db"))
+        self.assertSelects([1], ("instance", "!~", "db-.*"))
+        self.assertSelects([0, 2, 3], ("__name__", "=", "up"), ("instance", "=~", "db-.*"))
+        self.assertSelects([], ("job", "=", "missing"))
+        self.assertSelects([0, 1, 2, 3, 4])
+
+    def test_missing_labels(self):  # noqa D102
+        # a missing label matches like the empty string
+        self.assertSelects([3], ("job", "=", ""))
+        self.assertSelects([0, 1, 2, 4], ("job", "!=", ""))
+        self.assertSelects([0, 1, 2, 3, 4], ("job", "=~", ".*"))
+        self.assertSelects([0, 1, 2, 4], ("job", "=~", ".+"))
+        self.assertSelects([2, 3], ("job", "!~", "node"))
+        self.assertSelects([3], ("job", "=~", "|x"))
+        self.assertSelects([0, 1, 2, 3, 4], ("env", "!=", "prod"))
+        self.assertSelects([], ("env", "=~", ".+"))
+
+    def test_selectors(self):  # noqa D102
+        self.assertEqual(
+            [("__name__", "=", "up"), ("job", "=", "node"), ("instance", "!~", "db-.*")],
+            parse_selector('up{job="node", instance!~"db-.*"}'),
+        )
+        self.assertEqual([("a", "=~", "x\\.y")], parse_selector("{a=~`x\\.y`}"))
+        self.assertSelects([0, 3], 'up{instance=~"db-[13]"}')
+        self.assertSelects([0], 'up{instance=~"db-[13]"}', ("job", "=", "node"))
+        self.assertEqual([self.data[2]], self.index.select('{job="api"}'))
+        for selector in ("up{job}", 'up{job="a" instance="b"}', "up job", "{", "up{", "}"):
+            with self.assertRaises(ValueError):
+                self.index.positions(selector)
+
+    def test_invalid_matchers(self):  # noqa D102
+        with self.assertRaises(ValueError):
+            self.index.positions(("job", "==", "node"))
+        with self.assertRaises(ValueError):
+            self.index.positions(("job", "=~", "("))
+
+    def test_labels(self):  # noqa D102
+        self.assertEqual(5, len(self.index))
+        self.assertEqual(["__name__", "instance", "job"], self.index.label_names())
+        self.assertEqual(["api", "node"], self.index.label_values("job"))
+        self.assertEqual(self.data[3]["metric"], self.index.label_sets[3])
+
+    def test_sources(self):  # noqa D102
+        metrics = MetricsList(self.data)
+        selected = LabelIndex(metrics).select('{instance=~"db-.*", job!="api"}')
+        self.assertEqual([metrics[0], metrics[3], metrics[4]], selected)
+
+        lazy = LazyMetricsList(self.data)
+        selected = LabelIndex(lazy).select('up{job="node"}')
+        self.assertEqual([metrics[0], metrics[1]], selected)
+        self.assertEqual("LazyMetricsList(5 time-series, 2 built)", repr(lazy))
+
+        df = MetricRangeDataFrame(self.data)
+        index = LabelIndex(df)
+        self.assertEqual(5, len(index))
+        selected = index.select(("job", "=", ""))
+        self.assertEqual(["db-3", "db-3"], selected["instance"].tolist())
+        selected = index.select('{instance="db-1"}')
+        self.assertEqual(["up", "up", "node_load1", "node_load1"], selected["__name__"].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 """Unit tests for Metrics Class."""
-import unittest
+import copy
 import datetime
+import unittest
 
+import pandas
 import pytest
 
 from prometheus_api_client import Metric
@@ -20,6 +22,28 @@ class TestMetric(unittest.TestCase, TestWithMetrics.Common):
         test_metric_object = Metric(self.raw_metrics_list[0][0])
         self.assertEqual("up", test_metric_object.metric_name, "incorrect metric name")
 
+    def test_samples(self):  # noqa D102
+        metric = Metric(
+            {"metric": {"__name__": "up", "job": "a"}, "values": [[1, "1"], [2.5, "0"]]}
+        )
+        self.assertFalse(hasattr(metric, "__dict__"))
+        self.assertEqual("datetime64[ns]", metric.timestamps.dtype)
+        self.assertEqual([1.0, 0.0], metric.values.tolist())
+        self.assertEqual(pandas.Timestamp(2.5, unit="s"), metric.end_time)
+        # the dataframe is built once, on first access
+        metric_values = metric.metric_values
+        self.assertIs(metric_values, metric.metric_values)
+        self.assertEqual(["ds", "y"], list(metric_values.columns))
+        self.assertTrue((metric_values["ds"].values == metric.timestamps).all())
+
+        metric.metric_values = metric_values.iloc[1:]
+        self.assertEqual([0.0], metric.values.tolist())
+        self.assertEqual(metric.start_time, metric.end_time)
+        # an added metric holds new arrays, the dataframe is rebuilt from them
+        added = metric + Metric({"metric": {"__name__": "up", "job": "a"}, "values": [[3, "2"]]})
+        self.assertEqual([0.0, 2.0], added.metric_values["y"].tolist())
+        self.assertEqual([0.0], metric.values.tolist())
+
     def test_metric_start_time(self):  # noqa D102
         start_time = datetime.datetime(2019, 7, 28, 10, 0)
         start_time_plus_1m = datetime.datetime(2019, 7, 28, 10, 1)
@@ -100,6 +124,92 @@ class TestMetric(unittest.TestCase, TestWithMetrics.Common):
             expected_start_time, new_metric.start_time, "Incorrect Start time after addition"
         )
 
+    def test_merge_fragments(self):  # noqa D102
+        # inclusive chunk windows share their boundary timestamps, with different values here
+        fragments = [
+            Metric({"metric": {"__name__": "up"}, "values": [[t, str(c)] for t in range(s, s + 4)]})
+            for c, s in enumerate([6, 0, 3, 9])
+        ]
+        merged = Metric._merge(fragments)
+        added = fragments[0]
+        for fragment in fragments[1:]:
+            added = added + fragment
+        self.assertEqual(
+            list(range(13)), [int(ds.timestamp()) for ds in merged.metric_values["ds"]]
+        )
+        self.assertTrue(merged.metric_values.equals(added.metric_values))
+        # the earliest fragment wins on shared timestamps
+        self.assertEqual(
+            [1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 0.0], merged.metric_values["y"].tolist()[:7]
+        )
+        self.assertEqual((merged.start_time, merged.end_time), (added.start_time, added.end_time))
+        self.assertEqual(fragments[0].label_config, merged.label_config)
+        self.assertIsNot(fragments[0].label_config, merged.label_config)
+
+    def test_metric_inplace_addition(self):  # noqa D102
+        def chunk(start, stop):
+            return Metric(
+                {"metric": {"__name__": "up"}, "values": [[t, str(t)] for t in range(start, stop)]}
+            )
+
+        metric = chunk(0, 10)
+        metric.oldest_data_datetime = datetime.timedelta(seconds=5)
+        first = metric
+        metric += chunk(10, 12)
+        self.assertIs(first, metric)
+        self.assertEqual([6.0, 7.0, 8.0, 9.0, 10.0, 11.0], metric.metric_values["y"].tolist())
+        self.assertEqual(metric.metric_values.iloc[0, 0], metric.start_time)
+        self.assertEqual(metric.metric_values.iloc[-1, 0], metric.end_time)
+
+        # overlapping samples take the full merge in place, and give the same result as ``+``
+        overlapping = chunk(10, 14)
+        added = metric + overlapping
+        self.assertEqual([6.0, 7.0, 8.0, 9.0, 10.0, 11.0], first.metric_values["y"].tolist())
+        metric += overlapping
+        self.assertIs(first, metric)
+        self.assertTrue(added.metric_values.equals(metric.metric_values))
+        self.assertEqual(list(range(8, 14)), first.metric_values["y"].tolist())
+
+        with self.assertRaises(TypeError):
+            metric += Metric({"metric": {"__name__": "down"}, "values": [[20, "1"]]})
+
+    def test_metric_inplace_addition_buffer(self):  # noqa D102
+        def chunk(start, stop):
+            return Metric(
+                {"metric": {"__name__": "up"}, "values": [[t, str(t)] for t in range(start, stop)]}
+            )
+
+        metric = chunk(0, 10)
+        metric.oldest_data_datetime = datetime.timedelta(seconds=20)
+        metric += chunk(10, 11)
+        views = [metric.values]
+        buffer = metric._buffer[1]
+        for t in range(11, 100):
+            metric += chunk(t, t + 1)
+            views.append(metric.values)
+            self.assertEqual(list(range(max(0, t - 20), t + 1)), metric.values.tolist())
+            self.assertEqual(len(metric.timestamps), len(metric.values))
+        # appending writes to a buffer, which is replaced a few times only
+        self.assertIs(buffer, views[1].base)
+        self.assertLess(len({id(view.base) for view in views}), 10)
+        # the samples seen earlier do not change
+        self.assertEqual([0.0, 1.0, 2.0], views[0][:3].tolist())
+
+        # a copy sharing the buffer does not see the samples appended to the original
+        copied = copy.copy(metric)
+        metric += chunk(100, 101)
+        copied += Metric({"metric": {"__name__": "up"}, "values": [[100, "-1"]]})
+        self.assertEqual([99.0, 100.0], metric.values[-2:].tolist())
+        self.assertEqual([99.0, -1.0], copied.values[-2:].tolist())
+
+        # NaNs, in the samples or appended, take the full merge which drops them
+        metric.values = metric.values.copy()
+        metric.values[-1] = float("nan")
+        metric += chunk(101, 102)
+        self.assertEqual([99.0, 101.0], metric.values[-2:].tolist())
+        metric += Metric({"metric": {"__name__": "up"}, "values": [[102, "NaN"]]})
+        self.assertEqual([99.0, 101.0], metric.values[-2:].tolist())
+
     def test_init_valid_string_metric_value(self):
         """Ensures metric values provided as strings are properly cast to a numeric value (in this case, a float)."""
         test_metric = Metric(
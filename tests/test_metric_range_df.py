@@ -1,5 +1,6 @@
 """Unit Tests for MetricRangeDataFrame."""
 import unittest
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -114,6 +115,78 @@ class TestMetricRangeDataFrame(unittest.TestCase, TestWithMetrics.Common):  # no
 
         self.assertEqual((1, 3), results.shape)
 
+    def test_compact_dtypes(self):
+        """Test categorical labels and the value dtype give the same data in less memory."""
+        for curr_metric_list in self.raw_metrics_list:
+            df = MetricRangeDataFrame(curr_metric_list)
+            compact_df = MetricRangeDataFrame(
+                curr_metric_list, labels_as_categorical=True, value_dtype=np.float32
+            )
+            self.assertEqual(list(df.columns), list(compact_df.columns))
+            for name in df.columns.drop("value"):
+                self.assertIsInstance(compact_df[name].dtype, pd.CategoricalDtype)
+                self.assertEqual(df[name].tolist(), compact_df[name].tolist())
+            self.assertEqual(np.float32, compact_df["value"].dtype)
+            np.testing.assert_allclose(df["value"], compact_df["value"])
+            self.assertTrue(df.index.equals(compact_df.index))
+            self.assertLess(
+                compact_df.memory_usage(deep=True).sum(), df.memory_usage(deep=True).sum()
+            )
+
+    def test_wide(self):
+        """Test the wide layout holds the same samples as the long layout."""
+        metric_list = [series for metrics in self.raw_metrics_list for series in metrics]
+        long_df = MetricRangeDataFrame(metric_list)
+        wide_df = MetricRangeDataFrame.wide(metric_list)
+        self.assertNotIsInstance(wide_df, MetricRangeDataFrame)
+        self.assertEqual("timestamp", wide_df.index.name)
+        self.assertTrue(wide_df.index.is_monotonic_increasing)
+        self.assertTrue(set(long_df.index) == set(wide_df.index))
+        self.assertEqual(len(long_df), wide_df.notna().sum().sum())
+        self.assertEqual(
+            len({tuple(sorted(series["metric"].items())) for series in metric_list}),
+            wide_df.shape[1],
+        )
+
+    def test_wide_gaps_and_labels(self):
+        """Test series split over several items share a column, and gaps are NaN."""
+        data = [
+            {"metric": {"__name__": "up", "job": "a"}, "values": [[1, "1"], [2, "2"]]},
+            {"metric": {"__name__": "up", "job": "b"}, "values": [[2, "5"]]},
+            {"metric": {"job": "a", "__name__": "up"}, "values": [[3, "3"]]},
+        ]
+        wide_df = MetricRangeDataFrame.wide(data, ts_as_datetime=False)
+        self.assertEqual([1, 2, 3], wide_df.index.tolist())
+        self.assertEqual(["__name__", "job"], list(wide_df.columns.names))
+        self.assertEqual([1.0, 2.0, 3.0], wide_df[("up", "a")].tolist())
+        self.assertEqual([5.0], wide_df[("up", "b")].dropna().tolist())
+        self.assertTrue(pd.isna(wide_df[("up", "b")].iloc[0]))
+
+        wide_df = MetricRangeDataFrame.wide(data, column_labels="string", value_dtype=np.float32)
+        self.assertEqual(['up{job="a"}', 'up{job="b"}'], list(wide_df.columns))
+        self.assertEqual(np.float32, wide_df['up{job="a"}'].dtype)
+        self.assertIsInstance(wide_df.index, pd.DatetimeIndex)
+        with self.assertRaises(ValueError):
+            MetricRangeDataFrame.wide(data, column_labels="json")
+
+    def test_init_mixed_label_sets(self):
+        """Test column order, missing labels and series without samples."""
+        df = MetricRangeDataFrame(
+            [
+                {"metric": {"__name__": "up", "a": "x"}, "values": [[1, "1"], [2, "2"]]},
+                {"metric": {"b": "y", "__name__": "up"}, "values": [[3, "3"]]},
+                {"metric": {"c": "z"}, "values": []},
+            ],
+            ts_as_datetime=False,
+        )
+        self.assertEqual(["__name__", "a", "value", "b"], list(df.columns))
+        self.assertEqual([1, 2, 3], df.index.tolist())
+        self.assertEqual(["up", "up", "up"], df["__name__"].tolist())
+        self.assertEqual(["x", "x"], df["a"].tolist()[:2])
+        self.assertTrue(pd.isna(df["a"].iloc[2]))
+        self.assertTrue(pd.isna(df["b"].iloc[0]))
+        self.assertEqual([1.0, 2.0, 3.0], df["value"].tolist())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -105,6 +105,19 @@ class TestMetricSnapshotDataFrame(unittest.TestCase):  # noqa D101
 
         self.assertTrue(isinstance(test_df["value"][0], float))
 
+    def test_compact_dtypes(self):
+        """Test categorical labels and the value dtype."""
+        for curr_metric_list in self.raw_metrics_list:
+            df = MetricSnapshotDataFrame(curr_metric_list)
+            compact_df = MetricSnapshotDataFrame(
+                curr_metric_list, labels_as_categorical=True, value_dtype="float32"
+            )
+            for name in df.columns.drop(["timestamp", "value"]):
+                self.assertEqual("category", compact_df[name].dtype)
+                self.assertEqual(df[name].tolist(), compact_df[name].tolist())
+            self.assertEqual("float32", compact_df["value"].dtype)
+            self.assertTrue(df["timestamp"].equals(compact_df["timestamp"]))
+
     def test_init_invalid_float_error(self):
         """Ensures metric values provided as strings are properly cast to a numeric value (in this case, a float)."""
         raw_data = [
@@ -1,7 +1,7 @@
 """Unit Tests for MetricsList."""
 import unittest
 import datetime
-from prometheus_api_client import MetricsList
+from prometheus_api_client import LazyMetricsList, Metric, MetricsList
 from .test_with_metrics import TestWithMetrics
 
 
@@ -55,6 +55,56 @@ class TestMetricsList(unittest.TestCase, TestWithMetrics.Common):
             "Combined metric end time incorrect",
         )
 
+    def test_contains_and_index(self):  # noqa D102
+        metrics = MetricsList(self.raw_metrics_list)
+        for position, metric in enumerate(metrics):
+            self.assertIn(Metric(metric), metrics)
+            self.assertEqual(position, metrics.index(Metric(metric)))
+        self.assertEqual(len(metrics), len(set(metrics)))
+
+        other = Metric({"metric": {"__name__": "down"}, "values": [[1, "1"]]})
+        self.assertNotIn(other, metrics)
+        with self.assertRaises(ValueError):
+            metrics.index(other)
+
+        # the index follows changes of the list
+        metrics.insert(0, other)
+        self.assertIn(other, metrics)
+        self.assertEqual(0, metrics.index(other))
+        self.assertEqual(1, metrics.index(metrics[1]))
+        del metrics[0]
+        self.assertNotIn(other, metrics)
+        metrics[0] = other
+        self.assertIn(other, metrics)
+
+
+    def test_lazy(self):  # noqa D102
+        metrics = MetricsList(self.raw_metrics_list)
+        lazy = LazyMetricsList(self.raw_metrics_list)
+        self.assertEqual(len(metrics), len(lazy))
+        self.assertEqual("LazyMetricsList(9 time-series, 0 built)", repr(lazy))
+        labels = list(lazy.iter_labels())
+        self.assertEqual(
+            [dict(metric.label_config, __name__=metric.metric_name) for metric in metrics], labels
+        )
+        for position, metric in enumerate(metrics):
+            self.assertIn(metric, lazy)
+            self.assertEqual(position, lazy.index(metric))
+        self.assertNotIn(Metric({"metric": {"__name__": "down"}, "values": [[1, "1"]]}), lazy)
+
+        filtered = lazy.filter("up", label_config=dict(labels[2]))
+        self.assertEqual([labels[2]], list(filtered.iter_labels()))
+        self.assertEqual(0, len(lazy.filter(label_config={"job": "missing"})))
+        self.assertEqual("LazyMetricsList(9 time-series, 0 built)", repr(lazy))
+
+        # building a metric merges its fragments, and caches it
+        metric = lazy[0]
+        self.assertIs(metric, lazy[0])
+        self.assertTrue(metric.metric_values.equals(metrics[0].metric_values))
+        self.assertEqual("LazyMetricsList(2 time-series, 1 built)", repr(lazy[:2]))
+        self.assertIs(metric, lazy[:2][0])
+        self.assertEqual(metrics, lazy.to_metrics_list())
+
 
 if __name__ == "__main__":
     unittest.main()
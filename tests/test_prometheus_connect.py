@@ -1,12 +1,38 @@
 """Test module for class PrometheusConnect."""
 import unittest
+import json
+import math
 import os
-from datetime import datetime, timedelta
-
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import numpy
+import pandas
 import requests
+from requests.packages.urllib3.exceptions import (
+    MaxRetryError,
+    NewConnectionError,
+    ReadTimeoutError,
+    ResponseError,
+)
 from requests.packages.urllib3.util.retry import Retry
+from httmock import response
+
+from prometheus_api_client import (
+    AdaptiveChunkSize,
+    MemoryCache,
+    MetricsList,
+    PrometheusConnect,
+    PrometheusApiClientException,
+    RangeResultsCache,
+    RequestStats,
+)
 
-from prometheus_api_client import MetricsList, PrometheusConnect, PrometheusApiClientException
+from prometheus_api_client.chunking import is_too_large_error, shrinking
 
 from .mocked_network import BaseMockedNetworkTestcase
 
@@ -279,6 +305,181 @@ class TestPrometheusConnect(unittest.TestCase):
             self.fail(f"get_metric_range_data('up', ...) raised an unexpected exception: {e}")
 
 
+def chunk_handler(url, request):
+    """Answer each /api/v1/query request with one sample at the requested time."""
+    chunk_end = int(parse_qs(url.query)["time"][0])
+    payload = {
+        "status": "success",
+        "data": {
+            "resultType": "matrix",
+            "result": [{"metric": {"__name__": "up"}, "values": [[chunk_end, "1"]]}],
+        },
+    }
+    return response(status_code=200, content=payload, request=request)
+
+
+def adaptive_chunk_handler(url, request):
+    """Answer /api/v1/query requests with a sample every 15s, refusing ranges over an hour."""
+    query = parse_qs(url.query)
+    chunk_end = int(query["time"][0])
+    chunk_seconds = int(re.fullmatch(r"up\[(\d+)s\]", query["query"][0]).group(1))
+    if chunk_seconds > 3600:
+        return response(status_code=422, content=b"too many samples", request=request)
+    first = chunk_end - chunk_seconds
+    # the range selector excludes its start
+    timestamps = range(first + 15 - first % 15, chunk_end + 1, 15)
+    payload = {
+        "status": "success",
+        "data": {
+            "resultType": "matrix",
+            "result": [{"metric": {"__name__": "up"}, "values": [[t, "1"] for t in timestamps]}],
+        },
+    }
+    return response(status_code=200, content=payload, request=request)
+
+
+def handler_series(query):
+    """Return the labels of the two series selected by ``query`` in the mocked handlers."""
+    if query == '{__name__=~"a|b"}':
+        # two metrics with the same other labels
+        return [{"__name__": name, "job": "node"} for name in ("a", "b")]
+    return [{"__name__": "up", "instance": instance} for instance in ("a", "b")]
+
+
+def query_range_handler(url, request):
+    """Answer each /api/v1/query_range request with two series evaluated at every step."""
+    query = parse_qs(url.query)
+    start, end = float(query["start"][0]), float(query["end"][0])
+    step = float(query["step"][0].rstrip("s"))
+    timestamps = [start + i * step for i in range(int((end - start) // step) + 1)]
+    result = [
+        {
+            "metric": metric,
+            "values": [[ts, str(ts % 7)] for ts in timestamps if ts % 2 or position == 0],
+        }
+        for position, metric in enumerate(handler_series(query["query"][0]))
+    ]
+    payload = {"status": "success", "data": {"resultType": "matrix", "result": result}}
+    return response(status_code=200, content=payload, request=request)
+
+
+def pushdown_handler(url, request):
+    """Evaluate the server-side aggregations of the series of query_range_handler."""
+    if url.path.endswith("query_range"):
+        return query_range_handler(url, request)
+    query = parse_qs(url.query)
+    time = float(query["time"][0])
+    outer, function, selected, range_ms, step_ms = re.fullmatch(
+        r"(?:(\w+)\()?(\w+)_over_time\(\((.*)\)\[(\d+)ms:(\d+)ms\]\)\)?", query["query"][0]
+    ).groups()
+    name_copy = re.fullmatch(
+        r'label_replace\((.*), "(\w+)", "\$1", "__name__", "\(\.\*\)"\)', selected
+    )
+    selected, copy_label = name_copy.groups() if name_copy else (selected, None)
+    step = int(step_ms) / 1000
+    # the subquery evaluates at the multiples of the step in (time - range, time]
+    first = math.floor((time - int(range_ms) / 1000) / step) + 1
+    timestamps = [k * step for k in range(first, math.floor(time / step) + 1)]
+    functions = {
+        "sum": numpy.sum, "max": numpy.max, "min": numpy.min, "count": len,
+        "avg": numpy.mean, "stdvar": numpy.var,
+    }
+    result = []
+    for position, metric in enumerate(handler_series(selected)):
+        # the *_over_time functions drop the metric name
+        labels = {name: value for name, value in metric.items() if name != "__name__"}
+        if copy_label is not None:
+            labels[copy_label] = metric["__name__"]
+        if any(series["metric"] == labels for series in result):
+            return response(
+                status_code=422,
+                content=b"vector cannot contain metrics with the same labelset",
+                request=request,
+            )
+        values = [ts % 7 for ts in timestamps if ts % 2 or position == 0]
+        result.append({"metric": labels, "value": [time, str(functions[function](values))]})
+    if outer:
+        total = functions[outer]([float(series["value"][1]) for series in result])
+        result = [{"metric": {}, "value": [time, str(total)]}]
+    payload = {"status": "success", "data": {"resultType": "vector", "result": result}}
+    return response(status_code=200, content=payload, request=request)
+
+
+class TestAdaptiveChunkRetries(unittest.TestCase):
+    """The chunk requests go through the retry adapter to a local server in this testcase."""
+
+    def setUp(self):  # noqa D102
+        self.chunk_sizes = []
+        chunk_sizes = self.chunk_sizes
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa D102
+                query = parse_qs(urlparse(self.path).query)
+                chunk_seconds = int(re.fullmatch(r"up\[(\d+)s\]", query["query"][0]).group(1))
+                chunk_sizes.append(chunk_seconds)
+                status, body = 503, b"query timed out"
+                if chunk_seconds <= 3600:
+                    status = 200
+                    body = json.dumps(
+                        {"status": "success", "data": {"resultType": "matrix", "result": []}}
+                    ).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # noqa D102
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pc = PrometheusConnect(
+            url="http://127.0.0.1:{}".format(self.server.server_port), disable_ssl=True
+        )
+
+    def tearDown(self):  # noqa D102
+        self.pc.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shrunk_on_first_response(self):  # noqa D102
+        end_time = datetime(2024, 1, 2)
+        chunk_size = AdaptiveChunkSize(initial_chunk_size=timedelta(hours=4))
+        self.pc.get_metric_range_data(
+            "up", start_time=end_time - timedelta(hours=2), end_time=end_time, chunk_size=chunk_size
+        )
+        # the 503 responses are not retried before the chunk is halved
+        self.assertEqual([7200, 3600, 3600], self.chunk_sizes)
+
+        # other requests are still retried
+        retry = self.pc._session.get_adapter(self.pc.url).max_retries
+        self.assertTrue(retry.is_retry("GET", 503))
+        with shrinking():
+            self.assertFalse(retry.is_retry("GET", 503))
+            self.assertTrue(retry.is_retry("GET", 502))
+        self.assertTrue(retry.is_retry("GET", 503))
+
+    def test_is_too_large_error(self):  # noqa D102
+        url = "http://127.0.0.1/api/v1/query"
+
+        def retry_error(status):
+            reason = ResponseError(ResponseError.SPECIFIC_ERROR.format(status_code=status))
+            return requests.exceptions.RetryError(MaxRetryError(None, url, reason))
+
+        self.assertTrue(is_too_large_error(retry_error(503)))
+        self.assertTrue(is_too_large_error(retry_error(504)))
+        self.assertFalse(is_too_large_error(retry_error(429)))
+        self.assertFalse(is_too_large_error(retry_error(500)))
+        self.assertTrue(is_too_large_error(PrometheusApiClientException("", status_code=422)))
+        self.assertFalse(is_too_large_error(PrometheusApiClientException("", status_code=400)))
+        self.assertTrue(is_too_large_error(requests.exceptions.ReadTimeout()))
+        timed_out = MaxRetryError(None, url, ReadTimeoutError(None, url, "Read timed out."))
+        self.assertTrue(is_too_large_error(requests.exceptions.ConnectionError(timed_out)))
+        refused = MaxRetryError(None, url, NewConnectionError(None, "Connection refused"))
+        self.assertFalse(is_too_large_error(requests.exceptions.ConnectionError(refused)))
+        self.assertFalse(is_too_large_error(requests.exceptions.ConnectionError()))
+
+
 class TestPrometheusConnectWithMockedNetwork(BaseMockedNetworkTestcase):
     """Network is blocked in this testcase, see base class."""
 
@@ -306,6 +507,7 @@ class TestPrometheusConnectWithMockedNetwork(BaseMockedNetworkTestcase):
             with self.assertRaises(PrometheusApiClientException) as exc:
                 self.pc.all_metrics()
         self.assertEqual("HTTP Status Code 403 (b'Unauthorized')", str(exc.exception))
+        self.assertEqual(403, exc.exception.status_code)
 
         with self.mock_response("Unauthorized", status_code=403):
             with self.assertRaises(PrometheusApiClientException) as exc:
@@ -395,6 +597,578 @@ class TestPrometheusConnectWithMockedNetwork(BaseMockedNetworkTestcase):
             request = handler.requests[0]
             self.assertEqual(request.path_url, "/api/v1/label/label_name/values")
 
+    def test_get_metric_range_data_with_max_workers(self):  # noqa D102
+        end_time = datetime(2024, 1, 2)
+        start_time = end_time - timedelta(hours=12)
+        with self.mock_response(None, func=chunk_handler) as handler:
+            data = self.pc.get_metric_range_data(
+                "up",
+                start_time=start_time,
+                end_time=end_time,
+                chunk_size=timedelta(hours=1),
+                max_workers=4,
+            )
+            self.assertEqual(handler.call_count, 12)
+
+        chunk_ends = [series["values"][0][0] for series in data]
+        self.assertEqual(
+            chunk_ends,
+            [round((start_time + timedelta(hours=i + 1)).timestamp()) for i in range(12)],
+        )
+        adapter = self.pc._session.get_adapter(self.pc.url)
+        self.assertEqual(adapter._pool_maxsize, max(4, requests.adapters.DEFAULT_POOLSIZE))
+
+        # a larger pool replaces the adapter, keeping its retries and closing the old one
+        retry = Retry(total=1)
+        pc = PrometheusConnect(url="http://doesnt_matter.xyz", retry=retry)
+        old_adapter = pc._session.get_adapter(pc.url)
+        with mock.patch.object(old_adapter, "close") as close:
+            pc._ensure_pool_size(32)
+        close.assert_called_once()
+        adapter = pc._session.get_adapter(pc.url)
+        self.assertEqual((32, retry), (adapter._pool_maxsize, adapter.max_retries))
+
+        # the adapters of a session given by the caller are left alone
+        session = requests.Session()
+        pc = PrometheusConnect(url="http://doesnt_matter.xyz", session=session)
+        adapter = session.get_adapter(pc.url)
+        pc._ensure_pool_size(32)
+        self.assertIs(adapter, session.get_adapter(pc.url))
+
+        with self.assertRaises(ValueError):
+            self.pc.get_metric_range_data(
+                "up", start_time=start_time, end_time=end_time, max_workers=0
+            )
+
+    def test_iter_metric_range_data(self):  # noqa D102
+        end_time = datetime(2024, 1, 2)
+        start_time = end_time - timedelta(hours=6)
+        for max_workers in (None, 2):
+            with self.mock_response(None, func=chunk_handler) as handler:
+                chunks = self.pc.iter_metric_range_data(
+                    "up",
+                    start_time=start_time,
+                    end_time=end_time,
+                    chunk_size=timedelta(hours=1),
+                    max_workers=max_workers,
+                )
+                first = next(chunks)
+                self.assertLessEqual(handler.call_count, 1 + (max_workers or 0))
+                chunks = [first] + list(chunks)
+                self.assertEqual(handler.call_count, 6)
+            self.assertEqual(
+                [chunk[0]["values"][0][0] for chunk in chunks],
+                [round((start_time + timedelta(hours=i + 1)).timestamp()) for i in range(6)],
+            )
+
+    def test_get_metric_range_data_with_adaptive_chunk_size(self):  # noqa D102
+        end_time = datetime(2024, 1, 2)
+        start_time = end_time - timedelta(hours=6)
+        stats = RequestStats()
+        pc = PrometheusConnect(url="http://doesnt_matter.xyz", hooks=[stats])
+        chunk_size = AdaptiveChunkSize(
+            target_samples=100,
+            initial_chunk_size=timedelta(hours=2),
+            max_chunk_size=timedelta(hours=2),
+        )
+        with self.mock_response(None, func=adaptive_chunk_handler):
+            data = pc.get_metric_range_data(
+                "up", start_time=start_time, end_time=end_time, chunk_size=chunk_size
+            )
+
+        # every sample of the range is downloaded once
+        timestamps = [sample[0] for series in data for sample in series["values"]]
+        self.assertEqual(
+            list(range(round(start_time.timestamp()) + 15, round(end_time.timestamp()) + 1, 15)),
+            timestamps,
+        )
+        # the 2h chunk is refused and halved, then chunks are sized to about 100 samples
+        chunk_seconds = [info.chunk_seconds for info in stats.records]
+        self.assertEqual([7200, 3600, 1500], chunk_seconds[:3])
+        self.assertEqual(422, stats.records[0].status_code)
+        self.assertIsNone(stats.records[1].error)
+        self.assertEqual(6 * 3600, sum(chunk_seconds[1:]))
+
+        # small and fast chunks grow, but not past the size of a refused one
+        with self.mock_response(None, func=adaptive_chunk_handler) as handler:
+            chunks = list(
+                pc.iter_metric_range_data(
+                    "up", start_time=start_time, end_time=end_time, chunk_size="auto"
+                )
+            )
+            self.assertEqual(7, handler.call_count)
+        self.assertEqual(6, len(chunks))
+
+        # a chunk that cannot be shrunk any further fails
+        chunk_size = AdaptiveChunkSize(
+            initial_chunk_size=timedelta(hours=4), min_chunk_size=timedelta(hours=2)
+        )
+        with self.mock_response(None, func=adaptive_chunk_handler):
+            with self.assertRaises(PrometheusApiClientException) as exc:
+                pc.get_metric_range_data(
+                    "up", start_time=start_time, end_time=end_time, chunk_size=chunk_size
+                )
+        self.assertEqual(422, exc.exception.status_code)
+        with self.assertRaises(ValueError):
+            pc.get_metric_range_data("up", chunk_size="auto", max_workers=2)
+        with self.assertRaises(ValueError):
+            AdaptiveChunkSize(min_chunk_size=timedelta(hours=2), max_chunk_size=timedelta(hours=1))
+
+    def test_custom_query_range_with_max_points(self):  # noqa D102
+        start_time = datetime(2024, 1, 1)
+        end_time = start_time + timedelta(minutes=10, seconds=7)
+        with self.mock_response(None, func=query_range_handler) as handler:
+            expected = self.pc.custom_query_range("up", start_time, end_time, "15s")
+            self.assertEqual(handler.call_count, 1)
+            self.assertEqual(len(expected[0]["values"]), 41)
+            split = self.pc.custom_query_range(
+                "up", start_time, end_time, "15s", max_points=6, max_workers=3
+            )
+            self.assertEqual(handler.call_count, 1 + 7)
+            unsplit = self.pc.custom_query_range("up", start_time, end_time, "15", max_points=41)
+            self.assertEqual(handler.call_count, 1 + 7 + 1)
+
+        self.assertEqual(split, expected)
+        self.assertEqual(unsplit, expected)
+
+        with self.mock_response(None, func=query_range_handler) as handler:
+            chunks = list(
+                self.pc.iter_query_range("up", start_time, end_time, "15s", max_points=20)
+            )
+            self.assertEqual(handler.call_count, 3)
+        self.assertEqual([len(chunk[0]["values"]) for chunk in chunks], [20, 20, 1])
+        self.assertEqual(
+            [value for chunk in chunks for value in chunk[0]["values"]], expected[0]["values"]
+        )
+        with self.assertRaises(ValueError):
+            self.pc.custom_query_range("up", start_time, end_time, "15x", max_points=6)
+
+    def test_results_cache(self):  # noqa D102
+        results_cache = RangeResultsCache(max_freshness=60)
+        pc = PrometheusConnect(url="http://doesnt_matter.xyz", results_cache=results_cache)
+        now = datetime(2024, 1, 1, 12, 0, 10)
+        window = timedelta(hours=1)
+
+        def requested_ranges(handler):
+            queries = [parse_qs(urlparse(request.url).query) for request in handler.requests]
+            return [(float(q["start"][0]), float(q["end"][0])) for q in queries]
+
+        with mock.patch("time.time", return_value=now.timestamp()):
+            with self.mock_response(None, func=query_range_handler) as handler:
+                first = pc.custom_query_range("up", now - window, now, "15")
+                self.assertEqual(handler.call_count, 1)
+                expected = self.pc.custom_query_range(
+                    "up", datetime(2024, 1, 1, 11), datetime(2024, 1, 1, 12), "15"
+                )
+        self.assertEqual(first, expected)
+        cutoff = datetime(2024, 1, 1, 11, 59).timestamp()
+        self.assertEqual(
+            results_cache.extents("up", 15.0, {}, pc.url, pc._identity()),
+            [(datetime(2024, 1, 1, 11).timestamp(), cutoff)],
+        )
+
+        now += timedelta(minutes=1)
+        with mock.patch("time.time", return_value=now.timestamp()):
+            with self.mock_response(None, func=query_range_handler) as handler:
+                second = pc.custom_query_range("up", now - window, now, "15")
+                self.assertEqual(requested_ranges(handler), [(cutoff + 15, cutoff + 120)])
+                expected = self.pc.custom_query_range(
+                    "up", datetime(2024, 1, 1, 11, 1), datetime(2024, 1, 1, 12, 1), "15"
+                )
+        self.assertEqual(second, expected)
+
+        # a range before the cached extent only fetches the missing head
+        with mock.patch("time.time", return_value=now.timestamp()):
+            with self.mock_response(None, func=query_range_handler) as handler:
+                pc.custom_query_range("up", now - 2 * window, now - window, "15")
+                head = (
+                    datetime(2024, 1, 1, 10, 1).timestamp(),
+                    datetime(2024, 1, 1, 11).timestamp() - 15,
+                )
+                self.assertEqual(requested_ranges(handler), [head])
+        self.assertEqual(len(results_cache.extents("up", 15.0, {}, pc.url, pc._identity())), 1)
+
+        # clients of another host or tenant do not get these extents
+        for kwargs in ({"url": "http://other.xyz"}, {"headers": {"X-Scope-OrgID": "b"}}):
+            other = PrometheusConnect(
+                **{"url": "http://doesnt_matter.xyz", **kwargs}, results_cache=results_cache
+            )
+            with mock.patch("time.time", return_value=now.timestamp()):
+                with self.mock_response(None, func=query_range_handler) as handler:
+                    other.custom_query_range("up", now - window, now, "15")
+                    self.assertEqual(
+                        requested_ranges(handler),
+                        [(datetime(2024, 1, 1, 11, 1).timestamp(), now.timestamp() - 10)],
+                    )
+
+    def test_results_cache_concurrent_gaps(self):  # noqa D102
+        results_cache = RangeResultsCache(max_freshness=0)
+
+        def fetch(start, end):
+            values = [[t, "1"] for t in range(start, end + 1, 15)]
+            return [{"metric": {"__name__": "up"}, "values": values}]
+
+        def fetch_while_another_call_runs(start, end):
+            # another call fills a different gap of the same query before this one completes
+            results_cache.query_range(fetch, "up", 3000, 3600, 15)
+            return fetch(start, end)
+
+        with mock.patch("time.time", return_value=10000):
+            result = results_cache.query_range(fetch_while_another_call_runs, "up", 0, 600, 15)
+        self.assertEqual(len(result[0]["values"]), 41)
+        self.assertEqual(results_cache.extents("up", 15), [(0, 600), (3000, 3600)])
+
+    def test_custom_query_many(self):  # noqa D102
+        def query_handler(url, request):
+            query = parse_qs(url.query)["query"][0]
+            if query == "broken(":
+                return response(status_code=400, content=b"parse error", request=request)
+            result = [{"metric": {"__name__": query}, "value": [1700000000, "1"]}]
+            payload = {"status": "success", "data": {"resultType": "vector", "result": result}}
+            return response(status_code=200, content=payload, request=request)
+
+        queries = ["q{}".format(i) for i in range(20)] + ["broken("]
+        with self.mock_response(None, func=query_handler) as handler:
+            results = self.pc.custom_query_many(queries, max_workers=4)
+            self.assertEqual(handler.call_count, 21)
+        self.assertEqual(list(results), queries)
+        for query in queries[:-1]:
+            self.assertEqual(results[query][0]["metric"]["__name__"], query)
+        self.assertIsInstance(results["broken("], PrometheusApiClientException)
+
+        with self.mock_response(None, func=query_range_handler):
+            results = self.pc.custom_query_many(
+                {"first": "up", "second": "up"},
+                start_time=datetime(2024, 1, 1),
+                end_time=datetime(2024, 1, 1, 0, 1),
+                step="15",
+            )
+        self.assertEqual(list(results), ["first", "second"])
+        self.assertEqual(len(results["first"][0]["values"]), 5)
+
+        with self.assertRaises(TypeError):
+            self.pc.custom_query_many("up")
+        with self.assertRaises(ValueError):
+            self.pc.custom_query_many(["up"], step="15")
+
+    def test_cache(self):  # noqa D102
+        pc = PrometheusConnect(url="http://doesnt_matter.xyz", cache=MemoryCache())
+        all_metrics_payload = {"status": "success", "data": ["up", "alerts"]}
+        query_payload = {"status": "success", "data": {"resultType": "vector", "result": []}}
+
+        with self.mock_response(all_metrics_payload) as handler:
+            self.assertEqual(pc.all_metrics(), ["up", "alerts"])
+            self.assertEqual(pc.all_metrics(), ["up", "alerts"])
+            self.assertEqual(handler.call_count, 1)
+            pc.get_label_values("job")
+            self.assertEqual(handler.call_count, 2)
+
+        with self.mock_response(query_payload) as handler:
+            pc.custom_query("up")
+            pc.custom_query("up")
+            pc.custom_query("up", params={"time": 1700000000})
+            self.assertEqual(handler.call_count, 2)
+
+        # errors are not cached
+        with self.assertRaises(PrometheusApiClientException):
+            pc.custom_query("down")
+        with self.mock_response(query_payload) as handler:
+            pc.custom_query("down")
+            self.assertEqual(handler.call_count, 1)
+
+        # clients of other tenants or credentials do not share cached responses
+        cache = MemoryCache()
+        clients = [
+            PrometheusConnect(url="http://doesnt_matter.xyz", cache=cache, **kwargs)
+            for kwargs in (
+                {"headers": {"X-Scope-OrgID": "a"}},
+                {"headers": {"X-Scope-OrgID": "b"}},
+                {"headers": {"x-scope-orgid": "a"}, "auth": ("user", "password")},
+                {"headers": {"x-scope-orgid": "a"}},
+            )
+        ]
+        with self.mock_response(query_payload) as handler:
+            for client in clients:
+                client.custom_query("up")
+            self.assertEqual(handler.call_count, 3)
+        self.assertNotIn("password", "".join(cache._entries))
+
+    def test_request_hooks(self):  # noqa D102
+        stats = RequestStats()
+        failing_hook = mock.Mock(side_effect=RuntimeError("hook failed"))
+        pc = PrometheusConnect(
+            url="http://doesnt_matter.xyz", cache=MemoryCache(), hooks=[stats, failing_hook]
+        )
+        end_time = datetime(2024, 1, 1)
+
+        with self.mock_response(None, func=query_range_handler):
+            pc.custom_query_range("up", end_time - timedelta(minutes=1), end_time, "15")
+            pc.custom_query_range("up", end_time - timedelta(minutes=1), end_time, "15")
+        with self.assertRaises(PrometheusApiClientException):
+            pc.get_targets()
+
+        first, cached, failed = stats.records
+        self.assertEqual(failing_hook.call_count, 3)
+        self.assertEqual(first.endpoint, "query_range")
+        self.assertEqual(first.query, "up")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.retries, 0)
+        self.assertFalse(first.cached)
+        self.assertEqual((first.series, first.samples), (2, 7))
+        self.assertGreater(first.response_bytes, 0)
+        for measurement in (first.ttfb, first.transfer_time, first.decode_time, first.duration):
+            self.assertGreaterEqual(measurement, 0)
+        self.assertTrue(cached.cached)
+        self.assertIsNone(cached.status_code)
+        self.assertEqual((cached.series, cached.samples), (2, 7))
+        self.assertEqual(failed.endpoint, "targets")
+        self.assertEqual(failed.status_code, 403)
+        self.assertIsInstance(failed.error, PrometheusApiClientException)
+
+        summary = stats.summary()
+        self.assertEqual(summary["query_range"]["count"], 2)
+        self.assertEqual(summary["query_range"]["cache_hits"], 1)
+        self.assertEqual(summary["query_range"]["samples"], 14)
+        self.assertEqual(summary["targets"]["errors"], 1)
+        self.assertEqual(len(stats.slowest(2)), 2)
+        stats.reset()
+        self.assertEqual(stats.records, [])
+
+    def test_get_metric_aggregation(self):  # noqa D102
+        end_time = datetime(2024, 1, 1)
+        with self.mock_response(None, func=query_range_handler):
+            result = self.pc.custom_query_range(
+                "up", end_time - timedelta(minutes=1), end_time, "15"
+            )
+            aggregated = self.pc.get_metric_aggregation(
+                "up",
+                ["sum", "max", "min", "average", "percentile_50", "deviation", "variance"],
+                start_time=end_time - timedelta(minutes=1),
+                end_time=end_time,
+                step="15",
+            )
+        values = [float(value[1]) for series in result for value in series["values"]]
+        self.assertAlmostEqual(aggregated["sum"], sum(values))
+        self.assertEqual(aggregated["max"], max(values))
+        self.assertEqual(aggregated["min"], min(values))
+        self.assertAlmostEqual(aggregated["average"], sum(values) / len(values))
+        self.assertEqual(aggregated["percentile_50.0"], numpy.percentile(values, 50))
+
+        # aggregating sub-ranges as they arrive gives the same values
+        with self.mock_response(None, func=query_range_handler) as handler:
+            chunked = self.pc.get_metric_aggregation(
+                "up",
+                ["sum", "max", "min", "count", "percentile_50", "variance"],
+                start_time=end_time - timedelta(minutes=1),
+                end_time=end_time,
+                step="15",
+                max_points=2,
+            )
+            self.assertEqual(len(handler.requests), 3)
+        self.assertEqual(chunked["count"], len(values))
+        self.assertAlmostEqual(chunked["sum"], aggregated["sum"])
+        self.assertAlmostEqual(chunked["variance"], aggregated["variance"])
+        self.assertEqual(chunked["percentile_50.0"], aggregated["percentile_50.0"])
+
+        vector = {
+            "status": "success",
+            "data": {"resultType": "vector", "result": [
+                {"metric": {}, "value": [1700000000, "2"]},
+                {"metric": {}, "value": [1700000000, "4"]},
+            ]},
+        }
+        with self.mock_response(vector):
+            self.assertEqual(self.pc.get_metric_aggregation("up", ["sum"]), {"sum": 6.0})
+
+    def test_get_metric_aggregation_percentiles(self):  # noqa D102
+        values = numpy.random.default_rng(0).lognormal(0, 2, 20000)
+        samples = [[1700000000 + i, str(float(value))] for i, value in enumerate(values)]
+        matrix = {
+            "status": "success",
+            "data": {"resultType": "matrix", "result": [{"metric": {}, "values": samples}]},
+        }
+        end_time = datetime(2024, 1, 1)
+        operations = ["percentile_50", "percentile_99"]
+        with self.mock_response(matrix):
+            exact = self.pc.get_metric_aggregation(
+                "up", operations, end_time - timedelta(hours=6), end_time, "1"
+            )
+            estimated = self.pc.get_metric_aggregation(
+                "up", operations, end_time - timedelta(hours=6), end_time, "1", exact_limit=1000
+            )
+        # exact by default, even past the 10000 values kept by a TDigest
+        self.assertEqual(exact["percentile_50.0"], numpy.percentile(values, 50))
+        self.assertEqual(exact["percentile_99.0"], numpy.percentile(values, 99))
+        # estimated within the documented rank error once exact_limit is set
+        ordered = numpy.sort(values)
+        for q in (0.5, 0.99):
+            rank = ordered.searchsorted(estimated["percentile_{}".format(q * 100)]) / len(values)
+            self.assertLess(abs(rank - q), 2 * math.pi * math.sqrt(q * (1 - q)) / 200)
+        self.assertNotEqual(estimated["percentile_50.0"], exact["percentile_50.0"])
+
+    def test_get_metric_aggregation_pushdown(self):  # noqa D102
+        end_time = datetime(2024, 1, 1)
+        operations = ["sum", "max", "min", "count", "average", "variance", "deviation"]
+        kwargs = dict(start_time=end_time - timedelta(minutes=2), end_time=end_time, step="15")
+        with self.mock_response(None, func=pushdown_handler) as handler:
+            expected = self.pc.get_metric_aggregation("up", operations, **kwargs)
+            self.assertEqual(len(handler.requests), 1)
+            aggregated = self.pc.get_metric_aggregation("up", operations, pushdown=True, **kwargs)
+            self.assertEqual(len(handler.requests), 8)
+            self.assertTrue(all("/api/v1/query?" in r.url for r in handler.requests[1:]))
+        self.assertEqual(expected.keys(), aggregated.keys())
+        for operation in operations:
+            self.assertAlmostEqual(expected[operation], aggregated[operation])
+
+        # percentiles fall back to the client
+        with self.mock_response(None, func=pushdown_handler) as handler:
+            aggregated = self.pc.get_metric_aggregation(
+                "up", ["sum", "percentile_50"], pushdown=True, **kwargs
+            )
+            self.assertEqual(len(handler.requests), 1)
+            self.assertIn("query_range", handler.requests[0].url)
+        self.assertAlmostEqual(expected["sum"], aggregated["sum"])
+
+        # the series of two metrics with the same other labels are kept apart
+        query = '{__name__=~"a|b"}'
+        with self.mock_response(None, func=pushdown_handler):
+            expected = self.pc.get_metric_aggregation(query, operations, **kwargs)
+            aggregated = self.pc.get_metric_aggregation(query, operations, pushdown=True, **kwargs)
+        for operation in operations:
+            self.assertAlmostEqual(expected[operation], aggregated[operation])
+
+    def test_get_metric_aggregation_by(self):  # noqa D102
+        end_time = datetime(2024, 1, 1)
+        kwargs = dict(start_time=end_time - timedelta(minutes=2), end_time=end_time, step="15")
+        with self.mock_response(None, func=query_range_handler) as handler:
+            result = self.pc.custom_query_range("up", **kwargs)
+            df = self.pc.get_metric_aggregation(
+                "up", ["count", "max", "percentile_95"], by=["instance"], max_points=3, **kwargs
+            )
+            self.assertEqual(len(handler.requests), 4)
+        self.assertEqual(["a", "b"], df.index.tolist())
+        for series in result:
+            values = [float(value[1]) for value in series["values"]]
+            row = df.loc[series["metric"]["instance"]]
+            self.assertEqual(len(values), row["count"])
+            self.assertEqual(max(values), row["max"])
+            self.assertAlmostEqual(numpy.percentile(values, 95), row["percentile_95.0"])
+
+        with self.mock_response(None, func=pushdown_handler) as handler:
+            df = self.pc.get_metric_aggregation("up", ["sum"], by="series", pushdown=True, **kwargs)
+            self.assertIn("query_range", handler.requests[0].url)
+        self.assertEqual(["__name__", "instance"], df.index.names)
+        self.assertEqual(2, len(df))
+
+    def test_tail(self):  # noqa D102
+        now = datetime(2024, 1, 1).timestamp()
+        tail = self.pc.tail(
+            "up",
+            step="15",
+            start_time=datetime.fromtimestamp(now - 60),
+            oldest_data_datetime=timedelta(seconds=60),
+        )
+        with self.mock_response(None, func=query_range_handler) as handler:
+            delta = tail.poll(now=now + 7)
+            self.assertEqual([5, 2], [len(metric.values) for metric in delta])
+            # no new evaluation timestamp is due, nothing is queried
+            self.assertEqual([], tail.poll(now=now + 14))
+            self.assertEqual(1, len(handler.requests))
+
+            delta = tail.poll(now=now + 45)
+            query = parse_qs(urlparse(handler.requests[1].url).query)
+            self.assertEqual(
+                [now + 15, now + 45], [float(query["start"][0]), float(query["end"][0])]
+            )
+            self.assertEqual([3, 2], [len(metric.values) for metric in delta])
+            self.assertEqual(
+                [pandas.Timestamp(now + 15, unit="s"), pandas.Timestamp(now + 45, unit="s")],
+                [delta[1].start_time, delta[1].end_time],
+            )
+
+        # the buffers keep the last 60 seconds of each series
+        a, b = tail.metrics
+        self.assertEqual({"instance": "a"}, a.label_config)
+        self.assertEqual([(now - 15 + 15 * i) % 7 for i in range(5)], a.values.tolist())
+        self.assertEqual(3, len(b.values))
+        tail.update([], now + 200)
+        self.assertEqual(0, len(tail))
+
+        deltas = []
+        with self.mock_response(None, func=query_range_handler) as handler:
+            self.assertEqual(1, len(list(self.pc.tail("up", step="15", max_polls=1))))
+            self.pc.tail("up", step="15", max_polls=1).run(deltas.append)
+            self.assertEqual(2, len(handler.requests))
+        self.assertEqual(1, len(deltas))
+        self.assertEqual({"instance": "a"}, deltas[0][0].label_config)
+
+    def test_tail_sub_second_step(self):  # noqa D102
+        now = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp() + 0.2
+        tail = self.pc.tail(
+            "up", step="0.5", start_time=datetime.fromtimestamp(now - 2, tz=timezone.utc)
+        )
+        with self.mock_response(None, func=query_range_handler) as handler, mock.patch(
+            "prometheus_api_client.prometheus_connect.MAX_POINTS_PER_SERIES", 2
+        ):
+            delta = tail.poll(now=now)
+            # the unix timestamps aligned to the step are queried, split by max_points
+            ranges = [parse_qs(urlparse(request.url).query) for request in handler.requests]
+            self.assertEqual(
+                [(now - 1.7, now - 1.2), (now - 0.7, now - 0.2)],
+                [(float(q["start"][0]), float(q["end"][0])) for q in ranges],
+            )
+        self.assertEqual(
+            [pandas.Timestamp(round(now - 1.7 + 0.5 * i, 3), unit="s") for i in range(4)],
+            list(delta[0].timestamps),
+        )
+        with self.assertRaises(TypeError):
+            self.pc.tail("up", step="15", oldest_data_datetime="1h")
+
+    def test_decoders(self):  # noqa D102
+        end_time = datetime(2024, 1, 1)
+        with self.mock_response(None, func=query_range_handler):
+            expected = self.pc.custom_query_range(
+                "up", end_time - timedelta(minutes=1), end_time, "15"
+            )
+            for decoder in ("json", "orjson", "msgspec", "auto", json.loads):
+                pc = PrometheusConnect(url="http://doesnt_matter.xyz", decoder=decoder)
+                result = pc.custom_query_range(
+                    "up", end_time - timedelta(minutes=1), end_time, "15"
+                )
+                self.assertEqual(result, expected)
+        with self.mock_response({"status": "success", "data": ["up"]}):
+            pc = PrometheusConnect(url="http://doesnt_matter.xyz", decoder="msgspec")
+            self.assertEqual(pc.all_metrics(), ["up"])
+        with self.assertRaises(ValueError):
+            PrometheusConnect(url="http://doesnt_matter.xyz", decoder="simplejson")
+
+    def test_msgspec_decoder_schema(self):  # noqa D102
+        import msgspec
+
+        from prometheus_api_client.decoders import get_data_decoder
+
+        decode = get_data_decoder("msgspec")
+        for data in (
+            {"resultType": "vector", "result": [{"metric": {"a": "b"}, "value": [1, "2"]}]},
+            {"resultType": "matrix", "result": [{"metric": {}, "values": [[1.5, "NaN"]]}]},
+            {"resultType": "matrix", "result": [{"metric": {}, "histograms": [[1, {}]]}]},
+            {"resultType": "scalar", "result": [1, "2"], "stats": {"timings": {}}},
+            {"resultType": "string", "result": [1, "up"]},
+        ):
+            content = json.dumps({"status": "success", "data": data}).encode()
+            self.assertEqual(decode(content, "/api/v1/query"), data)
+        # other endpoints are not validated
+        content = json.dumps({"status": "success", "data": {"resultType": 1}}).encode()
+        self.assertEqual(decode(content, "/api/v1/labels"), {"resultType": 1})
+        for data in (
+            {"resultType": "matrix", "result": [{"metric": {}, "values": [[1, "2", 3]]}]},
+            {"resultType": "vector", "result": [{"metric": {"a": 1}, "value": [1, "2"]}]},
+            {"resultType": "table", "result": []},
+        ):
+            content = json.dumps({"status": "success", "data": data}).encode()
+            with self.assertRaises(msgspec.ValidationError):
+                decode(content, "/api/v1/query_range")
+
     def test_close(self):  # noqa D102
         self.pc.close()  # must not raise
 
@@ -0,0 +1,333 @@
+"""Test module for the remote read client."""
+import math
+import struct
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import numpy
+from cramjam import snappy
+from httmock import response
+
+from prometheus_api_client import PrometheusConnect, PrometheusApiClientException
+from prometheus_api_client import remote_read
+from prometheus_api_client.remote_read import (
+    _crc32c_checksum,
+    _field_bytes,
+    _field_varint,
+    _parse,
+    _varint,
+)
+
+from .mocked_network import BaseMockedNetworkTestcase
+
+
+# A streamed response of two frames as written by Prometheus, produced with a Go port of its
+# XOR chunk appender (tsdb/chunkenc) and chunked writer (storage/remote), so that the
+# decoder is not only checked against the encoder of these tests
+PROMETHEUS_STREAMED_BODY = bytes.fromhex(
+    "e9016abbd7ef0a8c010a0e0a085f5f6e616d655f5f120275700a120a08696e7374616e6365120661"
+    "3a393130300a0b0a036a6f6212046e6f646512250880d095ffbc3110c8af98ffbc31180122130004"
+    "80a0abfef9623ff0000000000000987500123208e0a499ffbc3110a8849cffbc31180122200004c0"
+    "c9b2fef9623ff00000000000009875c457febff61fa0000000000000010a580a0e0a085f5f6e616d"
+    "655f5f120275700a120a08696e7374616e63651206623a393130300a0b0a036a6f6212046e6f6465"
+    "12250880d095ffbc311098c596ffbc3118012213000280a0abfef9623ff00000000000009875009f"
+    "015fa8f7fc0a9c010a220a085f5f6e616d655f5f12166e6f64655f6370755f7365636f6e64735f74"
+    "6f74616c0a080a03637075120130126c0880d095ffbc311080a39584bd311801225a000a80a0abfe"
+    "f96240290000000000009875dc1f80035ffc6b1bd8007ce946a139d4bdfe119999999e8ad0600204"
+    "aa1200cccccccfc0000000002616fa2800c000000000000fffffffffff67a4187249f04003000000"
+    "00000000"
+)
+
+
+class _BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.size = 0
+
+    def write(self, value, count):
+        self.value = (self.value << count) | (value & ((1 << count) - 1))
+        self.size += count
+
+    def to_bytes(self):
+        padding = -self.size % 8
+        return (self.value << padding).to_bytes((self.size + padding) // 8, "big")
+
+
+def encode_xor_chunk(timestamps, values):
+    """Encode samples like the Prometheus XOR chunk encoder."""
+    writer = _BitWriter()
+    raw_values = [struct.unpack(">Q", struct.pack(">d", v))[0] for v in values]
+    leading = trailing = 0xFF
+    delta = 0
+    for i, (t, v) in enumerate(zip(timestamps, raw_values)):
+        if i == 0:
+            for byte in _varint((t << 1) ^ (t >> 63)):
+                writer.write(byte, 8)
+            writer.write(v, 64)
+            continue
+        if i == 1:
+            delta = t - timestamps[0]
+            for byte in _varint(delta):
+                writer.write(byte, 8)
+        else:
+            new_delta = t - timestamps[i - 1]
+            dod = new_delta - delta
+            delta = new_delta
+            if dod == 0:
+                writer.write(0, 1)
+            elif -(1 << 13) + 1 <= dod <= 1 << 13:
+                writer.write(0b10, 2)
+                writer.write(dod, 14)
+            elif -(1 << 16) + 1 <= dod <= 1 << 16:
+                writer.write(0b110, 3)
+                writer.write(dod, 17)
+            elif -(1 << 19) + 1 <= dod <= 1 << 19:
+                writer.write(0b1110, 4)
+                writer.write(dod, 20)
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod, 64)
+        xor = v ^ raw_values[i - 1]
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        writer.write(1, 1)
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if leading != 0xFF and new_leading >= leading and new_trailing >= trailing:
+            writer.write(0, 1)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            writer.write(1, 1)
+            writer.write(leading, 5)
+            significant = 64 - leading - trailing
+            writer.write(significant % 64, 6)
+            writer.write(xor >> trailing, significant)
+    return struct.pack(">H", len(timestamps)) + writer.to_bytes()
+
+
+def _labels(metric):
+    return b"".join(
+        _field_bytes(1, _field_bytes(1, k.encode()) + _field_bytes(2, v.encode()))
+        for k, v in metric.items()
+    )
+
+
+def streamed_body(series_list):
+    """Build a streamed response with one frame per ``(metric, [(timestamps, values)])``."""
+    body = b""
+    for metric, chunks in series_list:
+        chunked_series = _labels(metric)
+        for timestamps, values in chunks:
+            chunk = (
+                _field_varint(1, timestamps[0])
+                + _field_varint(2, timestamps[-1])
+                + _field_varint(3, 1)
+                + _field_bytes(4, encode_xor_chunk(timestamps, values))
+            )
+            chunked_series += _field_bytes(2, chunk)
+        frame = _field_bytes(1, chunked_series)
+        body += _varint(len(frame)) + struct.pack(">I", _crc32c_checksum(frame)) + frame
+    return body
+
+
+def samples_body(series_list):
+    """Build a snappy compressed ReadResponse from ``(metric, timestamps, values)``."""
+    query_result = b""
+    for metric, timestamps, values in series_list:
+        time_series = _labels(metric)
+        for t, v in zip(timestamps, values):
+            time_series += _field_bytes(2, b"\x09" + struct.pack("<d", v) + _field_varint(2, t))
+        query_result += _field_bytes(1, time_series)
+    return bytes(snappy.compress_raw(_field_bytes(1, query_result)))
+
+
+class TestRemoteReadDecoding(unittest.TestCase):  # noqa D101
+    def test_xor_chunk_round_trip(self):  # noqa D102
+        timestamps = [1700000000000 + 15000 * i for i in range(120)]
+        # irregular scrapes exercise every delta-of-delta bucket
+        timestamps[10] += 3
+        timestamps[20] += 70000
+        timestamps[30] += 600000
+        timestamps[40] += 10 ** 9
+        timestamps.sort()
+        values = [float(i % 7) * 1.5 for i in range(119)] + [float("inf")]
+        values[50] = -3.25e-9
+        decoded_timestamps, decoded_values = remote_read.decode_xor_chunk(
+            encode_xor_chunk(timestamps, values)
+        )
+        self.assertEqual(decoded_timestamps.tolist(), timestamps)
+        self.assertEqual(decoded_values.tolist(), values)
+
+    def test_empty_chunk(self):  # noqa D102
+        timestamps, values = remote_read.decode_xor_chunk(b"\x00\x00")
+        self.assertEqual(len(timestamps), 0)
+        self.assertEqual(len(values), 0)
+
+    def test_encode_read_request(self):  # noqa D102
+        body = remote_read.encode_read_request([("__name__", "=~", "up|node_load1")], 1000, 2000)
+        fields = list(_parse(bytes(snappy.decompress_raw(body))))
+        self.assertEqual(fields[1], (2, 2, b"\x01\x00"))
+        query = list(_parse(fields[0][2]))
+        self.assertEqual(query[:2], [(1, 0, 1000), (2, 0, 2000)])
+        self.assertEqual(
+            list(_parse(query[2][2])), [(1, 0, 2), (2, 2, b"__name__"), (3, 2, b"up|node_load1")]
+        )
+        with self.assertRaises(ValueError):
+            remote_read.encode_read_request([("job", "==", "node")], 1000, 2000)
+
+    def test_streamed_frames_split_across_reads(self):  # noqa D102
+        body = streamed_body(
+            [
+                ({"__name__": "up", "job": "a"}, [([1000, 2000, 3000], [1.0, 1.0, 0.0])]),
+                ({"__name__": "up", "job": "a"}, [([4000, 5000], [1.0, 1.0])]),
+                ({"__name__": "up", "job": "b"}, [([1000, 2000], [2.0, 3.0])]),
+            ]
+        )
+        # feed the body a few bytes at a time, frames are split across reads
+        reads = [body[i:i + 7] for i in range(0, len(body), 7)]
+        series = remote_read.decode_streamed_response(reads, start_ms=2000, end_ms=4000)
+        self.assertEqual([s["metric"]["job"] for s in series], ["a", "b"])
+        self.assertEqual(series[0]["timestamps"].tolist(), [2.0, 3.0, 4.0])
+        self.assertEqual(series[0]["values"].tolist(), [1.0, 0.0, 1.0])
+        self.assertEqual(series[1]["timestamps"].tolist(), [2.0])
+
+    def test_streamed_checksum_mismatch(self):  # noqa D102
+        body = bytearray(streamed_body([({"__name__": "up"}, [([1000], [1.0])])]))
+        body[-1] ^= 0xFF
+        with self.assertRaises(PrometheusApiClientException):
+            remote_read.decode_streamed_response([bytes(body)])
+        with self.assertRaises(PrometheusApiClientException):
+            remote_read.decode_streamed_response([bytes(body[:-1])])
+
+    def test_prometheus_streamed_body(self):  # noqa D102
+        start = 1700000000000
+        stale_nan = struct.unpack(">d", bytes.fromhex("7ff0000000000002"))[0]
+        for crc32c in (remote_read._crc32c, None):
+            with mock.patch.object(remote_read, "_crc32c", crc32c):
+                series = remote_read.decode_streamed_response(
+                    [PROMETHEUS_STREAMED_BODY], verify_checksums=True
+                )
+            self.assertEqual(
+                [s["metric"] for s in series],
+                [
+                    {"__name__": "up", "instance": "a:9100", "job": "node"},
+                    {"__name__": "up", "instance": "b:9100", "job": "node"},
+                    {"__name__": "node_cpu_seconds_total", "cpu": "0"},
+                ],
+            )
+            up = series[0]
+            self.assertEqual(
+                up["timestamps"].tolist(), [(start + 15000 * i) / 1000 for i in range(8)]
+            )
+            self.assertEqual(up["values"][:7].tolist(), [1.0, 1.0, 1.0, 1.0, 1.0, 0.0, 1.0])
+            self.assertTrue(math.isnan(up["values"][7]))
+            self.assertEqual(up["values"][7:].tobytes(), struct.pack("<d", stale_nan))
+            self.assertEqual(series[1]["values"].tolist(), [1.0, 1.0])
+            # every delta of delta bucket, and a new and a reused XOR window
+            counter = series[2]
+            offsets = [0, 15000, 30003, 44998, 60000, 135000, 150000, 10150000, 10165000, 10480000]
+            self.assertEqual(counter["timestamps"].tolist(), [(start + o) / 1000 for o in offsets])
+            self.assertEqual(
+                counter["values"].tolist(),
+                [12.5, 13.25, 13.25, 20.0, 1e6, 1e6 + 0.1, -2.5, 3.0, 3.0, 4.0],
+            )
+
+        body = bytearray(PROMETHEUS_STREAMED_BODY)
+        body[40] ^= 0x01
+        with self.assertRaises(PrometheusApiClientException):
+            remote_read.decode_streamed_response([bytes(body)], verify_checksums=True)
+        # a corrupt label goes unnoticed without the checksums
+        series = remote_read.decode_streamed_response([bytes(body)], verify_checksums=False)
+        self.assertEqual(len(series), 3)
+
+    def test_truncated_chunk(self):  # noqa D102
+        chunk = encode_xor_chunk([1000, 2000, 3000], [1.0, 2.0, 5.0])
+        for size in (3, len(chunk) - 1):
+            with self.assertRaises(PrometheusApiClientException):
+                remote_read.decode_xor_chunk(chunk[:size])
+
+    def test_crc32c(self):  # noqa D102
+        self.assertEqual(_crc32c_checksum(b"123456789"), 0xE3069283)
+
+
+class TestRemoteRead(BaseMockedNetworkTestcase):
+    """Network is blocked in this testcase, see base class."""
+
+    def setUp(self):  # noqa D102
+        self.pc = PrometheusConnect(url="http://doesnt_matter.xyz", disable_ssl=True)
+        self.start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.end_time = datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)
+        start_ms = int(self.start_time.timestamp() * 1000)
+        self.timestamps = [start_ms + 15000 * i for i in range(6)]
+
+    def test_streamed(self):  # noqa D102
+        body = streamed_body(
+            [({"__name__": "up", "job": "node"}, [(self.timestamps, [1.0] * 6)])]
+        )
+
+        def handler(url, request):
+            return response(
+                200, body, {"Content-Type": remote_read.STREAMED_CONTENT_TYPE}, request=request
+            )
+
+        with self.mock_response(body, func=handler) as handler:
+            series = self.pc.remote_read(
+                "up",
+                label_config={"job": "node"},
+                start_time=self.start_time,
+                end_time=self.end_time,
+            )
+            request = handler.requests[0]
+
+        self.assertEqual(request.url, "http://doesnt_matter.xyz/api/v1/read")
+        self.assertEqual(request.method, "POST")
+        self.assertEqual(request.headers["Content-Encoding"], "snappy")
+        query = list(_parse(list(_parse(bytes(snappy.decompress_raw(request.body))))[0][2]))
+        self.assertEqual(query[0][2], self.timestamps[0])
+        self.assertEqual(query[1][2], int(self.end_time.timestamp() * 1000))
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]["metric"], {"__name__": "up", "job": "node"})
+        # the sample at 75s is outside the requested range
+        numpy.testing.assert_array_equal(
+            series[0]["timestamps"], numpy.array(self.timestamps[:5]) / 1000.0
+        )
+        numpy.testing.assert_array_equal(series[0]["values"], [1.0] * 5)
+
+    def test_samples_as_dataframe(self):  # noqa D102
+        body = samples_body(
+            [
+                ({"__name__": "up", "job": "a"}, self.timestamps[:2], [1.0, 0.0]),
+                ({"__name__": "up", "job": "b", "env": "prod"}, self.timestamps[:1], [1.0]),
+            ]
+        )
+
+        def handler(url, request):
+            return response(200, body, {"Content-Type": "application/x-protobuf"}, request=request)
+
+        with self.mock_response(body, func=handler):
+            df = self.pc.remote_read(
+                matchers=[("__name__", "=", "up")],
+                start_time=self.start_time,
+                end_time=self.end_time,
+                streamed=False,
+                as_dataframe=True,
+            )
+        self.assertEqual(list(df.columns), ["__name__", "job", "env", "value"])
+        self.assertEqual(df.index.name, "timestamp")
+        self.assertEqual(df["job"].tolist(), ["a", "a", "b"])
+        self.assertEqual(df["value"].tolist(), [1.0, 0.0, 1.0])
+        self.assertEqual(df.index[1].timestamp(), self.timestamps[1] / 1000.0)
+
+    def test_broken_response(self):  # noqa D102
+        with self.assertRaises(PrometheusApiClientException) as exc:
+            self.pc.remote_read("up")
+        self.assertEqual("HTTP Status Code 403 (b'BOOM!')", str(exc.exception))
+        with self.assertRaises(ValueError):
+            self.pc.remote_read()
+
+
+if __name__ == "__main__":
+    unittest.main()
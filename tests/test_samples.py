@@ -0,0 +1,37 @@
+"""Test module for the vectorized sample decoding."""
+import unittest
+
+import numpy
+
+from prometheus_api_client.exceptions import MetricValueConversionError
+from prometheus_api_client.samples import decode_pairs, decode_samples
+
+
+class TestDecodeSamples(unittest.TestCase):  # noqa D101
+    def test_decode_samples(self):  # noqa D102
+        data = [
+            {"metric": {"a": "1"}, "values": [[1, "1.5"], [2, "NaN"], [3, "+Inf"]]},
+            {"metric": {"a": "2"}, "values": []},
+            {"metric": {"a": "3"}, "value": [4.5, 2]},
+        ]
+        timestamps, values, offsets = decode_samples(data)
+        self.assertEqual(timestamps.dtype, numpy.float64)
+        self.assertEqual(values.dtype, numpy.float64)
+        self.assertEqual(timestamps.tolist(), [1.0, 2.0, 3.0, 4.5])
+        numpy.testing.assert_array_equal(values, [1.5, numpy.nan, numpy.inf, 2.0])
+        self.assertEqual(offsets.tolist(), [0, 3, 3, 4])
+
+    def test_decode_empty(self):  # noqa D102
+        timestamps, values, offsets = decode_samples([])
+        self.assertEqual((len(timestamps), len(values), offsets.tolist()), (0, 0, [0]))
+
+    def test_invalid_values(self):  # noqa D102
+        for value in ("26.8206896551724326.82068965517243", None):
+            with self.assertRaises(MetricValueConversionError):
+                decode_samples([{"metric": {}, "values": [[1, "1"], [2, value]]}])
+            with self.assertRaises(MetricValueConversionError):
+                decode_pairs([[1, value]])
+
+
+if __name__ == "__main__":
+    unittest.main()